@@ -0,0 +1,119 @@
+"""Горячие запросы до, во время и после архивации большой истории
+
+    python benchmarks/archiving.py --rows 1000000
+
+История целиком лежит в appointments, как до первой ночи retention_job.
+Меряются запросы, которые идут на каждое нажатие или при старте, потом
+retention_job переносит все старше ARCHIVE_AFTER_DAYS в архив (а бронирования
+в это время идут своим чередом), и те же запросы меряются снова.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from harness import percentile, seed_history  # noqa: E402
+
+
+async def hold_and_release(user_id):
+    """Бронь свободного времени и ее снятие - путь select_time"""
+    date = bot.upcoming_dates()[1]
+    time_str = bot.availability.times(date, "basic")[0][0]
+    assert await bot.run_db_write(bot.hold_slot, date, time_str, "basic", user_id)
+    await bot.run_db_write(bot.release_hold, date, time_str, user_id)
+
+
+HOT_PATH = {
+    "мои записи": lambda n: bot.run_db_read(bot.get_user_appointments, n % 50000),
+    "бронь+снятие": lambda n: hold_and_release(-1 - n),
+    "страница админа": lambda n: bot.run_db_read(bot.get_bookings_page, {}),
+    "напоминания": lambda n: bot.run_db_read(bot.get_pending_reminders),
+}
+STARTUP = {
+    "load_availability": lambda: bot.run_db_write(bot.load_availability),
+    "load_booking_stats": lambda: bot.run_db_write(bot.load_booking_stats),
+}
+
+
+async def timed(call, *args):
+    started = time.perf_counter()
+    await call(*args)
+    return (time.perf_counter() - started) * 1000
+
+
+async def measure(repeats):
+    """{запрос: (p50, p99) в мс}"""
+    results = {}
+    for name, call in HOT_PATH.items():
+        samples = [await timed(call, n) for n in range(repeats)]
+        results[name] = percentile(samples, 0.5), percentile(samples, 0.99)
+    for name, call in STARTUP.items():
+        samples = [await timed(call) for _ in range(3)]
+        results[name] = percentile(samples, 0.5), max(samples)
+    return results
+
+
+def table_sizes():
+    conn = bot.get_read_connection()
+    return tuple(
+        conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        for table in ("appointments", "appointments_archive")
+    )
+
+
+async def during_retention():
+    """retention_job и бронирования параллельно: (секунд на архивацию, задержки броней в мс)"""
+    samples = []
+    job = asyncio.create_task(bot.retention_job(None))
+    started = time.perf_counter()
+    n = 0
+    while not job.done():
+        samples.append(await timed(hold_and_release, -10**6 - n))
+        n += 1
+    await job
+    return time.perf_counter() - started, samples
+
+
+async def main(args):
+    await bot.run_db_write(bot.init_database)
+    started = time.perf_counter()
+    await bot.run_db_write(seed_history, args.rows)
+    await bot.run_db_write(bot.load_booking_stats)
+    print(f"заполнено {args.rows} записей за {time.perf_counter() - started:.1f} с")
+
+    before = await measure(args.repeats)
+    sizes_before, file_before = table_sizes(), os.path.getsize(bot.DB_NAME)
+
+    elapsed, holds = await during_retention()
+    after = await measure(args.repeats)
+    sizes_after, file_after = table_sizes(), os.path.getsize(bot.DB_NAME)
+
+    print(
+        f"\nretention_job: {elapsed:.1f} с, в appointments {sizes_before[0]} -> {sizes_after[0]}, "
+        f"в архиве {sizes_after[1]}, файл {file_before / 2**20:.0f} -> {file_after / 2**20:.0f} МБ"
+    )
+    print(
+        f"бронь+снятие во время архивации ({len(holds)}): p50 {percentile(holds, 0.5):.1f} мс, "
+        f"p99 {percentile(holds, 0.99):.1f} мс, max {max(holds):.1f} мс"
+    )
+    print(f"\n{'запрос':<20}{'до p50/p99, мс':>20}{'после p50/p99, мс':>22}")
+    for name in before:
+        print(f"{name:<20}{'%.2f / %.2f' % before[name]:>20}{'%.2f / %.2f' % after[name]:>22}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000, help="записей в истории")
+    parser.add_argument("--repeats", type=int, default=300, help="замеров каждого запроса")
+    args = parser.parse_args()
+
+    bot.DB_NAME = os.path.join(tempfile.mkdtemp(), "roblox_wash.db")
+    try:
+        asyncio.run(main(args))
+    finally:
+        bot.close_connections()
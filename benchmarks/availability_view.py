@@ -0,0 +1,119 @@
+"""Свободное время на 30 дней вперед у десятков специалистов
+
+    python benchmarks/availability_view.py --resources 50 --days 30 --busy 0.6
+
+Горизонт записи поднимается до --days, к четырем специалистам из миграции
+добавляются свои со случайными часами и услугами, каждый день каждого занят
+бронями примерно на долю --busy. Меряются загрузка движка при старте,
+запросы к нему (даты, услуги на дату, время на дату и услугу) и целые
+обработчики экранов выбора: все это идет в цикле событий на каждое нажатие.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from harness import percentile, press  # noqa: E402
+
+
+def seed(resources, busy):
+    """Специалисты и брони на весь горизонт: (специалистов, броней)"""
+    services = list(bot.SERVICES)
+    conn = bot.get_write_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO resources (id, name, work_start, work_end, services) VALUES (?, ?, ?, ?, ?)",
+            [
+                (resource_id, f"Специалист {resource_id}", start, start + random.randint(6, 12),
+                 ",".join(random.sample(services, random.randint(1, 3))))
+                for resource_id in range(5, 5 + resources)
+                for start in [random.randint(8, 12)]
+            ]
+        )
+        rows = []
+        for resource_id, work_start, work_end, codes in conn.execute(
+            "SELECT id, work_start, work_end, services FROM resources"
+        ).fetchall():
+            codes = codes.split(",")
+            for date in bot.upcoming_dates():
+                # Подряд с просветами, пока не занята доля busy рабочего дня
+                minute, end = work_start * 60, work_end * 60
+                while minute < end:
+                    service = random.choice(codes)
+                    duration = bot.SERVICES[service].minutes
+                    if minute + duration > end:
+                        break
+                    if random.random() < busy:
+                        rows.append((date, bot.format_minutes(minute), service, resource_id, duration))
+                    minute += duration + random.choice((0, 0, bot.SLOT_STEP_MINUTES))
+        conn.executemany('''
+            INSERT INTO appointments (date, time, service_type, user_id, user_name, status, resource_id, duration)
+            VALUES (?, ?, ?, 1, 'user', 'booked', ?, ?)
+        ''', rows)
+    return resources + 4, len(rows)
+
+
+def timings(call, arguments):
+    samples = []
+    for args in arguments:
+        started = time.perf_counter()
+        call(*args)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def report(name, samples):
+    print(f"{name:<26}{len(samples):>8}{percentile(samples, 0.5):>10.2f}{percentile(samples, 0.99):>10.2f}{max(samples):>10.2f}")
+
+
+async def main(args):
+    await bot.run_db_write(bot.init_database)
+    total, bookings = await bot.run_db_write(seed, args.resources, args.busy)
+    started = time.perf_counter()
+    await bot.run_db_write(bot.load_availability)
+    print(
+        f"специалистов {total}, дней {bot.DAYS_AHEAD}, броней {bookings}, "
+        f"load_availability {(time.perf_counter() - started) * 1000:.0f} мс\n"
+    )
+
+    dates = bot.upcoming_dates()
+    pairs = [(date, service) for date in dates for service in bot.SERVICES]
+    print(f"{'запрос':<26}{'вызовов':>8}{'p50, мс':>10}{'p99, мс':>10}{'max, мс':>10}")
+    report("dates()", timings(bot.availability.dates, [()] * args.repeats))
+    report("services(дата)", timings(bot.availability.services, [(date,) for date in dates] * args.repeats))
+    report("times(дата, услуга)", timings(bot.availability.times, pairs * args.repeats))
+
+    screens = {
+        "view_slots": (bot.view_slots, ["view_slots"]),
+        "select_date": (bot.select_date, [f"date_{date}" for date in dates]),
+        "select_service": (bot.select_service, [f"svc_{date}_{service}" for date, service in pairs]),
+    }
+    for name, (handler, buttons) in screens.items():
+        # Разные пользователи: отпечаток экрана не дает пропустить отрисовку
+        samples = [
+            await press(handler, data, user_id=10**6 + n) * 1000
+            for n, data in enumerate(buttons * args.repeats)
+        ]
+        report(f"обработчик {name}", samples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--resources", type=int, default=50, help="специалистов сверх четырех из миграции")
+    parser.add_argument("--days", type=int, default=30, help="горизонт записи")
+    parser.add_argument("--busy", type=float, default=0.6, help="доля занятого времени")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    bot.DAYS_AHEAD = args.days
+    bot.DB_NAME = os.path.join(tempfile.mkdtemp(), "roblox_wash.db")
+    try:
+        asyncio.run(main(args))
+    finally:
+        bot.close_connections()
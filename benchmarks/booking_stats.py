@@ -0,0 +1,67 @@
+"""Статистика админки на миллионе записей: загрузка счетчиков и нажатие «Статистика»
+
+    python benchmarks/booking_stats.py --rows 1000000
+    python benchmarks/booking_stats.py --rows 100000 --archived 0
+
+load_booking_stats - один агрегатный запрос при старте: покрывающий индекс по
+appointments плюс готовые итоги daily_summary за архив. Дальше admin_stats
+читает счетчики из памяти и от размера истории зависеть не должен - сравните
+запуски с разным --rows.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from harness import percentile, press, seed_history  # noqa: E402
+
+
+def time_load(repeats):
+    """Секунды на каждый load_booking_stats и сколько строк вернул агрегат"""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        groups = bot.load_booking_stats()
+        timings.append(time.perf_counter() - started)
+    return timings, groups
+
+
+async def main(args):
+    await bot.run_db_write(bot.init_database)
+    started = time.perf_counter()
+    await bot.run_db_write(seed_history, args.rows, int(args.rows * args.archived))
+    print(f"заполнено {args.rows} записей ({args.archived:.0%} в архиве) за {time.perf_counter() - started:.1f} с\n")
+
+    timings, groups = await bot.run_db_write(time_load, args.repeats)
+    print(
+        f"load_booking_stats: {groups} групп (дата, услуга), "
+        f"медиана {statistics.median(timings) * 1000:.0f} мс, max {max(timings) * 1000:.0f} мс"
+    )
+
+    clicks = [await press(bot.admin_stats, "admin_stats") for _ in range(args.clicks)]
+    print(
+        f"\nadmin_stats, {args.clicks} нажатий: p50 {percentile(clicks, 0.5) * 1000:.2f} мс, "
+        f"p99 {percentile(clicks, 0.99) * 1000:.2f} мс, max {max(clicks) * 1000:.2f} мс"
+    )
+    print(f"всего по счетчикам: {bot.booking_stats.total}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000, help="записей в истории")
+    parser.add_argument("--archived", type=float, default=0.5, help="доля истории в архиве")
+    parser.add_argument("--repeats", type=int, default=5, help="загрузок счетчиков")
+    parser.add_argument("--clicks", type=int, default=1000, help="нажатий «Статистика»")
+    args = parser.parse_args()
+
+    bot.DB_NAME = os.path.join(tempfile.mkdtemp(), "roblox_wash.db")
+    try:
+        asyncio.run(main(args))
+    finally:
+        bot.close_connections()
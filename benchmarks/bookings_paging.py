@@ -0,0 +1,110 @@
+"""Листание записей админом на миллионе записей: страница в начале и в конце стоит одинаково
+
+    python benchmarks/bookings_paging.py --rows 1000000
+
+get_bookings_page идет от ключа (date, time, id) соседней страницы, поэтому
+берет по индексу LIMIT строк, где бы страница ни была. Для сравнения та же
+страница через OFFSET: SQLite пропускает все строки до нее, и время растет
+вместе с номером страницы.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from harness import percentile, seed_history  # noqa: E402
+
+FILTERS = {
+    "все": {},
+    "прошедшие": {"dates": "past"},
+    "услуга pro": {"service": "pro"},
+    "пользователь": {"user_id": 123},
+}
+POSITIONS = (0, 0.01, 0.1, 0.5, 1)
+
+
+def where(bookings_filter):
+    """Те же условия, что в get_bookings_page, без ключа страницы"""
+    conditions, params = ["status = 'booked'"], []
+    date_from, date_to = bot.bookings_date_range(bookings_filter.get('dates', 'all'))
+    for condition, value in (
+        ("date >= ?", date_from), ("date <= ?", date_to),
+        ("service_type = ?", bookings_filter.get('service')), ("user_id = ?", bookings_filter.get('user_id')),
+    ):
+        if value:
+            conditions.append(condition)
+            params.append(value)
+    return " AND ".join(conditions), params
+
+
+def by_offset(bookings_filter, offset, limit=bot.BOOKINGS_PAGE_SIZE):
+    conditions, params = where(bookings_filter)
+    return bot.get_read_connection().execute(f'''
+        SELECT {bot.APPOINTMENT_COLUMNS} FROM appointments
+        WHERE {conditions}
+        ORDER BY date, time, id
+        LIMIT ? OFFSET ?
+    ''', (*params, limit + 1, offset)).fetchall()
+
+
+def pages(bookings_filter):
+    """[(позиция, смещение, ключ записи перед страницей)] - ключи считаются заранее, без замера"""
+    conditions, params = where(bookings_filter)
+    conn = bot.get_read_connection()
+    total = conn.execute(f"SELECT COUNT(*) FROM appointments WHERE {conditions}", params).fetchone()[0]
+    result = []
+    for position in POSITIONS:
+        offset = min(int(total * position), max(total - bot.BOOKINGS_PAGE_SIZE, 0))
+        key = conn.execute(f'''
+            SELECT date, time, id FROM appointments WHERE {conditions}
+            ORDER BY date, time, id LIMIT 1 OFFSET ?
+        ''', (*params, offset - 1)).fetchone() if offset else None
+        result.append((position, offset, key))
+    return total, result
+
+
+def measure(func, repeats, *args, **kwargs):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func(*args, **kwargs)
+        timings.append(time.perf_counter() - started)
+    return percentile(timings, 0.5) * 1000
+
+
+def run(args):
+    print(f"{'фильтр':<14}{'записей':>9}{'позиция':>9}{'вперед, мс':>12}{'назад, мс':>11}{'OFFSET, мс':>12}")
+    for title, bookings_filter in FILTERS.items():
+        total, positions = pages(bookings_filter)
+        for position, offset, key in positions:
+            forward = measure(bot.get_bookings_page, args.repeats, bookings_filter, key)
+            backward = measure(bot.get_bookings_page, args.repeats, bookings_filter, key, backward=True) if key else 0
+            offset_ms = measure(by_offset, args.offset_repeats, bookings_filter, offset)
+            print(f"{title:<14}{total:>9}{position:>9.0%}{forward:>12.2f}{backward:>11.2f}{offset_ms:>12.2f}")
+
+
+async def main(args):
+    await bot.run_db_write(bot.init_database)
+    started = time.perf_counter()
+    await bot.run_db_write(seed_history, args.rows)
+    print(f"заполнено {args.rows} записей за {time.perf_counter() - started:.1f} с\n")
+    await bot.run_db_read(run, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000, help="записей в appointments")
+    parser.add_argument("--repeats", type=int, default=200, help="замеров страницы по ключу")
+    parser.add_argument("--offset-repeats", type=int, default=5, help="замеров страницы через OFFSET")
+    args = parser.parse_args()
+
+    bot.DB_NAME = os.path.join(tempfile.mkdtemp(), "roblox_wash.db")
+    try:
+        asyncio.run(main(args))
+    finally:
+        bot.close_connections()
@@ -0,0 +1,145 @@
+"""Холодный старт: от запуска процесса до ответа на первое обновление
+
+    python benchmarks/cold_start.py --runs 10 --rows 100000
+
+Каждый прогон - новый процесс Python, в котором бот поднимается так же, как
+в run_bot, только Bot API - локальный FakeBotAPI, а первое обновление (/start)
+кладется в update_queue, как это делает webhook. Меряются этапы: запуск
+интерпретатора, import bot, build_application, init_database (база одна на
+все прогоны, с --rows записей истории, как при перезапуске), initialize +
+post_init + start и обработка первого обновления вместе с ответом в Bot API.
+startup_timings в логе бота считает от строки STARTED_AT, то есть уже после
+импорта telegram и aiohttp; здесь импорт меряется целиком.
+"""
+import time
+
+SPAWNED_AT = time.time()
+CHILD_STARTED = time.perf_counter()
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+import tempfile  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "tests"), os.path.dirname(os.path.abspath(__file__))]
+
+PHASES = (
+    ("interpreter", "запуск интерпретатора"),
+    ("import", "import bot"),
+    ("build", "build_application"),
+    ("database", "init_database"),
+    ("ready", "initialize + post_init + start"),
+    ("first_update", "первое обновление"),
+)
+
+FIRST_UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1, "date": 0, "text": "/start",
+        "chat": {"id": 10**6, "type": "private"},
+        "from": {"id": 10**6, "is_bot": False, "first_name": "user"},
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    },
+}
+
+
+def child(db_name, spawned_at):
+    """Один холодный старт; печатает JSON {этап: секунды}"""
+    timings = {"interpreter": SPAWNED_AT - spawned_at}
+    mark = CHILD_STARTED
+
+    def lap(name):
+        nonlocal mark
+        now = time.perf_counter()
+        timings[name] = now - mark
+        mark = now
+
+    import bot
+    lap("import")
+    bot.DB_NAME = db_name
+
+    from telegram import Update
+    from telegram.ext import Application, TypeHandler
+    from fake_bot_api import TOKEN, FakeBotAPI
+
+    async def run():
+        nonlocal mark
+        api = await FakeBotAPI().start()
+        mark = time.perf_counter()      # Свой сервер Bot API в старт бота не входит
+        application = bot.build_application(Application.builder().token(TOKEN).base_url(api.base_url))
+        handled = asyncio.Event()
+        application.add_handler(TypeHandler(Update, lambda update, context: handled.set()), group=99)
+        lap("build")
+
+        await bot.run_db_write(bot.init_database)
+        lap("database")
+        try:
+            async with application:
+                await application.post_init(application)
+                await application.start()
+                lap("ready")
+
+                await application.update_queue.put(Update.de_json(FIRST_UPDATE, application.bot))
+                await asyncio.wait_for(handled.wait(), timeout=30)
+                lap("first_update")
+                assert len(api.sent) == 1, api.sent
+
+                await application.stop()
+        finally:
+            await api.stop()
+
+    try:
+        asyncio.run(run())
+    finally:
+        bot.close_connections()
+    print(json.dumps(timings))
+
+
+def prepare(db_name, rows):
+    """База, которую застанет перезапуск: схема, миграции и история"""
+    import bot
+    from harness import seed_history
+
+    bot.DB_NAME = db_name
+    try:
+        bot.init_database()
+        if rows:
+            seed_history(rows)
+    finally:
+        bot.close_connections()
+
+
+def main(args):
+    db_name = os.path.join(tempfile.mkdtemp(), "roblox_wash.db")
+    prepare(db_name, args.rows)
+
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", db_name, str(time.time())],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+
+    print(f"прогонов {args.runs}, записей в базе {args.rows}\n")
+    print(f"{'этап':<32}{'p50, мс':>10}{'max, мс':>10}")
+    for name, title in PHASES:
+        values = sorted(run[name] * 1000 for run in runs)
+        print(f"{title:<32}{values[len(values) // 2]:>10.1f}{values[-1]:>10.1f}")
+    totals = sorted(sum(run.values()) * 1000 for run in runs)
+    print(f"{'всего до ответа':<32}{totals[len(totals) // 2]:>10.1f}{totals[-1]:>10.1f}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        child(sys.argv[2], float(sys.argv[3]))
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="холодных стартов")
+    parser.add_argument("--rows", type=int, default=100000, help="записей истории в базе")
+    main(parser.parse_args())
@@ -0,0 +1,103 @@
+"""Запросов в секунду: постоянные соединения потоков БД против connect на каждый вызов
+
+    python benchmarks/connections.py --seconds 5 --concurrency 32
+
+Одни и те же функции бота (get_user_appointments на чтение, hold_slot +
+release_hold на запись) идут через run_db_read/run_db_write. В режиме
+«connect на вызов» get_read_connection/get_write_connection отдают новое
+соединение, которое закрывается после вызова, - как было до потоков БД.
+"""
+import argparse
+import asyncio
+import functools
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from harness import seed_history  # noqa: E402
+
+WRITERS = 4
+
+_call = threading.local()
+
+
+def connect_per_call(func):
+    """Функция базы на свежем соединении, закрытом после вызова"""
+    @functools.wraps(func)
+    def wrapper(*args):
+        _call.conn = sqlite3.connect(bot.DB_NAME, timeout=5)
+        try:
+            return func(*args)
+        finally:
+            _call.conn.close()
+    return wrapper
+
+
+def hold_and_release(date, time_str, user_id):
+    assert bot.hold_slot(date, time_str, "basic", user_id)
+    bot.release_hold(date, time_str, user_id)
+
+
+async def run(wrap, seconds, concurrency):
+    """(чтений в секунду, записей в секунду)"""
+    read, write = wrap(bot.get_user_appointments), wrap(hold_and_release)
+    date = bot.upcoming_dates()[1]
+    slots = [time_str for time_str, _ in bot.availability.times(date, "basic")][:WRITERS]    # У каждого писателя свое
+    counts = [0, 0]
+    deadline = time.monotonic() + seconds
+
+    async def reader(worker):
+        while time.monotonic() < deadline:
+            await bot.run_db_read(read, (worker * 7919 + counts[0]) % 50000)
+            counts[0] += 1
+
+    async def writer(worker):
+        while time.monotonic() < deadline:
+            await bot.run_db_write(write, date, slots[worker], -1 - worker)
+            counts[1] += 1
+
+    await asyncio.gather(
+        *(reader(worker) for worker in range(concurrency)),
+        *(writer(worker) for worker in range(WRITERS)),
+    )
+    return counts[0] / seconds, counts[1] / seconds
+
+
+async def main(args):
+    await bot.run_db_write(bot.init_database)
+    await bot.run_db_write(seed_history, args.rows)
+
+    persistent = await run(lambda func: func, args.seconds, args.concurrency)
+
+    get_read_connection, get_write_connection = bot.get_read_connection, bot.get_write_connection
+    bot.get_read_connection = bot.get_write_connection = lambda: _call.conn
+    try:
+        per_call = await run(connect_per_call, args.seconds, args.concurrency)
+    finally:
+        bot.get_read_connection, bot.get_write_connection = get_read_connection, get_write_connection
+
+    print(f"записей в базе {args.rows}, читателей {args.concurrency}, потоков чтения {bot.DB_READERS}\n")
+    print(f"{'режим':<22}{'чтений/с':>12}{'записей/с':>12}")
+    for name, (reads, writes) in (("постоянные", persistent), ("connect на вызов", per_call)):
+        print(f"{name:<22}{reads:>12.0f}{writes:>12.0f}")
+    print(f"\nвыигрыш: чтение x{persistent[0] / per_call[0]:.1f}, запись x{persistent[1] / per_call[1]:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000, help="записей в истории")
+    parser.add_argument("--seconds", type=float, default=5, help="на каждый режим")
+    parser.add_argument("--concurrency", type=int, default=32, help="одновременных читателей")
+    args = parser.parse_args()
+
+    bot.DB_NAME = os.path.join(tempfile.mkdtemp(), "roblox_wash.db")
+    try:
+        asyncio.run(main(args))
+    finally:
+        bot.close_connections()
@@ -0,0 +1,82 @@
+"""Выгрузка записей на миллионах строк: пиковая память и скорость
+
+    python benchmarks/export_memory.py --rows 3000000
+    python benchmarks/export_memory.py --rows 1000000 --max-growth 96
+
+База заполняется одним SQL-запросом (большая часть строк - в архиве, как после
+лет работы), потом каждый формат выгружается в отдельном процессе: ru_maxrss
+только растет, и так пик одной выгрузки не смешивается с заполнением и с соседями.
+В прирост входят страницы файла из mmap_size (64 МБ) и кэш SQLite (16 МБ): пока
+база меньше, он растет вместе с ней, дальше упирается в ~80 МБ при любом --rows.
+С --max-growth код выхода 1, если какой-то формат вырос больше чем на столько МБ.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from harness import seed_history  # noqa: E402
+
+FORMATS = (("csv", False), ("jsonl", False), ("csv", True))
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(db_name, fmt, compress):
+    """Одна выгрузка в свежем процессе: (записей, секунд, МБ файла, МБ до, МБ пик)"""
+    bot.DB_NAME = db_name
+    bot.get_read_connection()
+    before = max_rss_mb()
+    started = time.perf_counter()
+    path, count = bot.export_bookings(fmt, compress)
+    elapsed = time.perf_counter() - started
+    size = os.path.getsize(path) / 2**20
+    os.remove(path)
+    return count, elapsed, size, before, max_rss_mb()
+
+
+def main(args):
+    bot.init_database()
+    started = time.perf_counter()
+    seed_history(args.rows, int(args.rows * args.archived))
+    print(f"заполнено {args.rows} записей за {time.perf_counter() - started:.1f} с")
+
+    spawn = multiprocessing.get_context("spawn")
+    print(f"\n{'формат':<10}{'записей':>10}{'с':>8}{'записей/с':>12}{'файл, МБ':>10}{'память, МБ':>18}")
+    worst = 0
+    for fmt, compress in FORMATS:
+        with ProcessPoolExecutor(1, mp_context=spawn) as pool:
+            count, elapsed, size, before, peak = pool.submit(measure, bot.DB_NAME, fmt, compress).result()
+        name = fmt + (".gz" if compress else "")
+        print(
+            f"{name:<10}{count:>10}{elapsed:>8.1f}{count / elapsed:>12.0f}{size:>10.1f}"
+            f"{f'{before:.0f} -> {peak:.0f}':>18}"
+        )
+        worst = max(worst, peak - before)
+    print(f"\nнаибольший прирост памяти: {worst:.1f} МБ")
+    return worst
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=3000000, help="записей в базе")
+    parser.add_argument("--archived", type=float, default=0.9, help="доля записей в архиве")
+    parser.add_argument("--max-growth", type=float, help="допустимый прирост памяти выгрузки, МБ")
+    args = parser.parse_args()
+
+    bot.DB_NAME = os.path.join(tempfile.mkdtemp(), "roblox_wash.db")
+    try:
+        growth = main(args)
+    finally:
+        bot.close_connections()
+    if args.max_growth and growth > args.max_growth:
+        sys.exit(1)
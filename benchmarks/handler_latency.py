@@ -0,0 +1,180 @@
+"""Задержка обработчиков (p50/p99) без писателя и пока чужой писатель держит базу
+
+    python benchmarks/handler_latency.py --users 200 --bookers 20 --seconds 10 --hold 0.2
+
+Пользователи жмут кнопки через настоящие обработчики (query без сети): одни
+смотрят экраны из памяти, «Мои записи» и админский список, другие бронируют
+время и тут же снимают бронь.
+Во второй фазе отдельное соединение в цикле берет BEGIN IMMEDIATE и держит
+блокировку hold секунд. Чтения идут в WAL мимо нее и остаться должны прежними;
+бронированиям честно приходится ждать, но цикл событий не встает ни на миг.
+С --max-ratio код выхода 1, если p99 чтений вырос больше чем во столько раз.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from harness import Query, make_context, percentile  # noqa: E402
+
+READS = ("view_slots", "select_date", "select_service", "my_bookings", "admin_all")
+WRITES = ("select_time",)
+
+
+def seed(bookings):
+    """История записей за прошлые дни: индексам и админскому списку есть что листать"""
+    times = [bot.format_minutes(minutes) for minutes in range(10 * 60, 20 * 60, 30)]
+    resources = [row[0] for row in bot.get_write_connection().execute("SELECT id FROM resources")]
+    per_day = len(times) * len(resources)
+    today = datetime.now()
+    rows = []
+    for number in range(bookings):
+        day, rest = divmod(number, per_day)
+        time_index, resource_index = divmod(rest, len(resources))
+        date = (today - timedelta(days=day + 1)).strftime("%Y-%m-%d")
+        service = random.choice(list(bot.SERVICES))
+        rows.append((
+            date, times[time_index], service, number % 5000, f"user{number}",
+            resources[resource_index], bot.SERVICES[service].minutes,
+        ))
+    conn = bot.get_write_connection()
+    with conn:
+        conn.executemany('''
+            INSERT INTO appointments (date, time, service_type, user_id, user_name, status, resource_id, duration)
+            VALUES (?, ?, ?, ?, ?, 'booked', ?, ?)
+        ''', rows)
+    bot.load_booking_stats()
+    conn.execute("ANALYZE")
+
+
+def hold_database(stop, hold, pause):
+    """Чужой писатель: держит блокировку записи hold секунд, отпускает на pause"""
+    conn = sqlite3.connect(bot.DB_NAME, timeout=30, isolation_level=None)
+    while not stop.is_set():
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("UPDATE waitlist SET notified_at = notified_at WHERE id = -1")
+        time.sleep(hold)
+        conn.execute("COMMIT")
+        time.sleep(pause)
+    conn.close()
+
+
+async def click(user_id, name, context):
+    """Одно нажатие: (имя, секунды)"""
+    date = bot.upcoming_dates()[1]
+    service = random.choice(list(bot.SERVICES))
+    if name == "select_time":
+        times = bot.availability.times(date, service)
+        if not times:
+            return None
+        data = f"time_{date}_{random.choice(times)[0]}_{service}"
+    else:
+        data = {"select_date": f"date_{date}", "select_service": f"svc_{date}_{service}"}.get(name, name)
+
+    query = Query(bot.ADMIN_IDS[0] if name == "admin_all" else user_id, data)
+    handler = {"admin_all": bot.admin_all_bookings}.get(name) or getattr(bot, name)
+    started = time.perf_counter()
+    await handler(SimpleNamespace(callback_query=query), context)
+    elapsed = time.perf_counter() - started
+
+    if name == "select_time":
+        # Бронь сразу снимаем, чтобы время не кончилось за прогон
+        date_str, time_str, _ = query.data[len("time_"):].split("_", 2)
+        await bot.run_db_write(bot.release_hold, date_str, time_str, user_id)
+    return elapsed
+
+
+async def user(user_id, names, deadline, samples):
+    context = make_context()
+    while time.monotonic() < deadline:
+        name = random.choice(names)
+        elapsed = await click(user_id, name, context)
+        if elapsed is not None:
+            samples.setdefault(name, []).append(elapsed)
+        await asyncio.sleep(random.uniform(0.1, 0.5))   # Человек читает экран
+
+
+async def loop_lag(deadline, samples, tick=0.01):
+    """На сколько опаздывает asyncio.sleep - видно, блокирует ли кто-то цикл"""
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        await asyncio.sleep(tick)
+        samples.append(time.perf_counter() - started - tick)
+
+
+async def phase(args):
+    samples, lag = {}, []
+    deadline = time.monotonic() + args.seconds
+    await asyncio.gather(
+        loop_lag(deadline, lag),
+        *(user(user_id, READS, deadline, samples) for user_id in range(1, args.users + 1)),
+        *(user(-user_id, WRITES, deadline, samples) for user_id in range(1, args.bookers + 1)),
+    )
+    samples["(задержка цикла)"] = lag
+    return samples
+
+
+def report(title, samples):
+    print(f"\n{title}")
+    print(f"{'обработчик':<20}{'вызовов':>9}{'p50, мс':>10}{'p99, мс':>10}{'max, мс':>10}")
+    for name, values in sorted(samples.items()):
+        print(
+            f"{name:<20}{len(values):>9}{percentile(values, 0.5) * 1000:>10.1f}"
+            f"{percentile(values, 0.99) * 1000:>10.1f}{max(values) * 1000:>10.1f}"
+        )
+
+
+def reads_p99(samples):
+    return max(percentile(samples[name], 0.99) for name in READS if name in samples)
+
+
+async def main(args):
+    await bot.run_db_write(bot.init_database)
+    await bot.run_db_write(seed, args.bookings)
+
+    quiet = await phase(args)
+    report("Без писателя", quiet)
+
+    stop = threading.Event()
+    writer = threading.Thread(target=hold_database, args=(stop, args.hold, args.pause), daemon=True)
+    writer.start()
+    try:
+        busy = await phase(args)
+    finally:
+        stop.set()
+        writer.join()
+    report(f"Писатель держит базу по {args.hold} с", busy)
+
+    ratio = reads_p99(busy) / reads_p99(quiet)
+    print(f"\np99 чтений: {reads_p99(quiet) * 1000:.1f} -> {reads_p99(busy) * 1000:.1f} мс (x{ratio:.2f})")
+    return ratio
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200, help="смотрят экраны")
+    parser.add_argument("--bookers", type=int, default=20, help="бронируют")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--bookings", type=int, default=100000, help="записей в истории")
+    parser.add_argument("--hold", type=float, default=0.2, help="сколько писатель держит блокировку, с")
+    parser.add_argument("--pause", type=float, default=0.2, help="пауза писателя между транзакциями, с")
+    parser.add_argument("--max-ratio", type=float, help="допустимый рост p99 чтений под писателем")
+    args = parser.parse_args()
+
+    bot.DB_NAME = os.path.join(tempfile.mkdtemp(), "roblox_wash.db")
+    try:
+        ratio = asyncio.run(main(args))
+    finally:
+        bot.close_connections()
+    if args.max_ratio and ratio > args.max_ratio:
+        sys.exit(1)
@@ -0,0 +1,102 @@
+"""Общее для бенчмарков: история записей на миллионы строк, нажатия без сети"""
+import contextlib
+import random
+import time
+from types import SimpleNamespace
+
+import bot
+
+SLOTS_PER_DAY = 80          # 4 специалиста x 20 получасовых начал
+
+# Кэши отрисовки экранов: без них каждое нажатие строит все заново
+RENDER_CACHES = (
+    "format_date", "_main_menu", "get_admin_menu",
+    "_dates_keyboard", "_dates_text", "_services_keyboard", "_times_keyboard",
+)
+
+
+class Query:
+    """CallbackQuery без сети"""
+
+    def __init__(self, user_id, data):
+        self.from_user = SimpleNamespace(id=user_id, full_name=f"user{user_id}", first_name="x")
+        self.message = SimpleNamespace(chat_id=user_id, message_id=random.random())
+        self.inline_message_id = None
+        self.data = data
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, *args, **kwargs):
+        pass
+
+
+@contextlib.contextmanager
+def uncached_render():
+    """Экраны строятся как до кэшей: функции бота подменены исходными"""
+    cached = {name: getattr(bot, name) for name in RENDER_CACHES}
+    for name, func in cached.items():
+        setattr(bot, name, func.__wrapped__)
+    try:
+        yield
+    finally:
+        for name, func in cached.items():
+            setattr(bot, name, func)
+
+
+def make_context():
+    """context обработчика без Application"""
+    return SimpleNamespace(user_data={}, job_queue=SimpleNamespace(run_once=lambda *args, **kwargs: None))
+
+
+async def press(handler, data, user_id=None, context=None):
+    """Нажать кнопку: секунды на обработчик"""
+    query = Query(user_id or bot.ADMIN_IDS[0], data)
+    started = time.perf_counter()
+    await handler(SimpleNamespace(callback_query=query), context or make_context())
+    return time.perf_counter() - started
+
+
+def seed_history(rows, archived=0, last_day=1):
+    """rows прошедших записей одним SQL-запросом (поток писателя)
+
+    Самые старые archived - в архиве с итогами в daily_summary, как после
+    archive_batch. Последний день истории - last_day дней назад.
+    """
+    fill = '''
+        WITH RECURSIVE seq(n) AS (SELECT ? UNION ALL SELECT n + 1 FROM seq WHERE n < ?)
+        INSERT INTO {table} (id, date, time, service_type, user_id, user_name, user_phone,
+                             created_at, resource_id, duration, status)
+        SELECT n + 1,
+               date('now', '-' || (? - n / {per_day} + ?) || ' days'),
+               printf('%02d:%02d', 10 + (n % {per_day}) / 8, (n % {per_day}) / 4 % 2 * 30),
+               CASE n % 4 WHEN 0 THEN 'basic' WHEN 1 THEN 'express' WHEN 2 THEN 'pro' ELSE 'avatar' END,
+               n % 50000, 'user' || (n % 50000), '+7900' || printf('%07d', n % 50000),
+               datetime('now'), n % 4 + 1,
+               CASE n % 4 WHEN 0 THEN 60 WHEN 1 THEN 30 WHEN 2 THEN 120 ELSE 60 END,
+               'booked'
+        FROM seq
+    '''
+    days = (rows - 1) // SLOTS_PER_DAY
+    conn = bot.get_write_connection()
+    with conn:
+        if archived:
+            conn.execute(
+                fill.format(table="appointments_archive", per_day=SLOTS_PER_DAY),
+                (0, archived - 1, days, last_day)
+            )
+            conn.execute('''
+                INSERT INTO daily_summary (date, service_type, bookings)
+                SELECT date, service_type, COUNT(*) FROM appointments_archive GROUP BY date, service_type
+            ''')
+        if rows > archived:
+            conn.execute(
+                fill.format(table="appointments", per_day=SLOTS_PER_DAY),
+                (archived, rows - 1, days, last_day)
+            )
+    conn.execute("ANALYZE")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
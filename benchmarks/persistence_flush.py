@@ -0,0 +1,108 @@
+"""Цена SQLitePersistence.flush на 100k пользователей: сколько стоит цикл событий
+
+    python benchmarks/persistence_flush.py --users 100000
+    python benchmarks/persistence_flush.py --users 100000 --payload 2000 --changed 0.1
+
+Как после раунда обновлений PTB: update_user_data на каждого, потом фоновая
+запись. Пометка, pickle и сравнение хэшей идут прямо в цикле событий, в поток
+писателя уходит только запись. Пока до нее не дошло, ни одно нажатие
+не обрабатывается, - самый долгий такой стоп меряет тикер цикла (tick 1 мс).
+Пометка - отдельный стоп до flush, цикл стоял - самый долгий из двух.
+Сценарии: первая запись всех, повторная без изменений, повторная, где
+поменялась доля --changed.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+
+def user_data(user_id, payload):
+    """Как у бота: выбранные время и услуга, плюс payload байт своего"""
+    data = {"selected_time": f"{10 + user_id % 10}:00", "selected_service": random.choice(list(bot.SERVICES))}
+    if payload:
+        data["notes"] = [user_id] * (payload // 8)
+    return data
+
+
+async def loop_stall(stop, samples, tick=0.001):
+    """Самое долгое опоздание asyncio.sleep - столько цикл был занят"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(tick)
+        samples.append(time.perf_counter() - started - tick)
+
+
+async def flush(persistence, users, changed):
+    """Раунд PTB: пометить всех, дождаться фоновой записи
+
+    Возвращает секунды: (всего, пометка, самый долгий стоп цикла, запись в базу) и сколько строк записано.
+    """
+    writes = []
+    save = bot.save_persistence
+
+    def timed_save(rows, deleted):
+        started = time.perf_counter()
+        save(rows, deleted)
+        writes.append((len(rows), time.perf_counter() - started))
+
+    for data in users.values():
+        if random.random() < changed:
+            data["selected_time"] = f"{random.randint(10, 21)}:30"
+
+    stop, stalls = asyncio.Event(), []
+    ticker = asyncio.create_task(loop_stall(stop, stalls))
+    await asyncio.sleep(0.01)
+    stalls.clear()
+    bot.save_persistence = timed_save
+    started = time.perf_counter()
+    try:
+        # Так делает Application.update_persistence: по вызову на каждого, без пауз
+        for user_id, data in users.items():
+            await persistence.update_user_data(user_id, data)
+        marked = time.perf_counter() - started
+        await persistence._flush_task
+    finally:
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await ticker
+        bot.save_persistence = save
+    rows, write = writes[0] if writes else (0, 0.0)
+    return elapsed, marked, max(stalls, default=0.0), write, rows
+
+
+async def main(args):
+    await bot.run_db_write(bot.init_database)
+    users = {user_id: user_data(user_id, args.payload) for user_id in range(1, args.users + 1)}
+    persistence = bot.SQLitePersistence()
+
+    print(f"пользователей {args.users}, данных на каждого ~{args.payload} Б\n")
+    print(f"{'сценарий':<18}{'записано':>10}{'всего, мс':>11}{'пометка, мс':>13}{'цикл стоял, мс':>16}{'запись, мс':>12}")
+    # В первый раз хэшей еще нет - пишутся все
+    for title, changed in (("первая запись", 0.0), ("без изменений", 0.0), (f"изменилось {args.changed:.0%}", args.changed)):
+        elapsed, marked, stall, write, rows = await flush(persistence, users, changed)
+        print(
+            f"{title:<18}{rows:>10}{elapsed * 1000:>11.0f}{marked * 1000:>13.0f}"
+            f"{stall * 1000:>16.0f}{write * 1000:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--payload", type=int, default=200, help="лишних байт в user_data каждого")
+    parser.add_argument("--changed", type=float, default=0.1, help="доля пользователей с изменениями")
+    args = parser.parse_args()
+
+    bot.DB_NAME = os.path.join(tempfile.mkdtemp(), "roblox_wash.db")
+    try:
+        asyncio.run(main(args))
+    finally:
+        bot.close_connections()
@@ -0,0 +1,117 @@
+"""Память и процессор на одну отрисовку экрана: без кэшей и с ними
+
+    python benchmarks/render_alloc.py --repeats 1000
+
+Те же нажатия, что в render_time.py, плюс экраны со строками Appointment
+(«Мои записи» с --bookings записями и первая страница админского списка).
+Процессорное время (process_time, все потоки - чтение из базы тоже) меряется
+на пачке из --repeats нажатий без трассировки. Память - отдельным проходом
+под tracemalloc: пик выделенного за нажатие сверх того, что было до него, и
+сколько осталось после (на каждое новое сообщение остается отпечаток экрана
+в edit_screen, остальное - утечка).
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from harness import make_context, percentile, press, uncached_render  # noqa: E402
+from render_time import screens  # noqa: E402
+
+USER_ID = 10**6
+
+
+def seed_bookings(count):
+    """count предстоящих записей USER_ID - по одной на дату и время"""
+    slots = [
+        (date, time_str)
+        for date in bot.upcoming_dates()
+        for time_str, _ in bot.availability.times(date, "basic")
+    ][:count]
+    conn = bot.get_write_connection()
+    with conn:
+        conn.executemany('''
+            INSERT INTO appointments (date, time, service_type, user_id, user_name, status, resource_id, duration)
+            VALUES (?, ?, 'basic', ?, 'user', 'booked', 1, 60)
+        ''', [(date, time_str, USER_ID) for date, time_str in slots])
+    bot.load_availability()
+    return len(slots)
+
+
+async def cpu_per_press(handler, buttons, repeats, user_id):
+    """Микросекунды процессора на нажатие (среднее по пачке)"""
+    context = make_context()
+    started = time.process_time()
+    for n in range(repeats):
+        await press(handler, buttons[n % len(buttons)], user_id, context)
+    return (time.process_time() - started) / repeats * 10**6
+
+
+async def memory_per_press(handler, buttons, repeats, user_id):
+    """(p50 пика в байтах, в среднем осталось байт) на нажатие"""
+    context = make_context()
+    peaks, retained = [], 0
+    tracemalloc.start()
+    try:
+        for n in range(repeats):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            await press(handler, buttons[n % len(buttons)], user_id, context)
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained += after - before
+    finally:
+        tracemalloc.stop()
+    return percentile(peaks, 0.5), retained / repeats
+
+
+async def measure(handler, buttons, repeats, user_id):
+    await cpu_per_press(handler, buttons, len(buttons), user_id)      # Прогрев кэшей
+    cpu = await cpu_per_press(handler, buttons, repeats, user_id)
+    return (cpu, *await memory_per_press(handler, buttons, repeats, user_id))
+
+
+async def main(args):
+    await bot.run_db_write(bot.init_database)
+    booked = await bot.run_db_write(seed_bookings, args.bookings)
+
+    handlers = {name: (handler, buttons, None) for name, (handler, buttons) in screens().items()}
+    handlers["my_bookings"] = (bot.my_bookings, ["my_bookings"], USER_ID)
+    handlers["admin_all"] = (bot.admin_all_bookings, ["admin_all"], None)
+
+    results = {}
+    for name, (handler, buttons, user_id) in handlers.items():
+        with uncached_render():
+            before = await measure(handler, buttons, args.repeats, user_id)
+        results[name] = before, await measure(handler, buttons, args.repeats, user_id)
+
+    print(f"записей у пользователя {booked}, нажатий на обработчик {args.repeats}\n")
+    print(
+        f"{'обработчик':<16}{'CPU до/после, мкс':>22}{'пик до/после, КиБ':>22}"
+        f"{'осталось до/после, Б':>24}"
+    )
+    for name, (before, after) in results.items():
+        print(
+            f"{name:<16}{'%.0f / %.0f' % (before[0], after[0]):>22}"
+            f"{'%.1f / %.1f' % (before[1] / 1024, after[1] / 1024):>22}"
+            f"{'%.0f / %.0f' % (before[2], after[2]):>24}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=1000, help="нажатий на каждый обработчик")
+    parser.add_argument("--bookings", type=int, default=10, help="записей на экране «Мои записи»")
+    args = parser.parse_args()
+
+    bot.DB_NAME = os.path.join(tempfile.mkdtemp(), "roblox_wash.db")
+    try:
+        asyncio.run(main(args))
+    finally:
+        bot.close_connections()
@@ -0,0 +1,77 @@
+"""Время отрисовки экрана на обработчик: без кэшей клавиатур и текстов и с ними
+
+    python benchmarks/render_time.py --repeats 2000
+
+Обработчики экранов вызываются напрямую (query без сети) на свежей базе.
+«До» - функции отрисовки подменены исходными без lru_cache (format_date,
+меню, клавиатуры дат, услуг и времени, текст списка дат), как было до кэшей;
+«после» - бот как есть, кэши прогреты первым проходом. Каждое нажатие идет
+от своего сообщения, так что отпечаток экрана в edit_screen не дает
+пропустить отрисовку - меряется именно сборка экрана.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from harness import make_context, percentile, press, uncached_render  # noqa: E402
+
+
+def screens():
+    """{обработчик: (функция, callback_data на каждый вызов)}"""
+    dates = bot.availability.dates()
+    pairs = [(date, service) for date in dates for service in bot.availability.services(date)]
+    return {
+        "back_to_main": (bot.back_to_main, ["back_main"]),
+        "admin_panel": (bot.admin_panel, ["admin_panel"]),
+        "view_slots": (bot.view_slots, ["view_slots"]),
+        "select_date": (bot.select_date, [f"date_{date}" for date in dates]),
+        "select_service": (bot.select_service, [f"svc_{date}_{service}" for date, service in pairs]),
+    }
+
+
+async def render_times(handler, buttons, repeats):
+    """Микросекунды на каждое нажатие"""
+    context = make_context()
+    return [
+        await press(handler, buttons[n % len(buttons)], context=context) * 10**6
+        for n in range(repeats)
+    ]
+
+
+async def main(args):
+    await bot.run_db_write(bot.init_database)
+
+    results = {}
+    for name, (handler, buttons) in screens().items():
+        with uncached_render():
+            before = await render_times(handler, buttons, args.repeats)
+        await render_times(handler, buttons, len(buttons))     # Прогрев кэшей
+        after = await render_times(handler, buttons, args.repeats)
+        results[name] = before, after
+
+    print(f"дней {len(bot.availability.dates())}, нажатий на обработчик {args.repeats}\n")
+    print(f"{'обработчик':<22}{'до p50/p99, мкс':>20}{'после p50/p99, мкс':>22}{'выигрыш p50':>14}")
+    for name, (before, after) in results.items():
+        before_p50, after_p50 = percentile(before, 0.5), percentile(after, 0.5)
+        print(
+            f"{name:<22}{'%.1f / %.1f' % (before_p50, percentile(before, 0.99)):>20}"
+            f"{'%.1f / %.1f' % (after_p50, percentile(after, 0.99)):>22}"
+            f"{'x%.1f' % (before_p50 / after_p50):>14}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=2000, help="нажатий на каждый обработчик")
+    args = parser.parse_args()
+
+    bot.DB_NAME = os.path.join(tempfile.mkdtemp(), "roblox_wash.db")
+    try:
+        asyncio.run(main(args))
+    finally:
+        bot.close_connections()
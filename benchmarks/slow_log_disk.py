@@ -0,0 +1,156 @@
+"""Задержка обработчиков, когда диск с логами тормозит
+
+    python benchmarks/slow_log_disk.py --users 50 --seconds 5 --delay 0.05
+
+Логи настраиваются настоящим setup_logging (консоль уходит в /dev/null, файл -
+во временный каталог), и каждая запись в файл и консоль ждет --delay секунд,
+как на забитом диске. Пользователи записываются и тут же отменяют запись
+(отмена пишет в лог), другие смотрят экраны. Три прогона: очередь и быстрый
+диск, очередь и медленный диск, для сравнения медленный диск без очереди -
+обработчики пишут в файл сами. С очередью задержки не должны вырасти, растет
+только очередь логов.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from harness import make_context, percentile, press  # noqa: E402
+
+def slow_down(handler, delay):
+    emit = handler.emit
+
+    def slow_emit(record):
+        time.sleep(delay)
+        emit(record)
+
+    handler.emit = slow_emit
+
+
+def configure(delay, queued):
+    """setup_logging с медленными обработчиками; возвращает функцию остановки и QueueListener"""
+    listener = bot.setup_logging()
+    root = logging.getLogger()
+    for handler in listener.handlers:
+        if isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler):
+            handler.setStream(open(os.devnull, "w"))
+        slow_down(handler, delay)
+
+    if not queued:
+        # Как без очереди: запись в файл идет в том потоке, где вызван логгер
+        listener.stop()
+        queue_handler = root.handlers[-1]
+        root.removeHandler(queue_handler)
+        for handler in listener.handlers:
+            handler.addFilter(bot.LogContextFilter())
+            root.addHandler(handler)
+
+    def stop():
+        # Остаток очереди дописываем уже без задержки
+        for handler in listener.handlers:
+            del handler.emit
+        if queued:
+            listener.stop()
+            root.removeHandler(root.handlers[-1])
+        else:
+            for handler in listener.handlers:
+                root.removeHandler(handler)
+        for handler in listener.handlers:
+            handler.close()
+
+    return stop, listener
+
+
+async def booker(user_id, deadline, samples):
+    """Запись и отмена по кругу - на каждой отмене строка в логе"""
+    context = make_context()
+    while time.monotonic() < deadline:
+        date, service = random.choice(bot.upcoming_dates()), random.choice(list(bot.SERVICES))
+        times = bot.availability.times(date, service)
+        if not times:
+            continue
+        time_str = random.choice(times)[0]
+        for name, data in (("select_time", f"time_{date}_{time_str}_{service}"),
+                           ("confirm_booking", f"confirm_{date}_{time_str}_{service}")):
+            samples.setdefault(name, []).append(await press(getattr(bot, name), data, user_id, context))
+        booked = await bot.run_db_read(bot.get_user_appointments, user_id)
+        if booked:
+            samples.setdefault("cancel_booking", []).append(
+                await press(bot.cancel_booking, f"cancel_{booked[0].id}", user_id, context)
+            )
+        await asyncio.sleep(random.uniform(0.02, 0.1))
+
+
+async def viewer(user_id, deadline, samples):
+    context = make_context()
+    while time.monotonic() < deadline:
+        samples.setdefault("view_slots", []).append(await press(bot.view_slots, "view_slots", user_id, context))
+        await asyncio.sleep(random.uniform(0.02, 0.1))
+
+
+async def loop_lag(deadline, samples, tick=0.01):
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        await asyncio.sleep(tick)
+        samples.append(time.perf_counter() - started - tick)
+
+
+async def phase(args, delay, queued):
+    stop, listener = configure(delay, queued)
+    samples, lag = {}, []
+    deadline = time.monotonic() + args.seconds
+    try:
+        await asyncio.gather(
+            loop_lag(deadline, lag),
+            *(booker(10**6 + n, deadline, samples) for n in range(args.users)),
+            *(viewer(2 * 10**6 + n, deadline, samples) for n in range(args.users)),
+        )
+    finally:
+        backlog = listener.queue.qsize() if queued else 0
+        stop()
+    samples["(задержка цикла)"] = lag
+    return samples, backlog
+
+
+def report(title, samples, backlog):
+    print(f"\n{title}" + (f" - в очереди логов осталось {backlog}" if backlog else ""))
+    print(f"{'обработчик':<20}{'вызовов':>9}{'p50, мс':>10}{'p99, мс':>10}{'max, мс':>10}")
+    for name, values in sorted(samples.items()):
+        print(
+            f"{name:<20}{len(values):>9}{percentile(values, 0.5) * 1000:>10.1f}"
+            f"{percentile(values, 0.99) * 1000:>10.1f}{max(values) * 1000:>10.1f}"
+        )
+
+
+async def main(args):
+    await bot.run_db_write(bot.init_database)
+    for title, delay, queued in (
+        ("Очередь, быстрый диск", 0, True),
+        (f"Очередь, диск {args.delay * 1000:.0f} мс на запись", args.delay, True),
+        (f"Без очереди, диск {args.delay * 1000:.0f} мс на запись", args.delay, False),
+    ):
+        samples, backlog = await phase(args, delay, queued)
+        report(title, samples, backlog)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50, help="записывающихся и столько же смотрящих")
+    parser.add_argument("--seconds", type=float, default=5, help="на каждый прогон")
+    parser.add_argument("--delay", type=float, default=0.05, help="сколько диск пишет одну строку лога, с")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    bot.LOG_FILE = os.path.join(directory, "bot.log")
+    bot.DB_NAME = os.path.join(directory, "roblox_wash.db")
+    try:
+        asyncio.run(main(args))
+    finally:
+        bot.close_connections()
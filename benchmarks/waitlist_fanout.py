@@ -0,0 +1,95 @@
+"""Рассылка листа ожидания на N подписчиков через локальный Bot API
+
+    python benchmarks/waitlist_fanout.py --subscribers 10000 --rate 30
+    python benchmarks/waitlist_fanout.py --kill 5       # оборвать первый проход через 5 с
+
+Печатает, сколько дошло, дубли, кто остался в очереди и фактическую скорость
+против лимита. Каждый запуск - с чистой базой во временном каталоге.
+"""
+import argparse
+import asyncio
+import collections
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "tests")]
+
+import bot  # noqa: E402
+from fake_bot_api import running_api  # noqa: E402
+
+
+def seed(count, date, service):
+    conn = bot.get_write_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO waitlist (user_id, chat_id, date, service_type) VALUES (?, ?, ?, ?)",
+            [(chat_id, chat_id, date, service) for chat_id in range(10**6, 10**6 + count)]
+        )
+
+
+def pending():
+    return bot.get_read_connection().execute(
+        "SELECT COUNT(*) FROM waitlist WHERE notified_at IS NULL"
+    ).fetchone()[0]
+
+
+async def main(args):
+    await bot.run_db_write(bot.init_database)
+    await bot.run_db_write(seed, args.subscribers, bot.upcoming_dates()[1], "basic")
+
+    api, client = await running_api(failure_rate=args.failures)
+    context = SimpleNamespace(bot=client)
+    started = time.monotonic()
+    try:
+        if args.kill:
+            job = asyncio.create_task(bot.waitlist_job(context))
+            await asyncio.sleep(args.kill)
+            job.cancel()
+            try:
+                await job
+            except asyncio.CancelledError:
+                pass
+            print(f"оборвано через {args.kill} с: доставлено {len(api.sent)}")
+        # Второй проход повторяет тех, кому не ушло из-за сети
+        for _ in range(3):
+            await bot.waitlist_job(context)
+            if not pending():
+                break
+    finally:
+        elapsed = time.monotonic() - started
+        await client.shutdown()
+        await api.stop()
+
+    received = collections.Counter(chat_id for _, _, chat_id in api.sent)
+    stamps = api.delivered()
+    window = bot.TELEGRAM_GLOBAL_RATE
+    peak = max(
+        (window / (b - a) for a, b in zip(stamps, stamps[int(window):]) if b > a),
+        default=0,
+    )
+    print(
+        f"подписчиков {args.subscribers}, лимит {bot.TELEGRAM_GLOBAL_RATE}/с\n"
+        f"доставлено {len(stamps)}, уникальных {len(received)}, "
+        f"дублей {sum(1 for count in received.values() if count > 1)}, в очереди {pending()}\n"
+        f"за {elapsed:.1f} с -> {len(stamps) / elapsed:.1f} сообщ/с, пик ~{peak:.1f}/с, 429: {api.rejected}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=10000)
+    parser.add_argument("--rate", type=float, default=bot.TELEGRAM_GLOBAL_RATE, help="общий лимит, сообщений в секунду")
+    parser.add_argument("--failures", type=float, default=0.005, help="доля ответов 502")
+    parser.add_argument("--kill", type=float, default=0, help="оборвать первый проход через столько секунд")
+    args = parser.parse_args()
+
+    bot.TELEGRAM_GLOBAL_RATE = args.rate
+    bot.DB_NAME = os.path.join(tempfile.mkdtemp(), "roblox_wash.db")
+    try:
+        asyncio.run(main(args))
+    finally:
+        bot.close_connections()
@@ -0,0 +1,144 @@
+"""Пропускная способность webhook от POST до ответа пользователю
+
+    python benchmarks/webhook_throughput.py --updates 10000 --users 2000
+    python benchmarks/webhook_throughput.py --replay updates.jsonl --rate 30
+
+Собирается то же приложение, что в main() (все обработчики, лимитер, свой
+процессор обновлений, persistence), только Bot API - локальный FakeBotAPI.
+Обновления идут POST-запросами с секретом на WEBHOOK_PATH, как их шлет Telegram,
+в --concurrency соединений. Обновление считается обработанным, когда его прошли
+все обработчики, - к этому моменту ответ уже ушел в Bot API.
+--replay берет записанные Update JSON (по одному в строке) вместо набора кнопок.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from aiohttp.test_utils import TestClient, TestServer
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "tests")]
+
+import bot  # noqa: E402
+from fake_bot_api import TOKEN, FakeBotAPI  # noqa: E402
+
+
+def recorded_updates(users):
+    """Типичные нажатия: /start, даты, услуги, «Мои записи», назад в меню"""
+    date = bot.upcoming_dates()[1]
+    buttons = ("view_slots", f"date_{date}", f"svc_{date}_basic", f"svc_{date}_vip", "my_bookings", "back_main")
+    for number in itertools.count():
+        user_id = 10**6 + number % users
+        user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+        chat = {"id": user_id, "type": "private"}
+        if number < users:
+            yield {"message": {
+                "message_id": 1, "date": 0, "chat": chat, "from": user,
+                "text": "/start", "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+            }}
+        else:
+            yield {"callback_query": {
+                "id": str(number),
+                "from": user,
+                "chat_instance": str(user_id),
+                "data": random.choice(buttons),
+                "message": {"message_id": 1, "date": 0, "chat": chat, "text": "menu",
+                            "from": {"id": 1, "is_bot": True, "first_name": "fake"}},
+            }}
+
+
+def replayed_updates(path):
+    with open(path, encoding="utf-8") as file:
+        updates = [json.loads(line) for line in file if line.strip()]
+    return itertools.cycle(updates)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def main(args):
+    api = await FakeBotAPI().start()
+    application = bot.build_application(Application.builder().token(TOKEN).base_url(api.base_url))
+
+    posted, latencies, errors = {}, [], []
+    finished = asyncio.Event()
+
+    async def handled(update, context):
+        latencies.append(time.perf_counter() - posted.pop(update.update_id))
+        if len(latencies) == args.updates:
+            finished.set()
+
+    async def failed(update, context):
+        errors.append(context.error)
+
+    application.add_handler(TypeHandler(Update, handled), group=99)
+    application.add_error_handler(failed)
+
+    source = replayed_updates(args.replay) if args.replay else recorded_updates(args.users)
+    updates = [dict(data, update_id=update_id) for update_id, data in zip(range(1, args.updates + 1), source)]
+    pending = iter(updates)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": bot.WEBHOOK_SECRET}
+
+    async def connection(client):
+        """Одно соединение Telegram: следующий POST после ответа на предыдущий"""
+        for data in pending:
+            posted[data["update_id"]] = time.perf_counter()
+            response = await client.post(bot.WEBHOOK_PATH, json=data, headers=headers)
+            assert response.status == 200, response.status
+
+    await bot.run_db_write(bot.init_database)
+    try:
+        async with application, TestClient(TestServer(bot.build_web_app(application))) as client:
+            await application.post_init(application)
+            await application.start()
+
+            started = time.perf_counter()
+            await asyncio.gather(*(connection(client) for _ in range(args.concurrency)))
+            accepted = time.perf_counter() - started
+            await asyncio.wait_for(finished.wait(), timeout=args.timeout)
+            elapsed = time.perf_counter() - started
+
+            await application.stop()
+    finally:
+        await api.stop()
+
+    print(
+        f"обновлений {args.updates} от {args.users} пользователей, {args.concurrency} соединений, "
+        f"лимит Bot API {bot.TELEGRAM_GLOBAL_RATE}/с\n"
+        f"принято за {accepted:.2f} с -> {args.updates / accepted:.0f}/с\n"
+        f"обработано за {elapsed:.2f} с -> {args.updates / elapsed:.0f}/с\n"
+        f"от POST до конца обработки: p50 {percentile(latencies, 0.5) * 1000:.1f} мс, "
+        f"p99 {percentile(latencies, 0.99) * 1000:.1f} мс, max {max(latencies) * 1000:.1f} мс\n"
+        f"отправлено сообщений {len(api.sent)}, 429: {api.rejected}, ошибок обработчиков {len(errors)}"
+    )
+    for error in errors[:5]:
+        print(f"  {error!r}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=2000, help="разных пользователей (чатов)")
+    parser.add_argument("--concurrency", type=int, default=40, help="соединений webhook, у Telegram до 100")
+    parser.add_argument("--rate", type=float, default=300, help="общий лимит Bot API, сообщений в секунду")
+    parser.add_argument("--replay", help="файл с Update JSON по одному в строке")
+    parser.add_argument("--timeout", type=float, default=300, help="сколько ждать обработки после приема, с")
+    args = parser.parse_args()
+
+    bot.TELEGRAM_GLOBAL_RATE = args.rate
+    bot.WEBHOOK_URL = "https://example.com"
+    bot.DB_NAME = os.path.join(tempfile.mkdtemp(), "roblox_wash.db")
+    try:
+        asyncio.run(main(args))
+    finally:
+        bot.close_connections()
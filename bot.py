@@ -1,99 +1,378 @@
 import os
+import asyncio
+import contextlib
+import contextvars
+import csv
+import bisect
+import collections
+import functools
+import gzip
+import heapq
+import json
 import logging
+import pickle
+import queue
+import secrets
 import sqlite3
-import random
-import logging
 import sys
-from datetime import datetime, timedelta
+import tempfile
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, time as dtime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from types import MappingProxyType
+from aiohttp import web
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, NetworkError, RetryAfter
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     Application,
+    BasePersistence,
+    BaseRateLimiter,
+    BaseUpdateProcessor,
     CommandHandler,
     CallbackQueryHandler,
     ContextTypes,
     MessageHandler,
+    PersistenceInput,
+    TypeHandler,
     filters
 )
 
+# Момент импорта - от него считаем время холодного старта
+STARTED_AT = time.perf_counter()
+startup_timings = {}
+
 # ==================== НАСТРОЙКИ ====================
 # ==================== 1. LOGGING ====================
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-
-file_handler = logging.FileHandler('bot.log', encoding='utf-8')
-file_handler.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
-logging.getLogger().addHandler(file_handler)
-
 logger = logging.getLogger(__name__)
 
-# ==================== FLASK HEALTH SERVER ====================
-from flask import Flask
-from threading import Thread
-import time
+LOG_FILE = os.environ.get("LOG_FILE", "bot.log")
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", 5 * 1024 * 1024))
+LOG_BACKUPS = 5
+LOG_ROTATE_WHEN = os.environ.get("LOG_ROTATE_WHEN")    # Например "midnight" - ротация по времени, а не по размеру
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")      # "json" - структурные логи
 
-app = Flask(__name__)
+# Какое обновление сейчас обрабатывается: (update_id, user_id, handler)
+log_context = contextvars.ContextVar('log_context', default=(None, None, None))
 
-@app.route('/')
-def home():
-    return "✅ Roblox Brain Wash Bot is running! 🎮"
+class LogContextFilter(logging.Filter):
+    """Подписать запись текущим обновлением (в потоке, где вызван логгер)"""
+    
+    def filter(self, record):
+        record.update_id, record.user_id, record.handler = log_context.get()
+        return True
 
-@app.route('/health')
-def health():
-    return "OK", 200
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна JSON-строка"""
+    
+    def format(self, record):
+        return json.dumps({
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'update_id': getattr(record, 'update_id', None),
+            'user_id': getattr(record, 'user_id', None),
+            'handler': getattr(record, 'handler', None),
+        }, ensure_ascii=False)
 
-def run_flask():
-    try:
-        # Railway предоставляет порт через переменную окружения
-        port = int(os.environ.get('PORT', 10000))
-        logger.info(f"🚀 Starting Flask on port {port} for Railway...")
-        
-        # Важные настройки для Railway
-        app.run(
-            host='0.0.0.0',
-            port=port,
-            debug=False,
-            threaded=True,
-            use_reloader=False
-        )
-    except Exception as e:
-        logger.error(f"❌ Flask failed: {e}")
-        # Пробуем другой порт
-        try:
-            app.run(host='0.0.0.0', port=8080, debug=False, threaded=True)
-        except Exception as e2:
-            logger.error(f"❌ Backup port also failed: {e2}")
+def setup_logging():
+    """Логи через очередь: код только кладет запись, в консоль и файл пишет отдельный поток
+    
+    Вызывается при запуске, не при импорте. Возвращает QueueListener - его надо остановить при выходе.
+    """
+    if LOG_FORMAT == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    if LOG_ROTATE_WHEN:
+        file_handler = TimedRotatingFileHandler(LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUPS, encoding='utf-8')
+    else:
+        file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding='utf-8')
+    console_handler = logging.StreamHandler()
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+    
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(LogContextFilter())
+    
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(queue_handler)
+    
+    listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+    listener.start()
+    return listener
 
-# Даем время на инициализацию Telegram бота
-time.sleep(3)
-flask_thread = Thread(target=run_flask, daemon=True)
-flask_thread.start()
-logger.info("✅ Flask health server started in background")
+# Токен бота (проверяется в main)
+TOKEN = os.environ.get("BOT_TOKEN")
 
+# Сколько обновлений обрабатываем одновременно (обновления одного чата - по очереди)
+MAX_CONCURRENT_UPDATES = 256
 
-# Получаем токен бота
-TOKEN = os.environ.get("BOT_TOKEN")
-if not TOKEN:
-    logger.error("⚠️ Ошибка: Нет токена!")
-    exit(1)
+# Исходящие запросы к Telegram: лимиты Bot API и пул соединений
+TELEGRAM_GLOBAL_RATE = 30                  # Сообщений в секунду на бота
+TELEGRAM_CHAT_RATE = 1                     # В секунду на личный чат
+TELEGRAM_GROUP_RATE = 20 / 60              # В секунду на группу
+TELEGRAM_BULK_RESERVE = 5                  # Сколько токенов рассылки оставляют интерактиву
+TELEGRAM_POOL_SIZE = 64
+
+# Веб-сервер: health-check для Railway и прием webhook от Telegram
+PORT = int(os.environ.get('PORT', 10000))
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL")        # Пусто - работаем через polling
+WEBHOOK_PATH = "/telegram"
+# Без секрета любой мог бы слать боту поддельные обновления (в том числе от имени админа).
+# Telegram повторяет его в заголовке; если не задан - генерируем на запуск.
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
 
 # ID админа (ЗАМЕНИ НА СВОЙ!)
 ADMIN_IDS = [1032908366]  # ← ВСТАВЬ СВОЙ TELEGRAM ID!
 
 # Настройки записи
-WORKING_HOURS = [10, 12, 14, 16, 18, 20]  # Часы приема
+SLOT_STEP_MINUTES = 30                     # Шаг времени начала записи
 DAYS_AHEAD = 7                             # Запись на 7 дней
+HOLD_MINUTES = 5                           # Сколько слот держится за пользователем до подтверждения
+WAITLIST_BATCH = 100                       # Уведомлений листа ожидания за один заход
+WAITLIST_INTERVAL = 60                     # Секунд между проверками листа ожидания
+REMINDER_TICK = 30                         # Секунд между проверками напоминаний
+REMINDER_BATCH = 100                       # Напоминаний за одну пачку
+REMINDER_GRACE = timedelta(minutes=15)     # На сколько этап может опоздать (простой бота), дальше не шлем
+PERSISTENCE_INTERVAL = 10                  # Секунд между сохранениями user_data/bot_data
+BOOKINGS_PAGE_SIZE = 15                    # Записей на странице у админа
+EXPORT_CHUNK = 5000                        # Строк за один fetchmany при выгрузке
+EXPORT_MAX_BYTES = 50 * 1024 * 1024        # Больше бот отправить не может
+ARCHIVE_AFTER_DAYS = 30                    # Прошедшие записи старше - в архив
+ARCHIVE_BATCH = 1000                       # Записей за одну транзакцию архивации
+VACUUM_PAGES = 1000                        # Страниц за один шаг incremental_vacuum
+
+# Напоминания о записи: за сколько до начала и что написать (от раннего к позднему)
+REMINDERS = (
+    (timedelta(hours=24), "Уже завтра"),
+    (timedelta(hours=1), "Через час"),
+)
+
+# ==================== МЕТРИКИ ====================
+# Простые метрики в текстовом формате Prometheus, отдаются на /metrics
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Гистограмма задержек с одной меткой"""
+    
+    def __init__(self, name, help_text, label):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._series = {}           # значение метки -> [счетчики корзин..., сумма, количество]
+        self._lock = threading.Lock()
+    
+    def observe(self, label_value, seconds):
+        index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(LATENCY_BUCKETS) + 2)
+            if index < len(LATENCY_BUCKETS):
+                series[index] += 1
+            series[-2] += seconds
+            series[-1] += 1
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for value, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, series):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="+Inf"}} {series[-1]}')
+                lines.append(f'{self.name}_sum{{{self.label}="{value}"}} {series[-2]:.6f}')
+                lines.append(f'{self.name}_count{{{self.label}="{value}"}} {series[-1]}')
+        return lines
+
+class Counter:
+    """Счетчик с одной меткой"""
+    
+    def __init__(self, name, help_text, label):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, label_value, amount=1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for value, count in sorted(self._values.items()):
+                lines.append(f'{self.name}{{{self.label}="{value}"}} {count}')
+        return lines
+
+HANDLER_LATENCY = Histogram("bot_handler_seconds", "Время обработки обновления", "handler")
+TELEGRAM_LATENCY = Histogram("bot_telegram_api_seconds", "Время запроса к Bot API", "method")
+DB_LATENCY = Histogram("bot_db_query_seconds", "Время функции базы", "query")
+BOOKINGS = Counter("bot_bookings_total", "Попытки бронирования", "result")
+RATE_LIMIT_WAIT = Histogram("bot_rate_limit_wait_seconds", "Ожидание в лимитере запросов", "lane")
+EDITS_SAVED = Counter("bot_edits_saved_total", "Не отправленные edit_message_text (экран не изменился)", "reason")
+
+def timed_query(func):
+    """Замерять время функции базы"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            DB_LATENCY.observe(func.__name__, time.perf_counter() - started)
+    return wrapper
+
+def timed_handler(callback, label):
+    """Замерять время обработчика и подписать его логи обновлением"""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        user = getattr(update, 'effective_user', None)
+        token = log_context.set((getattr(update, 'update_id', None), user.id if user else None, label))
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        finally:
+            HANDLER_LATENCY.observe(label, time.perf_counter() - started)
+            log_context.reset(token)
+    return wrapper
+
+def instrument_handlers(application):
+    """Обернуть все зарегистрированные обработчики замером времени"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            pattern = getattr(handler, 'pattern', None)
+            label = pattern.pattern if pattern is not None else handler.callback.__name__
+            handler.callback = timed_handler(handler.callback, label)
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTP-клиент Bot API с замером времени каждого метода"""
+    
+    async def do_request(self, url, method, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        finally:
+            TELEGRAM_LATENCY.observe(url.rsplit('/', 1)[-1], time.perf_counter() - started)
+
+def update_backlog(application):
+    """Полученные, но еще не начатые обновления
+    
+    С параллельной обработкой PTB сразу забирает обновление из update_queue
+    в задачу - настоящая очередь копится в процессоре, а не там.
+    """
+    processor = application.update_processor
+    return application.update_queue.qsize() + getattr(processor, 'backlog', 0)
+
+def render_metrics(application):
+    """Все метрики одним текстом"""
+    lines = []
+    for metric in (HANDLER_LATENCY, TELEGRAM_LATENCY, RATE_LIMIT_WAIT, DB_LATENCY, BOOKINGS, EDITS_SAVED):
+        lines.extend(metric.render())
+    
+    lines += [
+        "# HELP bot_update_queue_depth Обновлений ждут обработки (очередь PTB, свой чат, свободный слот)",
+        "# TYPE bot_update_queue_depth gauge",
+        f"bot_update_queue_depth {update_backlog(application)}",
+        "# HELP bot_busy_intervals Занятых интервалов в движке свободного времени",
+        "# TYPE bot_busy_intervals gauge",
+        f"bot_busy_intervals {len(availability)}",
+    ]
+    return "\n".join(lines) + "\n"
 
 # ==================== БАЗА ДАННЫХ ====================
 DB_NAME = "roblox_wash.db"
-
+DB_READERS = 4                             # Потоков для чтения
+
+# ==================== ПОДКЛЮЧЕНИЯ К БАЗЕ ====================
+# Соединения живут всё время работы бота: у каждого потока БД своё.
+# Писатель один (все записи идут последовательно), читателей несколько,
+# и в режиме WAL они не ждут, пока писатель закончит бронирование.
+_db_local = threading.local()
+_db_connections = []
+_db_connections_lock = threading.Lock()
+
+def _open_connection(readonly):
+    """Открыть соединение с настройками под бота"""
+    conn = sqlite3.connect(
+        DB_NAME,
+        timeout=5,
+        cached_statements=256,     # Подготовленные запросы переиспользуются
+        check_same_thread=False    # Закрываем из главного потока при выходе
+    )
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA busy_timeout = 5000")
+    conn.execute("PRAGMA cache_size = -16000")      # ~16 МБ
+    conn.execute("PRAGMA mmap_size = 67108864")     # 64 МБ
+    conn.execute("PRAGMA temp_store = MEMORY")
+    if readonly:
+        conn.isolation_level = None
+        conn.execute("PRAGMA query_only = ON")
+    
+    with _db_connections_lock:
+        _db_connections.append(conn)
+    return conn
+
+def get_read_connection():
+    """Соединение для чтения текущего потока"""
+    conn = getattr(_db_local, 'reader', None)
+    if conn is None:
+        conn = _db_local.reader = _open_connection(readonly=True)
+    return conn
+
+def get_write_connection():
+    """Соединение для записи (только из потока писателя)"""
+    conn = getattr(_db_local, 'writer', None)
+    if conn is None:
+        conn = _db_local.writer = _open_connection(readonly=False)
+    return conn
+
+def close_connections():
+    """Закрыть все соединения при остановке"""
+    db_read_executor.shutdown(wait=True)
+    db_write_executor.shutdown(wait=True)
+    with _db_connections_lock:
+        for conn in _db_connections:
+            conn.close()
+        _db_connections.clear()
+
+# ==================== АСИНХРОННЫЙ ДОСТУП К БАЗЕ ====================
+# sqlite3 блокирующий, поэтому все запросы уходят в потоки БД,
+# а обработчики только ждут результат и не тормозят event loop
+db_read_executor = ThreadPoolExecutor(max_workers=DB_READERS, thread_name_prefix="sqlite-read")
+db_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-write")
+
+# run_in_executor не переносит contextvars в поток - копируем сами,
+# иначе логи функций базы теряют update_id, user_id и обработчик
+async def run_db_read(func, *args, **kwargs):
+    """Выполнить чтение в потоке читателей"""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await loop.run_in_executor(db_read_executor, call)
+
+async def run_db_write(func, *args, **kwargs):
+    """Выполнить запись в потоке писателя"""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await loop.run_in_executor(db_write_executor, call)
+
+@timed_query
 def init_database():
     """Инициализация базы данных"""
+    conn = get_write_connection()
     try:
-        conn = sqlite3.connect(DB_NAME)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -111,200 +390,1160 @@ def init_database():
             )
         ''')
         
-        cursor.execute("SELECT COUNT(*) FROM appointments WHERE date >= date('now')")
-        count = cursor.fetchone()[0]
-        
-        if count == 0:
-            logger.info("Создаю расписание в Roblox...")
-            generate_schedule(cursor)
-        
+        migrate_database(conn)
         conn.commit()
-        conn.close()
+        enable_incremental_vacuum(conn)
+        
+        load_availability()
+        load_booking_stats()
         logger.info("✅ База Roblox готова!")
         
     except Exception as e:
+        conn.rollback()
         logger.error(f"❌ Ошибка: {e}")
 
-def generate_schedule(cursor):
-    """Генерация расписания"""
-    today = datetime.now()
-    appointments = []
-    
-    # Услуги в Roblox стиле
-    services = [
-        ("🧹 Базовая чистка чата", "basic", 500),      # 500 робуксов
-        ("🌀 Очистка от нообов", "deep", 1200),        # 1200 робуксов
-        ("⚡ Экспресс-фикс багов", "express", 300),    # 300 робуксов
-        ("👑 VIP разблокировка", "vip", 2500),         # 2500 робуксов
-        ("🎮 Прокачка скиллов", "pro", 1800),          # 1800 робуксов
-        ("🔧 Ремонт аватара", "avatar", 800)           # 800 робуксов
-    ]
-    
-    import random
-    
-    for day in range(DAYS_AHEAD):
-        appointment_date = today + timedelta(days=day + 1)
-        date_str = appointment_date.strftime("%Y-%m-%d")
+# Миграции схемы: номер версии = позиция в списке (хранится в PRAGMA user_version)
+MIGRATIONS = [
+    # 1: индексы под горячие запросы (слоты, записи пользователя, записи для админа)
+    '''
+        CREATE INDEX IF NOT EXISTS idx_appointments_status_date
+            ON appointments(status, date, time, service_type);
+        CREATE INDEX IF NOT EXISTS idx_appointments_user
+            ON appointments(user_id, date, time);
+    ''',
+    # 2: временная бронь слота на время подтверждения (status = 'held')
+    '''
+        ALTER TABLE appointments ADD COLUMN hold_until TIMESTAMP;
+    ''',
+    # 3: специалисты - на одно время теперь несколько мест, по одному на специалиста.
+    #    UNIQUE(date, time) нельзя снять через ALTER, поэтому таблица пересоздается.
+    '''
+        CREATE TABLE resources (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            work_start INTEGER NOT NULL,    -- Первый час приема
+            work_end INTEGER NOT NULL,      -- Прием начинается строго раньше этого часа
+            services TEXT NOT NULL          -- Коды услуг через запятую
+        );
+        INSERT INTO resources (id, name, work_start, work_end, services) VALUES
+            (1, 'Доктор Нейрочист', 10, 22, 'basic,deep'),
+            (2, 'Профессор Логикон', 12, 22, 'express,basic'),
+            (3, 'Мастер Скиллз', 10, 20, 'pro,vip'),
+            (4, 'Аватар-Док', 14, 22, 'avatar,vip');
         
-        for hour in WORKING_HOURS:
-            time_str = f"{hour:02d}:00"
-            service = random.choice(services)
-            
-            appointments.append((
-                date_str,
-                time_str,
-                service[1],
-                None,
-                None,
-                None,
-                'free'
-            ))
+        CREATE TABLE appointments_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            service_type TEXT NOT NULL,
+            user_id INTEGER,
+            user_name TEXT,
+            user_phone TEXT,
+            status TEXT DEFAULT 'free',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            hold_until TIMESTAMP,
+            resource_id INTEGER NOT NULL DEFAULT 1 REFERENCES resources(id),
+            UNIQUE(date, time, resource_id)
+        );
+        -- Старые записи - к специалисту, который делает эту услугу (лучше тому, кто
+        -- принимает в этот час). До версии 3 на время была одна запись - мест хватит.
+        INSERT INTO appointments_new
+            (id, date, time, service_type, user_id, user_name, user_phone, status, created_at, hold_until,
+             resource_id)
+            SELECT id, date, time, service_type, user_id, user_name, user_phone, status, created_at, hold_until,
+                   COALESCE(
+                       (SELECT MIN(resources.id) FROM resources
+                        WHERE ',' || resources.services || ',' LIKE '%,' || appointments.service_type || ',%'
+                          AND CAST(substr(appointments.time, 1, 2) AS INTEGER)
+                              BETWEEN resources.work_start AND resources.work_end - 1),
+                       (SELECT MIN(resources.id) FROM resources
+                        WHERE ',' || resources.services || ',' LIKE '%,' || appointments.service_type || ',%'),
+                       1
+                   )
+            FROM appointments;
+        DROP TABLE appointments;
+        ALTER TABLE appointments_new RENAME TO appointments;
+        
+        CREATE INDEX idx_appointments_status_date
+            ON appointments(status, date, time, service_type);
+        CREATE INDEX idx_appointments_user
+            ON appointments(user_id, date, time);
+    ''',
+    # 4: свободное время считается на лету - в базе остаются только брони с длительностью
+    '''
+        ALTER TABLE appointments ADD COLUMN duration INTEGER NOT NULL DEFAULT 120;
+        DELETE FROM appointments WHERE status = 'free';
+        -- Длительность - от услуги (каталог SERVICES на момент миграции)
+        UPDATE appointments SET duration = CASE service_type
+            WHEN 'basic' THEN 60 WHEN 'deep' THEN 120 WHEN 'express' THEN 30
+            WHEN 'vip' THEN 90 WHEN 'pro' THEN 120 WHEN 'avatar' THEN 60
+            ELSE duration END;
+    ''',
+    # 5: лист ожидания - подписка на дату и услугу, notified_at ставится при рассылке
+    '''
+        CREATE TABLE waitlist (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            service_type TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            notified_at TIMESTAMP,
+            UNIQUE(user_id, date, service_type)
+        );
+        CREATE INDEX idx_waitlist_pending
+            ON waitlist(date, service_type, notified_at);
+    ''',
+    # 6: сколько напоминаний о записи уже отправлено (по порядку REMINDERS)
+    '''
+        ALTER TABLE appointments ADD COLUMN reminders_sent INTEGER NOT NULL DEFAULT 0;
+    ''',
+    # 7: user_data/chat_data/bot_data между перезапусками (pickle по ключу)
+    '''
+        CREATE TABLE persistence (
+            kind TEXT NOT NULL,             -- user, chat, bot, conversation:<имя>
+            key TEXT NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID;
+    ''',
+    # 8: постраничный просмотр записей админом по ключу (date, time, id)
+    '''
+        CREATE INDEX idx_appointments_booked
+            ON appointments(date, time) WHERE status = 'booked';
+        CREATE INDEX idx_appointments_booked_service
+            ON appointments(service_type, date, time) WHERE status = 'booked';
+    ''',
+    # 9: архив прошедших записей и итоги по дням, чтобы статистика пережила архивацию
+    '''
+        CREATE TABLE appointments_archive (
+            id INTEGER PRIMARY KEY,         -- id из appointments
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            service_type TEXT NOT NULL,
+            user_id INTEGER,
+            user_name TEXT,
+            user_phone TEXT,
+            created_at TIMESTAMP,
+            resource_id INTEGER NOT NULL,
+            duration INTEGER NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX idx_archive_user
+            ON appointments_archive(user_id, date, time);
+        
+        CREATE TABLE daily_summary (
+            date TEXT NOT NULL,
+            service_type TEXT NOT NULL,
+            bookings INTEGER NOT NULL,
+            PRIMARY KEY (date, service_type)
+        ) WITHOUT ROWID;
+    ''',
+    # 10: отмена не удаляет запись, а ставит status = 'cancelled'. Место занимают только
+    #     брони и записи, поэтому UNIQUE(date, time, resource_id) становится частичным
+    #     индексом - снять ограничение таблицы можно только пересозданием.
+    '''
+        CREATE TABLE appointments_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            service_type TEXT NOT NULL,
+            user_id INTEGER,
+            user_name TEXT,
+            user_phone TEXT,
+            status TEXT DEFAULT 'free',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            hold_until TIMESTAMP,
+            resource_id INTEGER NOT NULL DEFAULT 1 REFERENCES resources(id),
+            duration INTEGER NOT NULL DEFAULT 120,
+            reminders_sent INTEGER NOT NULL DEFAULT 0,
+            cancelled_at TIMESTAMP
+        );
+        INSERT INTO appointments_new
+            (id, date, time, service_type, user_id, user_name, user_phone, status,
+             created_at, hold_until, resource_id, duration, reminders_sent)
+            SELECT id, date, time, service_type, user_id, user_name, user_phone, status,
+                   created_at, hold_until, resource_id, duration, reminders_sent
+            FROM appointments;
+        -- id удаленных раньше записей не должны выдаваться повторно
+        DELETE FROM sqlite_sequence WHERE name = 'appointments_new';
+        INSERT INTO sqlite_sequence (name, seq)
+            SELECT 'appointments_new', seq FROM sqlite_sequence WHERE name = 'appointments';
+        DROP TABLE appointments;
+        ALTER TABLE appointments_new RENAME TO appointments;
+        
+        CREATE UNIQUE INDEX idx_appointments_slot
+            ON appointments(date, time, resource_id) WHERE status IN ('held', 'booked');
+        CREATE INDEX idx_appointments_status_date
+            ON appointments(status, date, time, service_type);
+        CREATE INDEX idx_appointments_user
+            ON appointments(user_id, date, time);
+        CREATE INDEX idx_appointments_booked
+            ON appointments(date, time) WHERE status = 'booked';
+        CREATE INDEX idx_appointments_booked_service
+            ON appointments(service_type, date, time) WHERE status = 'booked';
+        
+        ALTER TABLE appointments_archive ADD COLUMN status TEXT NOT NULL DEFAULT 'booked';
+        ALTER TABLE appointments_archive ADD COLUMN cancelled_at TIMESTAMP;
+    ''',
+    # 11: базы, прошедшие миграции 3 и 4 до исправления: все старые записи попали
+    #     к Доктору Нейрочисту на 120 минут. Переносим к специалисту с этой услугой
+    #     (OR IGNORE - если его место уже занято, запись остается где была)
+    #     и ставим длительность услуги.
+    '''
+        UPDATE OR IGNORE appointments SET resource_id = COALESCE(
+            (SELECT MIN(resources.id) FROM resources
+             WHERE ',' || resources.services || ',' LIKE '%,' || appointments.service_type || ',%'
+               AND CAST(substr(appointments.time, 1, 2) AS INTEGER)
+                   BETWEEN resources.work_start AND resources.work_end - 1),
+            (SELECT MIN(resources.id) FROM resources
+             WHERE ',' || resources.services || ',' LIKE '%,' || appointments.service_type || ',%')
+        )
+        WHERE resource_id = 1 AND service_type IN ('express', 'vip', 'pro', 'avatar');
+        UPDATE appointments_archive SET resource_id = COALESCE(
+            (SELECT MIN(resources.id) FROM resources
+             WHERE ',' || resources.services || ',' LIKE '%,' || appointments_archive.service_type || ',%'
+               AND CAST(substr(appointments_archive.time, 1, 2) AS INTEGER)
+                   BETWEEN resources.work_start AND resources.work_end - 1),
+            (SELECT MIN(resources.id) FROM resources
+             WHERE ',' || resources.services || ',' LIKE '%,' || appointments_archive.service_type || ',%')
+        )
+        WHERE resource_id = 1 AND service_type IN ('express', 'vip', 'pro', 'avatar');
+        
+        UPDATE appointments SET duration = CASE service_type
+            WHEN 'basic' THEN 60 WHEN 'express' THEN 30 WHEN 'vip' THEN 90 WHEN 'avatar' THEN 60
+            ELSE duration END
+        WHERE duration = 120;
+        UPDATE appointments_archive SET duration = CASE service_type
+            WHEN 'basic' THEN 60 WHEN 'express' THEN 30 WHEN 'vip' THEN 90 WHEN 'avatar' THEN 60
+            ELSE duration END
+        WHERE duration = 120;
+    ''',
+]
+
+def migrate_database(conn):
+    """Применить недостающие миграции"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    
+    for number, script in enumerate(MIGRATIONS[version:], version + 1):
+        logger.info(f"🛠 Миграция базы до версии {number}...")
+        conn.executescript(f"BEGIN; {script} PRAGMA user_version = {number}; COMMIT;")
+
+def enable_incremental_vacuum(conn):
+    """Перевести базу на auto_vacuum = INCREMENTAL (один раз)
+    
+    Режим меняется только полным VACUUM, а он не работает в транзакции,
+    поэтому это не миграция. Дальше место после архивации
+    возвращает retention_job небольшими шагами.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return
     
-    cursor.executemany('''
-        INSERT OR IGNORE INTO appointments 
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', appointments)
+    logger.info("🧹 Перевожу базу на incremental vacuum (разовый VACUUM)...")
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
 
 def get_russian_day_name(weekday):
     """Дни недели"""
     days = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
     return days[weekday]
 
-# ==================== ФУНКЦИИ БАЗЫ ====================
-def get_available_dates():
-    """Свободные даты"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+@functools.lru_cache(maxsize=1024)
+def format_date(date_str):
+    """Подписи даты ('25.12.2024', '25.12', 'Среда') - считаются один раз на дату"""
+    date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+    return date_obj.strftime('%d.%m.%Y'), date_obj.strftime('%d.%m'), get_russian_day_name(date_obj.weekday())
+
+# ==================== СВОБОДНОЕ ВРЕМЯ ====================
+# Слоты больше не хранятся заранее: в базе только брони, а свободное
+# время считается по рабочим часам специалистов и длительности услуги.
+AVAILABLE_DATES_LIMIT = 10
+
+def to_minutes(time_str):
+    """'14:30' -> 870"""
+    hours, minutes = time_str.split(':')
+    return int(hours) * 60 + int(minutes)
+
+def format_minutes(minutes):
+    """870 -> '14:30'"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def upcoming_dates():
+    """Даты, на которые открыта запись (с завтрашнего дня)"""
+    today = datetime.now()
+    return [(today + timedelta(days=day + 1)).strftime("%Y-%m-%d") for day in range(DAYS_AHEAD)]
+
+def is_open_date(date_str):
+    """Открыта ли запись на дату (старые кнопки несут и прошедшие, и чужие даты)"""
+    return date_str in upcoming_dates()
+
+class IntervalSet:
+    """Занятые интервалы [начало, конец) одного специалиста на один день, в минутах
     
-    cursor.execute('''
-        SELECT DISTINCT date 
-        FROM appointments 
-        WHERE status = 'free' AND date >= date('now')
-        ORDER BY date
-        LIMIT 10
-    ''')
-    
-    dates = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return dates
-
-def get_available_times(date):
-    """Свободное время на дату"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    Интервалы не пересекаются и лежат по порядку - значит, концы тоже
+    отсортированы, и пересечение проверяется одним бинарным поиском.
+    """
     
-    cursor.execute('''
-        SELECT time, service_type 
-        FROM appointments 
-        WHERE date = ? AND status = 'free'
-        ORDER BY time
-    ''', (date,))
+    __slots__ = ('starts', 'ends')
+    
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+    
+    def __len__(self):
+        return len(self.starts)
+    
+    def overlaps(self, start, end):
+        """Пересекается ли [start, end) с занятым временем - O(log n)"""
+        # Проверять нужно только последний интервал, начавшийся раньше end
+        index = bisect.bisect_left(self.starts, end)
+        return index > 0 and self.ends[index - 1] > start
+    
+    def add(self, start, end):
+        index = bisect.bisect_left(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+    
+    def remove(self, start, end):
+        index = bisect.bisect_left(self.starts, start)
+        if index < len(self.starts) and self.starts[index] == start and self.ends[index] == end:
+            del self.starts[index]
+            del self.ends[index]
     
-    times = cursor.fetchall()
-    conn.close()
-    return times
+    def busy_minutes(self):
+        return sum(self.ends) - sum(self.starts)
 
-def get_service_info(service_code):
-    """Инфо об услуге"""
-    services = {
-        'basic': ('🧹 Базовая чистка чата', 500, "Удаление спама, токсичных друзей, мусорных сообщений"),
-        'deep': ('🌀 Очистка от нообов', 1200, "Полное удаление нообского мышления, апгрейд скиллов"),
-        'express': ('⚡ Экспресс-фикс багов', 300, "Срочное исправление багов в логике, быстрая помощь"),
-        'vip': ('👑 VIP разблокировка', 2500, "Разблокировка премиум-возможностей, доступ к секретным зонам"),
-        'pro': ('🎮 Прокачка скиллов', 1800, "Повышение уровня, изучение новых механик, гайды от про"),
-        'avatar': ('🔧 Ремонт аватара', 800, "Починка аватара, настройка анимаций, новые аксессуары")
-    }
-    return services.get(service_code, ('Неизвестная услуга', 0, ""))
-
-def book_appointment(date, time, user_id, user_name, phone=None):
-    """Бронирование"""
-    try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
+class AvailabilityEngine:
+    """Рабочие часы специалистов и их брони в памяти
+    
+    Меняется только из потока писателя после записи в базу: бронь добавляет
+    интервал, отмена - убирает. Обработчики только читают.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resources = {}        # id -> (имя, начало дня, конец дня в минутах, коды услуг)
+        self._busy = {}             # (id, дата) -> IntervalSet
+    
+    def __len__(self):
+        """Сколько занятых интервалов в памяти"""
+        with self._lock:
+            return sum(len(intervals) for intervals in self._busy.values())
+    
+    def load(self, resources, bookings):
+        """Загрузить специалистов и брони из базы"""
+        busy = {}
+        for resource_id, date, time_str, duration in bookings:
+            start = to_minutes(time_str)
+            busy.setdefault((resource_id, date), IntervalSet()).add(start, start + duration)
         
-        cursor.execute('''
-            UPDATE appointments 
-            SET user_id = ?, user_name = ?, user_phone = ?, status = 'booked'
-            WHERE date = ? AND time = ? AND status = 'free'
-        ''', (user_id, user_name, phone, date, time))
+        with self._lock:
+            self._resources = {
+                resource_id: (name, work_start * 60, work_end * 60, frozenset(services.split(',')))
+                for resource_id, name, work_start, work_end, services in resources
+            }
+            self._busy = busy
+    
+    def reserve(self, resource_id, date, start, end):
+        """Время занято"""
+        with self._lock:
+            self._busy.setdefault((resource_id, date), IntervalSet()).add(start, end)
+    
+    def release(self, resource_id, date, start, end):
+        """Время снова свободно"""
+        with self._lock:
+            intervals = self._busy.get((resource_id, date))
+            if intervals is not None:
+                intervals.remove(start, end)
+                if not intervals:
+                    del self._busy[(resource_id, date)]
+    
+    def _free_starts(self, date, service):
+        """{начало: сколько специалистов свободны} (под блокировкой)"""
+        duration = SERVICES[service].minutes
+        starts = {}
+        for resource_id, (_, work_start, work_end, services) in self._resources.items():
+            if service not in services:
+                continue
+            intervals = self._busy.get((resource_id, date))
+            for start in range(work_start, work_end - duration + 1, SLOT_STEP_MINUTES):
+                if intervals is None or not intervals.overlaps(start, start + duration):
+                    starts[start] = starts.get(start, 0) + 1
+        return starts
+    
+    def _has_free(self, date):
+        """Есть ли на дату хоть какое-то свободное время (под блокировкой)"""
+        for resource_id, (_, work_start, work_end, services) in self._resources.items():
+            duration = min(SERVICES[service].minutes for service in services)
+            intervals = self._busy.get((resource_id, date))
+            for start in range(work_start, work_end - duration + 1, SLOT_STEP_MINUTES):
+                if intervals is None or not intervals.overlaps(start, start + duration):
+                    return True
+        return False
+    
+    def dates(self):
+        """Даты со свободным временем"""
+        with self._lock:
+            return [date for date in upcoming_dates() if self._has_free(date)][:AVAILABLE_DATES_LIMIT]
+    
+    def services(self, date):
+        """{услуга: сколько вариантов времени} на дату, только доступные услуги"""
+        if not is_open_date(date):
+            return {}
+        with self._lock:
+            counts = {service: len(self._free_starts(date, service)) for service in SERVICES}
+        return {service: count for service, count in counts.items() if count}
+    
+    def times(self, date, service):
+        """[(время, мест)] для услуги на дату"""
+        if not is_open_date(date):
+            return []
+        with self._lock:
+            starts = self._free_starts(date, service)
+        return [(format_minutes(start), free) for start, free in sorted(starts.items())]
+    
+    def find_resource(self, date, start, service):
+        """Первый специалист, свободный на всю услугу, или None
         
-        success = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
+        Время должно лежать в сетке записи (шаг SLOT_STEP_MINUTES от начала дня)
+        на открытую дату: прошедшие дни в памяти выглядят свободными.
+        """
+        if not is_open_date(date):
+            return None
+        end = start + SERVICES[service].minutes
+        with self._lock:
+            for resource_id, (_, work_start, work_end, services) in self._resources.items():
+                if service not in services or start < work_start or end > work_end:
+                    continue
+                if (start - work_start) % SLOT_STEP_MINUTES:
+                    continue
+                intervals = self._busy.get((resource_id, date))
+                if intervals is None or not intervals.overlaps(start, end):
+                    return resource_id
+        return None
+    
+    def utilization(self, dates):
+        """(занято минут, рабочих минут) по всем специалистам за даты"""
+        with self._lock:
+            total = sum(work_end - work_start for _, work_start, work_end, _ in self._resources.values()) * len(dates)
+            busy = sum(
+                intervals.busy_minutes()
+                for (_, date), intervals in self._busy.items() if date in dates
+            )
+        return busy, total
+
+availability = AvailabilityEngine()
+
+@timed_query
+def load_availability():
+    """Загрузить движок свободного времени из базы (поток писателя)"""
+    conn = get_write_connection()
+    resources = conn.execute(
+        "SELECT id, name, work_start, work_end, services FROM resources ORDER BY id"
+    ).fetchall()
+    bookings = conn.execute('''
+        SELECT resource_id, date, time, duration FROM appointments
+        WHERE status IN ('held', 'booked') AND date >= date('now')
+    ''').fetchall()
+    availability.load(resources, bookings)
+    return len(bookings)
+
+# ==================== МОДЕЛЬ ====================
+@dataclass(frozen=True, slots=True)
+class Service:
+    """Услуга из каталога SERVICES"""
+    code: str
+    name: str                   # С эмодзи: '🧹 Базовая чистка чата'
+    price: int                  # В робуксах
+    minutes: int                # Длительность
+    description: str
+    details: tuple = ()         # Пункты для экрана "Услуги"
+    short_name: str = field(init=False)   # 'Базовая' - для админки
+
+    def __post_init__(self):
+        object.__setattr__(self, 'short_name', self.name.split()[1])
+
+# Колонки appointments в порядке полей Appointment
+APPOINTMENT_COLUMNS = "id, date, time, service_type, user_id, user_name, user_phone, created_at, resource_id, duration"
+
+# Не frozen: у frozen __init__ идет через object.__setattr__ на каждое поле
+# и создание строки в 5 раз дороже. Записи и так только читаются.
+@dataclass(slots=True)
+class Appointment:
+    """Запись из appointments (SELECT APPOINTMENT_COLUMNS + appointment_row)"""
+    id: int
+    date: str
+    time: str
+    service_type: str
+    user_id: int
+    user_name: str
+    user_phone: str
+    created_at: str
+    resource_id: int
+    duration: int
+
+    @property
+    def service(self):
+        return get_service_info(self.service_type)
+
+    @property
+    def key(self):
+        """Ключ для постраничного просмотра: (date, time, id)"""
+        return self.date, self.time, self.id
+
+def appointment_row(cursor, row):
+    """row_factory: строка APPOINTMENT_COLUMNS -> Appointment"""
+    return Appointment(*row)
+
+# ==================== СТАТИСТИКА ====================
+@functools.lru_cache(maxsize=1024)
+def week_of(date_str):
+    """'2026-10-19' -> '2026-W43' (неделя по ISO)"""
+    year, week, _ = datetime.fromisoformat(date_str).isocalendar()
+    return f"{year}-W{week:02d}"
+
+class BookingStats:
+    """Счетчики записей для админки: по услугам, дням и неделям
+    
+    Загружаются один раз агрегатным запросом, дальше бронирование,
+    перенос и отмена двигают их на ±1 - панель не зависит от размера истории.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = 0
+        self._services = collections.Counter()
+        self._days = collections.Counter()
+        self._weeks = collections.Counter()
+    
+    def load(self, rows):
+        """[(дата, услуга, записей)] из базы"""
+        services, days, weeks = collections.Counter(), collections.Counter(), collections.Counter()
+        for date, service, count in rows:
+            services[service] += count
+            days[date] += count
+            weeks[week_of(date)] += count
+        
+        with self._lock:
+            self.total = sum(services.values())
+            self._services, self._days, self._weeks = services, days, weeks
+    
+    def add(self, date, service, amount=1):
+        with self._lock:
+            self.total += amount
+            self._services[service] += amount
+            self._days[date] += amount
+            self._weeks[week_of(date)] += amount
+    
+    def snapshot(self, dates, weeks):
+        """Срез для панели: всего, [(услуга, записей, выручка)], по датам, по неделям"""
+        with self._lock:
+            services = [
+                (service, count, count * get_service_info(service).price)
+                for service, count in sorted(self._services.items(), key=lambda item: (-item[1], item[0]))
+                if count > 0
+            ]
+            return (
+                self.total,
+                services,
+                [(date, self._days[date]) for date in dates],
+                [(week, self._weeks[week]) for week in weeks],
+            )
+
+booking_stats = BookingStats()
+
+# ==================== ФУНКЦИИ БАЗЫ ====================
+# Каталог услуг - единственное место, где описаны названия, цены и длительности
+SERVICES = MappingProxyType({service.code: service for service in (
+    Service(
+        'basic', '🧹 Базовая чистка чата', 500, 60,
+        "Удаление спама, токсичных друзей, мусорных сообщений",
+        ("Удаление спама и флуда", "Чистка друзей-токсиков", "Настройка приватности", "Базовая защита")
+    ),
+    Service(
+        'deep', '🌀 Очистка от нообов', 1200, 120,
+        "Полное удаление нообского мышления, апгрейд скиллов",
+        ("Полное удаление нообского мышления", "Установка про-логики",
+         "Апгрейд скиллов принятия решений", "Защита от кринжа")
+    ),
+    Service(
+        'express', '⚡ Экспресс-фикс багов', 300, 30,
+        "Срочное исправление багов в логике, быстрая помощь",
+        ("Срочное исправление логических ошибок", "Починка когнитивных функций",
+         "Быстрая помощь при лагах", "Экстренная перезагрузка")
+    ),
+    Service(
+        'vip', '👑 VIP разблокировка', 2500, 90,
+        "Разблокировка премиум-возможностей, доступ к секретным зонам",
+        ("Доступ к скрытым возможностям", "Премиум настройки мозга", "Эксклюзивные анимации", "Личный помощник-бот")
+    ),
+    Service(
+        'pro', '🎮 Прокачка скиллов', 1800, 120,
+        "Повышение уровня, изучение новых механик, гайды от про",
+        ("Повышение уровня реакции", "Изучение продвинутых механик",
+         "Тренировка стратегического мышления", "Гайды от топ-геймеров")
+    ),
+    Service(
+        'avatar', '🔧 Ремонт аватара', 800, 60,
+        "Починка аватара, настройка анимаций, новые аксессуары",
+        ("Починка сломанных эмоций", "Настройка анимаций личности", "Новые аксессуары для ума", "Кастомизация поведения")
+    ),
+)})
+
+UNKNOWN_SERVICE = Service('unknown', '❓ Неизвестная услуга', 0, 0, "")
+
+def get_service_info(service_code):
+    """Услуга из каталога (для неизвестного кода - заглушка)"""
+    return SERVICES.get(service_code, UNKNOWN_SERVICE)
+
+def _delete_holds(conn, condition, params):
+    """Удалить временные брони по условию (внутри транзакции писателя)"""
+    # Броней единицы, а после ANALYZE планировщик видит почти сплошь 'booked'
+    # и на условии с OR уходит в полный проход таблицы - брони ищем по статусу
+    rows = conn.execute(f'''
+        SELECT id, resource_id, date, time, duration FROM appointments INDEXED BY idx_appointments_status_date
+        WHERE status = 'held' AND {condition}
+    ''', params).fetchall()
+    conn.executemany("DELETE FROM appointments WHERE id = ?", [(row[0],) for row in rows])
+    return rows
+
+def _release_rows(rows):
+    """Вернуть время удаленных броней в свободное (после коммита)"""
+    for _, resource_id, date, time_str, duration in rows:
+        start = to_minutes(time_str)
+        availability.release(resource_id, date, start, start + duration)
+
+@timed_query
+def hold_slot(date, time, service, user_id):
+    """Придержать время за пользователем, пока он подтверждает запись"""
+    conn = get_write_connection()
+    
+    # Пользователь держит не больше одной брони - прежнюю отпускаем,
+    # заодно чистим чужие истекшие
+    with conn:
+        released = _delete_holds(
+            conn, "(user_id = ? OR hold_until < datetime('now'))", (user_id,)
+        )
+    _release_rows(released)
+    
+    # Писатель один, поэтому между проверкой и вставкой время никто не займет
+    start = to_minutes(time)
+    resource_id = availability.find_resource(date, start, service)
+    if resource_id is None:
+        return False
+    
+    duration = SERVICES[service].minutes
+    with conn:
+        conn.execute('''
+            INSERT INTO appointments (date, time, service_type, user_id, status, hold_until, resource_id, duration)
+            VALUES (?, ?, ?, ?, 'held', datetime('now', ?), ?, ?)
+        ''', (date, time, service, user_id, f'+{HOLD_MINUTES} minutes', resource_id, duration))
+    availability.reserve(resource_id, date, start, start + duration)
+    return True
+
+@timed_query
+def release_hold(date, time, user_id, expired_only=False):
+    """Снять временную бронь (отмена или истечение)"""
+    condition = "date = ? AND time = ? AND user_id = ?"
+    if expired_only:
+        condition += " AND hold_until < datetime('now')"
+    
+    conn = get_write_connection()
+    with conn:
+        rows = _delete_holds(conn, condition, (date, time, user_id))
+    _release_rows(rows)
+    return len(rows) > 0
+
+@timed_query
+def release_expired_holds():
+    """Снять все истекшие брони (при старте, после простоя)"""
+    conn = get_write_connection()
+    with conn:
+        expired = _delete_holds(conn, "hold_until < datetime('now')", ())
+    _release_rows(expired)
+    return len(expired)
+
+def _claim_hold(conn, date, time, service, user_id):
+    """Своя бронь на время: (id, имя специалиста) или None
+    
+    Если бронь истекла, время пробуем взять заново - но не когда брони нет,
+    потому что она уже стала записью (повторное нажатие «Да, записать!»):
+    при свободных местах это была бы вторая запись на то же время.
+    """
+    find_hold = '''
+        SELECT a.id, r.name FROM appointments a
+        JOIN resources r ON r.id = a.resource_id
+        WHERE a.date = ? AND a.time = ? AND a.service_type = ? AND a.user_id = ? AND a.status = 'held'
+    '''
+    params = (date, time, service, user_id)
+    
+    row = conn.execute(find_hold, params).fetchone()
+    if row is not None:
+        return row
+    already_booked = conn.execute(
+        "SELECT 1 FROM appointments WHERE user_id = ? AND date = ? AND time = ? AND status = 'booked'",
+        (user_id, date, time)
+    ).fetchone()
+    if already_booked is None and hold_slot(date, time, service, user_id):
+        row = conn.execute(find_hold, params).fetchone()
+    return row
+
+@timed_query
+def book_appointment(date, time, service, user_id, user_name, phone=None):
+    """Бронирование (превращает временную бронь в запись)
+    
+    Возвращает (id записи, имя специалиста) или None, если время уже занято.
+    """
+    try:
+        conn = get_write_connection()
+        row = _claim_hold(conn, date, time, service, user_id)
+        if row is None:
+            return None
         
-        return success
+        with conn:
+            conn.execute('''
+                UPDATE appointments 
+                SET user_name = ?, user_phone = ?, status = 'booked', hold_until = NULL
+                WHERE id = ?
+            ''', (user_name, phone, row[0]))
+        booking_stats.add(date, service)
+        return row
     except Exception as e:
         logger.error(f"Ошибка: {e}")
-        return False
+        return None
 
-def get_user_appointments(user_id):
-    """Записи пользователя"""
-    conn = sqlite3.connect(DB_NAME)
+def now_key():
+    """(дата, время) сейчас - в том же виде, что date и time в базе"""
+    now = datetime.now()
+    return now.strftime("%Y-%m-%d"), now.strftime("%H:%M")
+
+def _booked_row(conn, appointment_id, user_id):
+    """Еще не начавшаяся запись пользователя (Appointment) или None
+    
+    Прошедшие записи - история и выручка, их не отменить и не перенести.
+    """
     cursor = conn.cursor()
+    cursor.row_factory = appointment_row
+    return cursor.execute(f'''
+        SELECT {APPOINTMENT_COLUMNS} FROM appointments
+        WHERE id = ? AND user_id = ? AND status = 'booked' AND (date, time) > (?, ?)
+    ''', (appointment_id, user_id, *now_key())).fetchone()
+
+def _cancel_row(conn, appointment_id):
+    """Отметить запись отмененной: строка остается в базе, место освобождается"""
+    conn.execute(
+        "UPDATE appointments SET status = 'cancelled', cancelled_at = CURRENT_TIMESTAMP WHERE id = ?",
+        (appointment_id,)
+    )
+
+@timed_query
+def cancel_appointment(appointment_id, user_id):
+    """Отмена записи пользователем: время сразу освобождается
     
-    cursor.execute('''
-        SELECT date, time, service_type, created_at 
+    Возвращает (дата, время) отмененной записи или None.
+    """
+    conn = get_write_connection()
+    with conn:
+        row = _booked_row(conn, appointment_id, user_id)
+        if row is None:
+            return None
+        _cancel_row(conn, appointment_id)
+    
+    start = to_minutes(row.time)
+    availability.release(row.resource_id, row.date, start, start + row.duration)
+    booking_stats.add(row.date, row.service_type, -1)
+    return row.date, row.time
+
+@timed_query
+def reschedule_appointment(appointment_id, date, time, service, user_id):
+    """Перенос записи на придержанное время
+    
+    Старая запись отменяется в той же транзакции, где бронь становится записью,
+    так что при неудаче пользователь остается со старым временем.
+    Возвращает (id новой записи, имя специалиста) или None.
+    """
+    conn = get_write_connection()
+    old = _booked_row(conn, appointment_id, user_id)
+    if old is None:
+        return None
+    
+    row = _claim_hold(conn, date, time, service, user_id)
+    if row is None:
+        return None
+    
+    with conn:
+        conn.execute('''
+            UPDATE appointments 
+            SET user_name = ?, user_phone = ?, status = 'booked', hold_until = NULL
+            WHERE id = ?
+        ''', (old.user_name, old.user_phone, row[0]))
+        _cancel_row(conn, appointment_id)
+    
+    start = to_minutes(old.time)
+    availability.release(old.resource_id, old.date, start, start + old.duration)
+    booking_stats.add(old.date, old.service_type, -1)
+    booking_stats.add(date, service)
+    return row
+
+@timed_query
+def get_user_appointments(user_id):
+    """Предстоящие записи пользователя ([Appointment])"""
+    cursor = get_read_connection().cursor()
+    cursor.row_factory = appointment_row
+    
+    cursor.execute(f'''
+        SELECT {APPOINTMENT_COLUMNS}
         FROM appointments 
-        WHERE user_id = ? 
+        WHERE user_id = ? AND status = 'booked' AND (date, time) > (?, ?)
         ORDER BY date, time
-    ''', (user_id,))
+    ''', (user_id, *now_key()))
     
     appointments = cursor.fetchall()
-    conn.close()
     return appointments
 
-def get_all_bookings():
-    """ВСЕ записи (для админа)"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT date, time, service_type, user_name, user_phone, created_at 
-        FROM appointments 
-        WHERE status = 'booked'
-        ORDER BY date, time
-    ''')
-    
-    bookings = cursor.fetchall()
-    conn.close()
-    return bookings
+# Фильтры по дате для админа: название -> (с какой даты, по какую) относительно сегодня
+BOOKINGS_DATE_FILTERS = {
+    'all': ("📆 Все", None, None),
+    'upcoming': ("⏭ Будущие", 0, None),
+    'week': ("🗓 7 дней", 0, 6),
+    'past': ("⏮ Прошедшие", None, -1),
+}
+
+def bookings_date_range(preset):
+    """Фильтр по дате -> (date_from, date_to), None - без границы"""
+    _, start, end = BOOKINGS_DATE_FILTERS[preset]
+    today = datetime.now()
+    return tuple(
+        (today + timedelta(days=offset)).strftime("%Y-%m-%d") if offset is not None else None
+        for offset in (start, end)
+    )
 
-def get_stats():
-    """Статистика (для админа)"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+@timed_query
+def get_bookings_page(bookings_filter, cursor=None, backward=False, limit=BOOKINGS_PAGE_SIZE):
+    """Страница записей для админа (ключ - date, time, id)
     
-    # Общая статистика
-    cursor.execute("SELECT COUNT(*) FROM appointments")
-    total = cursor.fetchone()[0]
+    cursor - ключ крайней записи соседней страницы: после него (вперед)
+    или перед ним (backward). Запрос всегда LIMIT и идет по индексу,
+    поэтому страница одинаково быстрая при любом размере истории.
+    Возвращает ([Appointment], есть ли еще в ту же сторону).
+    """
+    conditions = ["status = 'booked'"]
+    params = []
+    
+    date_from, date_to = bookings_date_range(bookings_filter.get('dates', 'all'))
+    # С границей по дате SQLite начинает диапазон индекса от нее, а не от ключа страницы,
+    # и отбрасывает все строки между ними. Граница, сдвинутая к дате ключа, ничего не меняет
+    # в выборке, но диапазон начинается у страницы
+    if cursor and backward and date_to:
+        date_to = min(date_to, cursor[0])
+    if cursor and not backward and date_from:
+        date_from = max(date_from, cursor[0])
+    if date_from:
+        conditions.append("date >= ?")
+        params.append(date_from)
+    if date_to:
+        conditions.append("date <= ?")
+        params.append(date_to)
+    if bookings_filter.get('service'):
+        conditions.append("service_type = ?")
+        params.append(bookings_filter['service'])
+    if bookings_filter.get('user_id'):
+        conditions.append("user_id = ?")
+        params.append(bookings_filter['user_id'])
+    if cursor:
+        conditions.append(f"(date, time, id) {'<' if backward else '>'} (?, ?, ?)")
+        params.extend(cursor)
+    
+    # Без фильтра по услуге/пользователю планировщик берет idx_appointments_status_date,
+    # где между time и id стоит service_type - и досортировывает. Нужен индекс (date, time).
+    index = "" if bookings_filter.get('service') or bookings_filter.get('user_id') else "INDEXED BY idx_appointments_booked"
+    
+    order = "DESC" if backward else "ASC"
+    cursor = get_read_connection().cursor()
+    cursor.row_factory = appointment_row
+    cursor.execute(f'''
+        SELECT {APPOINTMENT_COLUMNS}
+        FROM appointments {index}
+        WHERE {" AND ".join(conditions)}
+        ORDER BY date {order}, time {order}, id {order}
+        LIMIT ?
+    ''', (*params, limit + 1))
+    
+    rows = cursor.fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+    return rows, more
+
+EXPORT_COLUMNS = (
+    'id', 'date', 'time', 'service_type', 'service_name', 'price', 'duration',
+    'specialist', 'user_id', 'user_name', 'user_phone', 'created_at'
+)
+
+def iter_bookings():
+    """Все записи (сначала архив) по одной, кусками по EXPORT_CHUNK - в памяти не больше куска"""
+    # NOT INDEXED: проход по rowid уже отсортирован по id, а через индекс по статусу
+    # SQLite строит временное B-дерево на всю таблицу - память растёт вместе с ней
+    # Одна транзакция на обе таблицы: запись, уехавшая в архив посреди выгрузки, не потеряется
+    conn = get_read_connection()
+    conn.execute("BEGIN")
+    try:
+        for table in ("appointments_archive", "appointments"):
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT a.id, a.date, a.time, a.service_type, a.duration, r.name,
+                       a.user_id, a.user_name, a.user_phone, a.created_at
+                FROM {table} a NOT INDEXED
+                LEFT JOIN resources r ON r.id = a.resource_id
+                WHERE a.status = 'booked'
+                ORDER BY a.id
+            ''')
+            while True:
+                rows = cursor.fetchmany(EXPORT_CHUNK)
+                if not rows:
+                    break
+                yield from rows
+    finally:
+        conn.execute("COMMIT")
+
+def export_records(rows):
+    """Строки базы -> строки выгрузки (с названием и ценой услуги)"""
+    for appointment_id, date, time_str, service_code, duration, specialist, *user in rows:
+        service = get_service_info(service_code)
+        yield (appointment_id, date, time_str, service_code, service.name, service.price, duration, specialist, *user)
+
+@timed_query
+def export_bookings(fmt="csv", compress=False):
+    """Выгрузить записи во временный файл (поток читателя)
+    
+    Записи идут генераторами прямо в файл, поэтому память не зависит от размера таблицы.
+    Возвращает (путь, сколько записей). Файл удаляет вызывающий.
+    """
+    suffix = f".{fmt}" + (".gz" if compress else "")
+    fd, path = tempfile.mkstemp(prefix="bookings_", suffix=suffix)
+    os.close(fd)
     
-    cursor.execute("SELECT COUNT(*) FROM appointments WHERE status = 'free'")
-    free = cursor.fetchone()[0]
+    count = 0
+    def counted(records):
+        nonlocal count
+        for count, record in enumerate(records, 1):
+            yield record
     
-    cursor.execute("SELECT COUNT(*) FROM appointments WHERE status = 'booked'")
-    booked = cursor.fetchone()[0]
+    try:
+        opener = gzip.open if compress else open
+        # closing: при ошибке записи генератор жив, пока жив traceback, - а с ним и
+        # транзакция на общем соединении читателя. Закрываем сразу, снимок отпускается
+        with opener(path, 'wt', encoding='utf-8', newline='') as file, contextlib.closing(iter_bookings()) as rows:
+            records = counted(export_records(rows))
+            if fmt == "jsonl":
+                file.writelines(
+                    json.dumps(dict(zip(EXPORT_COLUMNS, record)), ensure_ascii=False) + "\n"
+                    for record in records
+                )
+            else:
+                writer = csv.writer(file)
+                writer.writerow(EXPORT_COLUMNS)
+                writer.writerows(records)
+    except Exception:
+        os.remove(path)
+        raise
+    
+    return path, count
+
+@timed_query
+def load_booking_stats():
+    """Загрузить счетчики записей одним агрегатным запросом (поток писателя)
+    
+    Индекс (status, date, time, service_type) покрывает запрос - таблицу не читаем.
+    Заархивированные записи берутся из итогов daily_summary.
+    """
+    rows = get_write_connection().execute('''
+        SELECT date, service_type, SUM(bookings)
+        FROM (
+            SELECT date, service_type, COUNT(*) AS bookings
+            FROM appointments
+            WHERE status = 'booked'
+            GROUP BY date, service_type
+            UNION ALL
+            SELECT date, service_type, bookings FROM daily_summary
+        )
+        GROUP BY date, service_type
+    ''').fetchall()
+    booking_stats.load(rows)
+    return len(rows)
+
+@timed_query
+def archive_batch(cutoff, limit=ARCHIVE_BATCH):
+    """Перенести до limit записей (и отмен) раньше cutoff в архив одной транзакцией
     
-    # Статистика по услугам
+    Итоги по дням копятся в daily_summary, счетчики в памяти не меняются:
+    записи не пропадают, а переезжают. Возвращает, сколько перенесено.
+    """
+    conn = get_write_connection()
+    with conn:
+        rows = conn.execute('''
+            SELECT id, date, time, service_type, user_id, user_name, user_phone,
+                   created_at, resource_id, duration, status, cancelled_at
+            FROM appointments
+            WHERE status IN ('booked', 'cancelled') AND date < ?
+            LIMIT ?
+        ''', (cutoff, limit)).fetchall()
+        if not rows:
+            return 0
+        
+        conn.executemany('''
+            INSERT INTO appointments_archive
+                (id, date, time, service_type, user_id, user_name, user_phone,
+                 created_at, resource_id, duration, status, cancelled_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        
+        summary = collections.Counter((row[1], row[3]) for row in rows if row[10] == 'booked')
+        conn.executemany('''
+            INSERT INTO daily_summary (date, service_type, bookings) VALUES (?, ?, ?)
+            ON CONFLICT(date, service_type) DO UPDATE SET bookings = bookings + excluded.bookings
+        ''', [(date, service, count) for (date, service), count in summary.items()])
+        
+        conn.executemany("DELETE FROM appointments WHERE id = ?", [(row[0],) for row in rows])
+    return len(rows)
+
+@timed_query
+def vacuum_step(pages=VACUUM_PAGES):
+    """Вернуть системе до pages свободных страниц: (освобождено, осталось)"""
+    conn = get_write_connection()
+    before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    # Прагма освобождает по странице за шаг - без fetchall выполнится только первый
+    conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+    left = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return before - left, left
+
+@timed_query
+def optimize_database():
+    """Обновить статистику планировщика там, где она устарела"""
+    get_write_connection().execute("PRAGMA optimize")
+
+@timed_query
+def add_to_waitlist(user_id, chat_id, date, service):
+    """Подписка на освобождение времени (повторная подписка снова ждет рассылки)"""
+    conn = get_write_connection()
+    with conn:
+        conn.execute('''
+            INSERT INTO waitlist (user_id, chat_id, date, service_type)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(user_id, date, service_type) DO UPDATE
+            SET chat_id = excluded.chat_id, notified_at = NULL
+        ''', (user_id, chat_id, date, service))
+
+@timed_query
+def get_waitlist_slots(first_date):
+    """(дата, услуга), по которым кто-то ждет уведомления"""
+    cursor = get_read_connection().cursor()
     cursor.execute('''
-        SELECT service_type, COUNT(*) 
-        FROM appointments 
-        WHERE status = 'booked'
-        GROUP BY service_type
-    ''')
-    service_stats = cursor.fetchall()
+        SELECT DISTINCT date, service_type FROM waitlist
+        WHERE notified_at IS NULL AND date >= ?
+    ''', (first_date,))
+    return cursor.fetchall()
+
+@timed_query
+def claim_waitlist(date, service, limit=WAITLIST_BATCH):
+    """Забрать пачку подписчиков под рассылку: [(id, chat_id)]
     
-    conn.close()
+    notified_at ставится до отправки - после перезапуска бота
+    уже разосланное не уйдет второй раз.
+    """
+    conn = get_write_connection()
+    with conn:
+        rows = conn.execute('''
+            SELECT id, chat_id FROM waitlist
+            WHERE date = ? AND service_type = ? AND notified_at IS NULL
+            ORDER BY id
+            LIMIT ?
+        ''', (date, service, limit)).fetchall()
+        conn.executemany(
+            "UPDATE waitlist SET notified_at = CURRENT_TIMESTAMP WHERE id = ?",
+            [(waitlist_id,) for waitlist_id, _ in rows]
+        )
+    return rows
+
+@timed_query
+def unclaim_waitlist(waitlist_ids):
+    """Вернуть в очередь тех, кому не удалось отправить из-за сети"""
+    conn = get_write_connection()
+    with conn:
+        conn.executemany(
+            "UPDATE waitlist SET notified_at = NULL WHERE id = ?",
+            [(waitlist_id,) for waitlist_id in waitlist_ids]
+        )
+
+@timed_query
+def get_pending_reminders():
+    """Все будущие записи, по которым остались напоминания - одним запросом по индексу"""
+    cursor = get_read_connection().cursor()
+    cursor.execute('''
+        SELECT id, date, time, reminders_sent FROM appointments
+        WHERE status = 'booked' AND date >= date('now') AND reminders_sent < ?
+    ''', (len(REMINDERS),))
+    return cursor.fetchall()
+
+@timed_query
+def claim_reminders(due):
+    """Отметить напоминания отправленными до отправки: [(id, этап)] -> [(id, этап, user_id, дата, время, услуга)]
     
-    return {
-        'total': total,
-        'free': free,
-        'booked': booked,
-        'services': service_stats
-    }
+    Отмененные записи и уже отправленные этапы отсеиваются.
+    """
+    conn = get_write_connection()
+    claimed = []
+    with conn:
+        for appointment_id, stage in due:
+            row = conn.execute('''
+                SELECT user_id, date, time, service_type FROM appointments
+                WHERE id = ? AND status = 'booked' AND reminders_sent <= ?
+            ''', (appointment_id, stage)).fetchone()
+            if row is None:
+                continue
+            conn.execute(
+                "UPDATE appointments SET reminders_sent = ? WHERE id = ?", (stage + 1, appointment_id)
+            )
+            claimed.append((appointment_id, stage, *row))
+    return claimed
+
+@timed_query
+def unclaim_reminders(failed):
+    """Вернуть этапы, которые не ушли из-за сети: [(id, этап)]"""
+    conn = get_write_connection()
+    with conn:
+        conn.executemany(
+            "UPDATE appointments SET reminders_sent = ? WHERE id = ? AND reminders_sent = ?",
+            [(stage, appointment_id, stage + 1) for appointment_id, stage in failed]
+        )
+
+@timed_query
+def load_persistence(kind):
+    """Сохраненные данные одного вида: [(ключ, pickle)]"""
+    cursor = get_read_connection().cursor()
+    cursor.execute("SELECT key, data FROM persistence WHERE kind = ?", (kind,))
+    return cursor.fetchall()
+
+@timed_query
+def save_persistence(rows, deleted):
+    """Записать измененные данные одной транзакцией"""
+    conn = get_write_connection()
+    with conn:
+        conn.executemany('''
+            INSERT INTO persistence (kind, key, data) VALUES (?, ?, ?)
+            ON CONFLICT(kind, key) DO UPDATE SET data = excluded.data
+        ''', rows)
+        conn.executemany("DELETE FROM persistence WHERE kind = ? AND key = ?", deleted)
 
 # ==================== КЛАВИАТУРЫ ====================
 def get_main_menu(user_id):
     """Главное меню"""
+    return _main_menu(user_id in ADMIN_IDS)
+
+@functools.lru_cache(maxsize=None)
+def _main_menu(is_admin):
+    """Главное меню строится один раз: для всех и для админа"""
     keyboard = [
         [InlineKeyboardButton("🎮 Свободные слоты", callback_data="view_slots")],
         [InlineKeyboardButton("📅 Записаться на чистку", callback_data="book")],
@@ -315,16 +1554,18 @@ def get_main_menu(user_id):
     ]
     
     # Если админ - добавляем кнопку
-    if user_id in ADMIN_IDS:
+    if is_admin:
         keyboard.append([InlineKeyboardButton("👑 ПАНЕЛЬ АДМИНА", callback_data="admin_panel")])
     
     return InlineKeyboardMarkup(keyboard)
 
+@functools.lru_cache(maxsize=None)
 def get_admin_menu():
-    """Меню админа"""
+    """Меню админа (строится один раз)"""
     keyboard = [
         [InlineKeyboardButton("📊 Статистика", callback_data="admin_stats")],
         [InlineKeyboardButton("📋 Все записи", callback_data="admin_all")],
+        [InlineKeyboardButton("📤 Выгрузить записи (CSV)", callback_data="admin_export")],
         [InlineKeyboardButton("🔄 Обновить расписание", callback_data="admin_refresh")],
         [InlineKeyboardButton("🏠 В главное меню", callback_data="back_main")]
     ]
@@ -332,12 +1573,16 @@ def get_admin_menu():
 
 def get_dates_keyboard(dates):
     """Клавиатура с датами"""
+    return _dates_keyboard(tuple(dates))
+
+@functools.lru_cache(maxsize=256)
+def _dates_keyboard(dates):
+    """Клавиатура строится заново, только когда меняется набор свободных дат"""
     keyboard = []
     
     for date_str in dates:
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        day_name = get_russian_day_name(date_obj.weekday())
-        button_text = f"{date_obj.strftime('%d.%m')} ({day_name[:3]})"
+        _, short_date, day_name = format_date(date_str)
+        button_text = f"{short_date} ({day_name[:3]})"
         
         keyboard.append([InlineKeyboardButton(button_text, callback_data=f"date_{date_str}")])
     
@@ -348,17 +1593,37 @@ def get_dates_keyboard(dates):
     
     return InlineKeyboardMarkup(keyboard)
 
-def get_times_keyboard(times, selected_date):
-    """Клавиатура со временем"""
+def get_dates_text(dates):
+    """Текст со списком свободных дат"""
+    return _dates_text(tuple(dates))
+
+@functools.lru_cache(maxsize=256)
+def _dates_text(dates):
+    dates_text = ""
+    for date_str in dates:
+        full_date, _, day_name = format_date(date_str)
+        dates_text += f"• *{full_date}* ({day_name})\n"
+    
+    return (
+        f"🎯 *Доступные даты для записи:*\n\n"
+        f"{dates_text}\n"
+        f"*Выбери дату и посмотрим свободное время:* ⤵️"
+    )
+
+def get_services_keyboard(services, selected_date):
+    """Клавиатура с услугами на дату"""
+    return _services_keyboard(tuple(services.items()), selected_date)
+
+@functools.lru_cache(maxsize=1024)
+def _services_keyboard(services, selected_date):
     keyboard = []
     
-    for time_str, service_code in times:
-        service_name, price, _ = get_service_info(service_code)
-        short_name = service_name.split()[1]
-        button_text = f"{time_str} - {short_name} ({price} 🪙)"
+    for service_code, count in services:
+        service = get_service_info(service_code)
+        button_text = f"{service.name} ({service.price} 🪙) · {count} вариантов"
         
         keyboard.append([
-            InlineKeyboardButton(button_text, callback_data=f"time_{selected_date}_{time_str}_{service_code}")
+            InlineKeyboardButton(button_text, callback_data=f"svc_{selected_date}_{service_code}")
         ])
     
     keyboard.append([
@@ -368,16 +1633,188 @@ def get_times_keyboard(times, selected_date):
     
     return InlineKeyboardMarkup(keyboard)
 
-def get_confirm_keyboard(date, time, service_code):
+def reschedule_suffix(reschedule_id):
+    """Хвост callback_data в режиме переноса: '_r<id записи>', иначе пусто
+    
+    Какую запись переносим, едет в самих кнопках, а не в user_data -
+    старая кнопка не превратит новую запись в перенос и наоборот.
+    """
+    return f"_r{reschedule_id}" if reschedule_id else ""
+
+def split_reschedule(data):
+    """'2026-10-19_basic_r42' -> ('2026-10-19_basic', 42); без хвоста - (data, None)"""
+    head, sep, tail = data.rpartition("_r")
+    if sep and tail.isdigit():
+        return head, int(tail)
+    return data, None
+
+def get_times_keyboard(times, selected_date, service_code, reschedule_id=None):
+    """Клавиатура со временем"""
+    return _times_keyboard(tuple(times), selected_date, service_code, reschedule_id)
+
+@functools.lru_cache(maxsize=1024)
+def _times_keyboard(times, selected_date, service_code, reschedule_id):
+    """Строится заново, только когда меняется свободное время на дату"""
+    keyboard = []
+    duration = SERVICES[service_code].minutes
+    suffix = reschedule_suffix(reschedule_id)
+    
+    for time_str, free in times:
+        end_str = format_minutes(to_minutes(time_str) + duration)
+        button_text = f"{time_str}–{end_str}"
+        if free > 1:
+            button_text += f" · мест: {free}"
+        
+        keyboard.append([
+            InlineKeyboardButton(button_text, callback_data=f"time_{selected_date}_{time_str}_{service_code}{suffix}")
+        ])
+    
+    if reschedule_id:
+        back = InlineKeyboardButton("◀️ Другие даты", callback_data=f"resched_{reschedule_id}")
+    else:
+        back = InlineKeyboardButton("◀️ Другие услуги", callback_data=f"date_{selected_date}")
+    keyboard.append([back, InlineKeyboardButton("🏠 В меню", callback_data="back_main")])
+    
+    return InlineKeyboardMarkup(keyboard)
+
+def get_confirm_keyboard(date, time, service_code, reschedule_id=None):
     """Подтверждение"""
     keyboard = [
         [
-            InlineKeyboardButton("✅ Да, записать!", callback_data=f"confirm_{date}_{time}_{service_code}"),
-            InlineKeyboardButton("❌ Отмена", callback_data="book")
+            InlineKeyboardButton(
+                "✅ Да, записать!",
+                callback_data=f"confirm_{date}_{time}_{service_code}{reschedule_suffix(reschedule_id)}"
+            ),
+            InlineKeyboardButton("❌ Отмена", callback_data=f"release_{date}_{time}")
         ]
     ]
     return InlineKeyboardMarkup(keyboard)
 
+# ==================== ОТПРАВКА ЭКРАНОВ ====================
+# Отпечаток последнего отправленного экрана для каждого сообщения.
+# Если пользователь жмет "🔄 Обновить", а ничего не поменялось - запрос не шлем.
+SCREEN_FINGERPRINTS_LIMIT = 10000
+_screen_fingerprints = collections.OrderedDict()   # (chat_id, message_id) -> хэш экрана
+
+async def edit_screen(query, text, reply_markup=None, parse_mode=None):
+    """edit_message_text, который пропускает правку без изменений"""
+    if query.message:
+        key = (query.message.chat_id, query.message.message_id)
+    else:
+        key = query.inline_message_id
+    fingerprint = hash((text, reply_markup, parse_mode))
+    
+    if _screen_fingerprints.get(key) == fingerprint:
+        EDITS_SAVED.inc("same_screen")
+        return
+    
+    try:
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+    except BadRequest as e:
+        # Экран совпал с тем, что отправили до перезапуска бота
+        if "message is not modified" not in str(e).lower():
+            raise
+        EDITS_SAVED.inc("not_modified")
+    
+    _screen_fingerprints[key] = fingerprint
+    _screen_fingerprints.move_to_end(key)
+    if len(_screen_fingerprints) > SCREEN_FINGERPRINTS_LIMIT:
+        _screen_fingerprints.popitem(last=False)
+
+# ==================== ГОТОВЫЕ ЭКРАНЫ ====================
+# Статичные тексты и клавиатуры собираются один раз при загрузке
+SERVICES_TEXT = (
+    "\n💎 *УСЛУГИ И ЦЕНЫ В ROBLOX 🪙*\n\n"
+    + "".join(
+        f"*{number}. {service.name.upper()} ({service.price} 🪙)*\n"
+        + "".join(f"• {item}\n" for item in service.details)
+        + "\n"
+        for number, service in enumerate(SERVICES.values(), 1)
+    )
+    + "*🎯 БОНУС: При записи на 2+ услуги - скидка 15%!*\n"
+)
+
+SERVICES_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🎮 Записаться", callback_data="book")],
+    [InlineKeyboardButton("📅 Слоты", callback_data="view_slots")],
+    [InlineKeyboardButton("🏠 В меню", callback_data="back_main")]
+])
+
+ABOUT_TEXT = """
+🏢 *ROBLOX BRAIN WASH SERVICE*
+
+*Наша миссия:* 
+Делаем геймеров лучше, чище и умнее! 🧠✨
+
+*Основатели:*
+• **Доктор Нейрочист** - главный специалист по чистке
+• **Профессор Логикон** - эксперт по исправлению багов  
+• **Мастер Скиллз** - тренер по прокачке
+• **Аватар-Док** - специалист по ремонту аватаров
+
+*Наши достижения:*
+✅ 10,000+ довольных геймеров
+✅ 99.7% успешных чисток
+✅ Средний рост скиллов: +47%
+✅ Лучший сервис 2024 по версии Roblox Times
+
+*Принципы работы:*
+1. 🤖 Только AI-технологии
+2. 🔒 Полная конфиденциальность  
+3. ⚡ Мгновенные результаты
+4. 🎮 Интеграция с Roblox API
+
+*Отзывы геймеров:*
+"После чистки стал топом в BedWars!" - NoobMaster69
+"Наконец-то понимаю шутки в чате!" - ProGamer228
+"Мой аватар теперь не кринжовый!" - CoolAvatarGirl
+
+*Присоединяйся к комьюнити!* 🚀
+    """
+
+ABOUT_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("💎 Услуги", callback_data="services")],
+    [InlineKeyboardButton("🎮 Записаться", callback_data="book")],
+    [InlineKeyboardButton("🏠 В меню", callback_data="back_main")]
+])
+
+CONTACTS_TEXT = """
+📞 *КОНТАКТЫ И ПОДДЕРЖКА*
+
+*🎮 Основной сервер:*
+Roblox → Поиск → «Brain Clean HQ»
+Или прямая ссылка: roblox.com/games/brain-clean
+
+*💬 Техподдержка:*
+• Telegram: @RobloxProCleaner
+• Discord: discord.gg/robloxclean
+• VK: vk.com/robloxbrainwash
+• Instagram: @roblox.clean.service
+
+*📧 Почта:*
+• Для записи: booking@robloxclean.com
+• Для жалоб: abuse@robloxclean.com  
+• Для сотрудничества: partners@robloxclean.com
+
+*⏰ Часы работы сервиса:*
+Круглосуточно 24/7 🕛
+(Но записи только в рабочее время)
+
+*🚨 Экстренная помощь:*
+Если случился когнитивный краш или
+ментальный лаг - пиши @RobloxEmergency
+
+*💰 Партнерская программа:*
+Приведи друга - получи 200 🪙 на счет!
+Подробности: @RobloxPartnersBot
+    """
+
+CONTACTS_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🎮 Записаться", callback_data="book")],
+    [InlineKeyboardButton("💎 Услуги", callback_data="services")],
+    [InlineKeyboardButton("🏠 В меню", callback_data="back_main")]
+])
+
 # ==================== ОБРАБОТЧИКИ ====================
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /start"""
@@ -404,7 +1841,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Инициализация БД
     if 'db_initialized' not in context.bot_data:
-        init_database()
+        await run_db_write(init_database)
         context.bot_data['db_initialized'] = True
     
     await update.message.reply_text(
@@ -418,75 +1855,119 @@ async def view_slots(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    available_dates = get_available_dates()
+    available_dates = availability.dates()
     
     if not available_dates:
-        await query.edit_message_text(
+        await edit_screen(
+            query,
             "😔 *На этой неделе все слоты заняты!*\n\n"
             "Но не расстраивайся! Можешь:\n"
-            "1️⃣ Подписаться на уведомления о новых слотах\n"
+            "1️⃣ Выбрать дату и подписаться на уведомления\n"
             "2️⃣ Написать нашему администратору @RobloxProCleaner\n"
             "3️⃣ Попробовать зайти позже\n\n"
             "*Скоро будут новые слоты!* ⚡",
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("🔄 Проверить снова", callback_data="view_slots")],
-                [InlineKeyboardButton("🏠 В меню", callback_data="back_main")]
-            ]),
+            reply_markup=get_dates_keyboard(upcoming_dates()),
             parse_mode='Markdown'
         )
         return
     
-    # Форматируем даты
-    dates_text = ""
-    for date_str in available_dates:
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        day_name = get_russian_day_name(date_obj.weekday())
-        dates_text += f"• *{date_obj.strftime('%d.%m.%Y')}* ({day_name})\n"
-    
-    await query.edit_message_text(
-        f"🎯 *Доступные даты для записи:*\n\n"
-        f"{dates_text}\n"
-        f"*Выбери дату и посмотрим свободное время:* ⤵️",
+    await edit_screen(
+        query,
+        get_dates_text(available_dates),
         reply_markup=get_dates_keyboard(available_dates),
         parse_mode='Markdown'
     )
 
+async def show_date_closed(query):
+    """Кнопка из старого сообщения с датой, на которую запись уже закрыта"""
+    await edit_screen(
+        query,
+        "⌛ *Запись на эту дату уже закрыта!*\n\n"
+        "*Выбери другую дату:* ⤵️",
+        reply_markup=get_dates_keyboard(availability.dates()),
+        parse_mode='Markdown'
+    )
+
 async def select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Выбор даты"""
+    """Выбор даты - дальше выбор услуги"""
     query = update.callback_query
     await query.answer()
     
     date_str = query.data.replace("date_", "")
-    date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-    day_name = get_russian_day_name(date_obj.weekday())
+    if not is_open_date(date_str):
+        await show_date_closed(query)
+        return
+    full_date, _, day_name = format_date(date_str)
     
-    available_times = get_available_times(date_str)
+    available_services = availability.services(date_str)
     
-    if not available_times:
-        await query.edit_message_text(
-            f"📅 *{date_obj.strftime('%d.%m.%Y')} ({day_name})*\n\n"
+    if not available_services:
+        await edit_screen(
+            query,
+            f"📅 *{full_date} ({day_name})*\n\n"
             "😅 *Все слоты на эту дату уже заняты!*\n\n"
             "Геймеры быстро разбирают лучшие время!\n"
-            "Попробуй другую дату:",
-            reply_markup=get_dates_keyboard(get_available_dates()),
+            "Подпишись на услугу - напишем, как только освободится.\n"
+            "Или попробуй другую дату:",
+            reply_markup=InlineKeyboardMarkup(
+                [
+                    [InlineKeyboardButton(f"🔔 {service.name}", callback_data=f"wait_{date_str}_{service.code}")]
+                    for service in SERVICES.values()
+                ] + list(get_dates_keyboard(availability.dates()).inline_keyboard)
+            ),
             parse_mode='Markdown'
         )
         return
     
-    # Статистика по услугам
-    service_stats = {}
-    for _, service_code in available_times:
-        service_name, price, _ = get_service_info(service_code)
-        short_name = service_name.split()[1]
-        service_stats[short_name] = service_stats.get(short_name, 0) + 1
+    await edit_screen(
+        query,
+        f"📅 *{full_date} ({day_name})*\n\n"
+        f"*Выбери услугу:* ⤵️",
+        reply_markup=get_services_keyboard(available_services, date_str),
+        parse_mode='Markdown'
+    )
+
+async def select_service(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Выбор услуги - показываем свободное время под ее длительность"""
+    query = update.callback_query
+    await query.answer()
+    
+    data, reschedule_id = split_reschedule(query.data.replace("svc_", ""))
+    date_str, service_code = data.split("_", 1)
+    if not is_open_date(date_str):
+        await show_date_closed(query)
+        return
+    full_date, _, day_name = format_date(date_str)
+    service = get_service_info(service_code)
+    
+    available_times = availability.times(date_str, service_code)
     
-    stats_text = "\n".join([f"• {name}: {count} слотов" for name, count in service_stats.items()])
+    if not available_times:
+        if reschedule_id:
+            other = [[InlineKeyboardButton("◀️ Другие даты", callback_data=f"resched_{reschedule_id}")]]
+        else:
+            other = list(get_services_keyboard(availability.services(date_str), date_str).inline_keyboard)
+        await edit_screen(
+            query,
+            f"📅 *{full_date} ({day_name})*\n\n"
+            f"😅 *На {service.name} свободного времени уже нет!*\n\n"
+            "Подпишись - напишем, как только освободится.\n"
+            f"Или выбери {'другую дату' if reschedule_id else 'другую услугу'}:",
+            reply_markup=InlineKeyboardMarkup(
+                [[InlineKeyboardButton("🔔 Сообщить, когда освободится", callback_data=f"wait_{date_str}_{service_code}")]]
+                + other
+            ),
+            parse_mode='Markdown'
+        )
+        return
     
-    await query.edit_message_text(
-        f"⏰ *Свободные слоты на {date_obj.strftime('%d.%m.%Y')} ({day_name}):*\n\n"
-        f"📊 *Доступные услуги:*\n{stats_text}\n\n"
+    await edit_screen(
+        query,
+        f"⏰ *{service.name} на {full_date} ({day_name}):*\n\n"
+        f"⏳ Длительность: {service.minutes} минут\n"
+        f"💰 Стоимость: {service.price} 🪙\n\n"
         f"*Выбери удобное время:* ⤵️",
-        reply_markup=get_times_keyboard(available_times, date_str),
+        reply_markup=get_times_keyboard(available_times, date_str, service_code, reschedule_id),
         parse_mode='Markdown'
     )
 
@@ -495,49 +1976,66 @@ async def select_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    data = query.data.replace("time_", "")
+    data, reschedule_id = split_reschedule(query.data.replace("time_", ""))
     date_str, time_str, service_code = data.split("_", 2)
+    user = query.from_user
+    
+    # Сразу придерживаем слот, чтобы его не увели, пока пользователь читает
+    if not await run_db_write(hold_slot, date_str, time_str, service_code, user.id):
+        await edit_screen(
+            query,
+            "😱 *Этот слот только что заняли!*\n\n"
+            "Выбери другое время пока оно свободно!",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton(
+                    "📅 Выбрать дату", callback_data=f"resched_{reschedule_id}" if reschedule_id else "book"
+                )],
+                [InlineKeyboardButton("🏠 В меню", callback_data="back_main")]
+            ]),
+            parse_mode='Markdown'
+        )
+        return
+    
+    context.job_queue.run_once(
+        expire_hold_job,
+        timedelta(minutes=HOLD_MINUTES, seconds=5),
+        data=(date_str, time_str, user.id),
+        name=f"hold_{date_str}_{time_str}"
+    )
     
     context.user_data['selected_time'] = time_str
     context.user_data['selected_service'] = service_code
     
-    date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-    day_name = get_russian_day_name(date_obj.weekday())
-    service_name, price, description = get_service_info(service_code)
-    
-    # Угарные названия услуг
-    service_titles = {
-        'basic': "🧹 *Базовая чистка чата*",
-        'deep': "🌀 *Глубокая очистка от нообов*", 
-        'express': "⚡ *Экспресс-фикс багов*",
-        'vip': "👑 *VIP разблокировка*",
-        'pro': "🎮 *Прокачка скиллов*",
-        'avatar': "🔧 *Ремонт аватара*"
-    }
+    full_date, _, day_name = format_date(date_str)
+    service = get_service_info(service_code)
     
     confirmation_text = f"""
-{service_titles.get(service_code, '🎯 *Запись на процедуру*')}
+*{service.name}*
 
-*📅 Дата:* {date_obj.strftime('%d.%m.%Y')} ({day_name})
+*📅 Дата:* {full_date} ({day_name})
 *⏰ Время:* {time_str}
-*💰 Стоимость:* {price} 🪙 (робуксов)
+*💰 Стоимость:* {service.price} 🪙 (робуксов)
 
 *📝 Что входит:*
-{description}
+{service.description}
 
 *📍 Локация проведения:*
 Сервер **«Brain Clean HQ»**
 Карта: **«Cleaning Facility»**
 Портал: **#clean-zone-315**
 
-*⏳ Длительность сеанса:* 45-60 минут
+*⏳ Длительность сеанса:* {service.minutes} минут
+
+🔒 _Слот закреплен за тобой на {HOLD_MINUTES} минут_
+{"🔁 _После подтверждения старая запись освободится_" if reschedule_id else ""}
 
 *Готов к чистке?* 🤖✨
     """
     
-    await query.edit_message_text(
+    await edit_screen(
+        query,
         confirmation_text,
-        reply_markup=get_confirm_keyboard(date_str, time_str, service_code),
+        reply_markup=get_confirm_keyboard(date_str, time_str, service_code, reschedule_id),
         parse_mode='Markdown'
     )
 
@@ -546,27 +2044,37 @@ async def confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    data = query.data.replace("confirm_", "")
+    data, reschedule_id = split_reschedule(query.data.replace("confirm_", ""))
     date_str, time_str, service_code = data.split("_", 2)
     
     user = query.from_user
     user_name = user.full_name or user.first_name
     
-    success = book_appointment(date_str, time_str, user.id, user_name)
+    if reschedule_id is not None:
+        booking = await run_db_write(reschedule_appointment, reschedule_id, date_str, time_str, service_code, user.id)
+        if booking:
+            notify_waitlist(context.job_queue)
+        title = "🔁 *ЗАПИСЬ ПЕРЕНЕСЕНА! LET'S GOOO!* 🚀"
+    else:
+        booking = await run_db_write(book_appointment, date_str, time_str, service_code, user.id, user_name)
+        title = "🎉 *ТЫ ЗАПИСАН! LET'S GOOO!* 🚀"
+    BOOKINGS.inc("success" if booking else "failure")
     
-    if success:
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        day_name = get_russian_day_name(date_obj.weekday())
-        service_name, price, _ = get_service_info(service_code)
+    if booking:
+        appointment_id, specialist = booking
+        reminders.schedule(appointment_id, date_str, time_str)
+        
+        full_date, _, day_name = format_date(date_str)
+        service = get_service_info(service_code)
         
         success_text = f"""
-🎉 *ТЫ ЗАПИСАН! LET'S GOOO!* 🚀
+{title}
 
 *🎮 Детали записи:*
-• Услуга: {service_name}
-• Дата: {date_obj.strftime('%d.%m.%Y')} ({day_name})
+• Услуга: {service.name}
+• Дата: {full_date} ({day_name})
 • Время: {time_str}
-• Стоимость: {price} 🪙
+• Стоимость: {service.price} 🪙
 • Твой ник: {user_name}
 • ID записи: `{date_str}_{time_str}`
 
@@ -574,7 +2082,7 @@ async def confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
 1. Зайди в Roblox
 2. Найди сервер **«Brain Clean HQ»**
 3. Используй код доступа: **#clean-{date_str.replace('-', '')}**
-4. Подойди к NPC с именем **«Доктор Нейрочист»**
+4. Подойди к NPC с именем **«{specialist}»**
 
 *📱 Наши контакты:*
 • Админ: @RobloxProCleaner
@@ -583,45 +2091,275 @@ async def confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 *⚠️ Важно:*
 • Приходи за 5-10 минут до начала
-• Имей свободные 60 минут
+• Напомним за сутки и за час до начала
+• Имей свободные {service.minutes} минут
 • Бери с собой хорошее настроение!
 
-*Удачи в прокачке мозга!* 🧠⚡
-        """
+*Удачи в прокачке мозга!* 🧠⚡
+        """
+        
+        keyboard = [
+            [InlineKeyboardButton("📋 Мои записи", callback_data="my_bookings")],
+            [InlineKeyboardButton("🎮 Еще записаться", callback_data="book")],
+            [InlineKeyboardButton("🏠 В меню", callback_data="back_main")]
+        ]
+        
+        await edit_screen(
+            query,
+            success_text,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+    else:
+        await edit_screen(
+            query,
+            "😱 *ОШИБКА! Этот слот уже занят!*\n\n"
+            "Кто-то опередил тебя! 😅\n"
+            "Выбери другое время пока оно свободно!",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("📅 Выбрать дату", callback_data="book")],
+                [InlineKeyboardButton("🏠 В меню", callback_data="back_main")]
+            ]),
+            parse_mode='Markdown'
+        )
+
+async def reload_availability_job(context: ContextTypes.DEFAULT_TYPE):
+    """Ночная перезагрузка движка: прошедшие дни больше не держим в памяти"""
+    bookings = await run_db_write(load_availability)
+    logger.info(f"📅 Свободное время пересчитано: {bookings} броней впереди")
+    
+    # В горизонт записи вошел новый день
+    notify_waitlist(context.job_queue)
+
+async def retention_job(context: ContextTypes.DEFAULT_TYPE):
+    """Ночное обслуживание базы: архив старых записей, возврат места, PRAGMA optimize
+    
+    Каждая пачка - отдельная задача писателя, так что бронирования
+    проходят между пачками и не ждут всю архивацию.
+    """
+    started = time.perf_counter()
+    cutoff = (datetime.now() - timedelta(days=ARCHIVE_AFTER_DAYS)).strftime("%Y-%m-%d")
+    
+    archived = 0
+    while moved := await run_db_write(archive_batch, cutoff):
+        archived += moved
+    
+    freed = 0
+    while True:
+        step, left = await run_db_write(vacuum_step)
+        freed += step
+        if not step or not left:
+            break
+    
+    await run_db_write(optimize_database)
+    logger.info(f"🗄 Архивировано записей до {cutoff}: {archived}, освобождено страниц: {freed}, "
+                f"за {time.perf_counter() - started:.1f} с")
+
+# ==================== ЛИСТ ОЖИДАНИЯ ====================
+def notify_waitlist(job_queue):
+    """Разослать лист ожидания сейчас, не дожидаясь плановой проверки"""
+    job_queue.run_once(waitlist_job, 0, name="waitlist_now")
+
+async def waitlist_job(context: ContextTypes.DEFAULT_TYPE):
+    """Сообщить подписчикам, что на их дату и услугу появилось время
+    
+    Рассылка идет пачками по WAITLIST_BATCH через полосу BULK лимитера.
+    Кому не ушло из-за сети - вернутся в очередь к следующей проверке.
+    """
+    for date_str, service_code in await run_db_read(get_waitlist_slots, upcoming_dates()[0]):
+        if not availability.times(date_str, service_code):
+            continue
+        
+        full_date, _, day_name = format_date(date_str)
+        service = get_service_info(service_code)
+        text = (
+            f"🔔 *Освободилось время!*\n\n"
+            f"{service.name} ({service.price} 🪙)\n"
+            f"📅 {full_date} ({day_name})\n\n"
+            "Успей записаться, пока не заняли! ⚡"
+        )
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("⏰ Выбрать время", callback_data=f"svc_{date_str}_{service_code}")],
+            [InlineKeyboardButton("🏠 В меню", callback_data="back_main")]
+        ])
+        
+        sent = 0
+        retry = []
+        while True:
+            batch = await run_db_write(claim_waitlist, date_str, service_code)
+            if not batch:
+                break
+            
+            results = await asyncio.gather(*(
+                context.bot.send_message(chat_id, text, reply_markup=keyboard, parse_mode='Markdown', rate_limit_args=BULK)
+                for _, chat_id in batch
+            ), return_exceptions=True)
+            
+            # BadRequest/Forbidden (чат удален, бот заблокирован) повторять бесполезно
+            failed = [
+                waitlist_id for (waitlist_id, _), result in zip(batch, results)
+                if isinstance(result, (NetworkError, RetryAfter)) and not isinstance(result, BadRequest)
+            ]
+            sent += len(batch) - len(failed)
+            retry += failed
+            
+            # Пока рассылали, время могли уже занять
+            if not availability.times(date_str, service_code):
+                break
+        
+        # Возвращаем в очередь только в конце, иначе та же пачка взялась бы снова
+        if retry:
+            await run_db_write(unclaim_waitlist, retry)
+        if sent:
+            logger.info(f"🔔 Лист ожидания {date_str} {service_code}: уведомлено {sent}")
+
+async def join_waitlist(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Подписка на освобождение времени"""
+    query = update.callback_query
+    
+    data = query.data.replace("wait_", "")
+    date_str, service_code = data.split("_", 1)
+    chat_id = query.message.chat_id if query.message else query.from_user.id
+    
+    if not is_open_date(date_str):
+        await query.answer("⌛ Запись на эту дату уже закрыта")
+        return
+    
+    await run_db_write(add_to_waitlist, query.from_user.id, chat_id, date_str, service_code)
+    
+    _, short_date, _ = format_date(date_str)
+    await query.answer(f"🔔 Напишем, как только на {short_date} освободится время!")
+
+# ==================== НАПОМИНАНИЯ ====================
+class ReminderQueue:
+    """Все будущие напоминания в одной куче по времени отправки
+    
+    Один повторяющийся job снимает с вершины то, что пора отправить, -
+    без отдельного таймера на каждую запись. Отмены из кучи не удаляются:
+    отмененная или перенесенная запись отсеется в claim_reminders.
+    """
+    
+    def __init__(self):
+        self._heap = []             # (когда отправить, id записи, этап REMINDERS)
+    
+    def __len__(self):
+        return len(self._heap)
+    
+    @staticmethod
+    def _entries(appointment_id, date, time_str, sent=0):
+        start = datetime.fromisoformat(f"{date} {time_str}")
+        now = datetime.now()
+        for stage in range(sent, len(REMINDERS)):
+            due = start - REMINDERS[stage][0]
+            # Запись сделали позже этапа или бот долго лежал: «Уже завтра» за 3 часа до начала не шлем
+            if due + REMINDER_GRACE < now:
+                continue
+            # Если уже пора следующий этап, этот устарел - не шлем
+            next_due = start - REMINDERS[stage + 1][0] if stage + 1 < len(REMINDERS) else start
+            if next_due > now:
+                yield due.timestamp(), appointment_id, stage
+    
+    def load(self, rows):
+        """Собрать кучу заново из базы: [(id, дата, время, отправлено этапов)]"""
+        self._heap = [entry for row in rows for entry in self._entries(*row)]
+        heapq.heapify(self._heap)
+    
+    def schedule(self, appointment_id, date, time_str):
+        """Напоминания для новой записи"""
+        for entry in self._entries(appointment_id, date, time_str):
+            heapq.heappush(self._heap, entry)
+    
+    def retry(self, items, delay):
+        """Повторить [(id, этап)] через delay секунд"""
+        due = time.time() + delay
+        for appointment_id, stage in items:
+            heapq.heappush(self._heap, (due, appointment_id, stage))
+    
+    def pop_due(self, limit):
+        """До limit напоминаний, которым пора: [(id, этап)]"""
+        now = time.time()
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < limit:
+            _, appointment_id, stage = heapq.heappop(self._heap)
+            due.append((appointment_id, stage))
+        return due
+
+reminders = ReminderQueue()
+
+REMINDER_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📋 Мои записи", callback_data="my_bookings")],
+    [InlineKeyboardButton("🏠 В меню", callback_data="back_main")]
+])
+
+async def reminder_job(context: ContextTypes.DEFAULT_TYPE):
+    """Отправить напоминания, которым пора, пачками через полосу BULK"""
+    while True:
+        due = reminders.pop_due(REMINDER_BATCH)
+        if not due:
+            break
         
-        keyboard = [
-            [InlineKeyboardButton("📋 Мои записи", callback_data="my_bookings")],
-            [InlineKeyboardButton("🎮 Еще записаться", callback_data="book")],
-            [InlineKeyboardButton("🏠 В меню", callback_data="back_main")]
+        claimed = await run_db_write(claim_reminders, due)
+        messages = []
+        for appointment_id, stage, user_id, date_str, time_str, service_code in claimed:
+            full_date, _, day_name = format_date(date_str)
+            text = (
+                f"⏰ *{REMINDERS[stage][1]} твоя запись!*\n\n"
+                f"{get_service_info(service_code).name}\n"
+                f"📅 {full_date} ({day_name}) в {time_str}\n\n"
+                "Приходи за 5-10 минут до начала! 🎮"
+            )
+            messages.append(context.bot.send_message(
+                user_id, text, reply_markup=REMINDER_KEYBOARD, parse_mode='Markdown', rate_limit_args=BULK
+            ))
+        results = await asyncio.gather(*messages, return_exceptions=True)
+        
+        failed = [
+            (appointment_id, stage) for (appointment_id, stage, *_), result in zip(claimed, results)
+            if isinstance(result, (NetworkError, RetryAfter)) and not isinstance(result, BadRequest)
         ]
+        if failed:
+            await run_db_write(unclaim_reminders, failed)
+            reminders.retry(failed, REMINDER_TICK)
         
-        await query.edit_message_text(
-            success_text,
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode='Markdown'
-        )
-    else:
-        await query.edit_message_text(
-            "😱 *ОШИБКА! Этот слот уже занят!*\n\n"
-            "Кто-то опередил тебя! 😅\n"
-            "Выбери другое время пока оно свободно!",
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("📅 Выбрать дату", callback_data="book")],
-                [InlineKeyboardButton("🏠 В меню", callback_data="back_main")]
-            ]),
-            parse_mode='Markdown'
-        )
+        if len(claimed) > len(failed):
+            logger.info(f"⏰ Отправлено напоминаний: {len(claimed) - len(failed)}")
+
+async def release_slot(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отказ от выбранного слота"""
+    query = update.callback_query
+    
+    data = query.data.replace("release_", "")
+    date_str, time_str = data.split("_", 1)
+    
+    if await run_db_write(release_hold, date_str, time_str, query.from_user.id):
+        notify_waitlist(context.job_queue)
+    
+    # Дальше как "Записаться": view_slots сам ответит на callback
+    await view_slots(update, context)
+
+async def expire_hold_job(context: ContextTypes.DEFAULT_TYPE):
+    """Снять временную бронь, если пользователь так и не подтвердил"""
+    date_str, time_str, user_id = context.job.data
+    if await run_db_write(release_hold, date_str, time_str, user_id, expired_only=True):
+        logger.info(f"⌛ Бронь {date_str} {time_str} истекла")
+        notify_waitlist(context.job_queue)
 
 async def my_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Мои записи"""
     query = update.callback_query
     await query.answer()
     
+    await show_bookings(query)
+
+async def show_bookings(query, notice=""):
+    """Экран с записями пользователя и кнопками отмены/переноса"""
     user_id = query.from_user.id
-    appointments = get_user_appointments(user_id)
+    appointments = await run_db_read(get_user_appointments, user_id)
     
     if not appointments:
-        await query.edit_message_text(
+        await edit_screen(
+            query,
+            notice +
             "📭 *У тебя пока нет записей!*\n\n"
             "Хочешь прокачать свой мозг в Roblox? 🎮\n"
             "Запишись на чистку и стань про-геймером! ⚡",
@@ -634,86 +2372,101 @@ async def my_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
-    bookings_text = "📋 *Твои активные записи:*\n\n"
+    bookings_text = notice + "📋 *Твои активные записи:*\n\n"
+    keyboard = []
     
-    for i, (date_str, time_str, service_code, created_at) in enumerate(appointments, 1):
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        day_name = get_russian_day_name(date_obj.weekday())
-        service_name, price, _ = get_service_info(service_code)
+    for i, appointment in enumerate(appointments, 1):
+        full_date, short_date, day_name = format_date(appointment.date)
+        service = appointment.service
         
-        bookings_text += f"*{i}. {service_name}*\n"
-        bookings_text += f"   📅 {date_obj.strftime('%d.%m.%Y')} ({day_name[:3]})\n"
-        bookings_text += f"   ⏰ {time_str} | 💰 {price} 🪙\n"
-        bookings_text += f"   🆔 `{date_str}_{time_str}`\n\n"
-    
-    bookings_text += "*Для отмены напиши:* @RobloxProCleaner"
+        bookings_text += f"*{i}. {service.name}*\n"
+        bookings_text += f"   📅 {full_date} ({day_name[:3]})\n"
+        bookings_text += f"   ⏰ {appointment.time} | 💰 {service.price} 🪙\n"
+        bookings_text += f"   🆔 `{appointment.date}_{appointment.time}`\n\n"
+        
+        keyboard.append([
+            InlineKeyboardButton(f"❌ Отменить {short_date} {appointment.time}", callback_data=f"cancel_{appointment.id}"),
+            InlineKeyboardButton("🔁 Перенести", callback_data=f"resched_{appointment.id}")
+        ])
     
-    keyboard = [
+    keyboard += [
         [InlineKeyboardButton("🎮 Новая запись", callback_data="book")],
         [InlineKeyboardButton("📅 Свободные слоты", callback_data="view_slots")],
         [InlineKeyboardButton("🏠 В меню", callback_data="back_main")]
     ]
     
-    await query.edit_message_text(
+    await edit_screen(
+        query,
         bookings_text,
         reply_markup=InlineKeyboardMarkup(keyboard),
         parse_mode='Markdown'
     )
 
+async def cancel_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отмена записи из "Моих записей" """
+    query = update.callback_query
+    appointment_id = int(query.data.replace("cancel_", ""))
+    
+    cancelled = await run_db_write(cancel_appointment, appointment_id, query.from_user.id)
+    
+    if cancelled:
+        date_str, time_str = cancelled
+        _, short_date, _ = format_date(date_str)
+        logger.info(f"🗑 Отмена записи {date_str} {time_str}")
+        notify_waitlist(context.job_queue)
+        await query.answer(f"Запись на {short_date} {time_str} отменена")
+        await show_bookings(query, f"✅ *Запись на {short_date} в {time_str} отменена*\n\n")
+    else:
+        await query.answer("Эту запись уже нельзя отменить")
+        await show_bookings(query)
+
+async def reschedule_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Перенос записи: выбор новой даты для той же услуги"""
+    query = update.callback_query
+    await query.answer()
+    
+    appointment_id = int(query.data.replace("resched_", ""))
+    appointments = await run_db_read(get_user_appointments, query.from_user.id)
+    appointment = next((row for row in appointments if row.id == appointment_id), None)
+    
+    if appointment is None:
+        await show_bookings(query)
+        return
+    
+    service_code = appointment.service_type
+    _, old_short_date, _ = format_date(appointment.date)
+    
+    # Дальше обычный путь: время -> бронь -> подтверждение, которое перенесет запись.
+    # Id переносимой записи едет в callback_data всех этих кнопок
+    suffix = reschedule_suffix(appointment_id)
+    keyboard = []
+    for date_str in availability.dates():
+        if availability.times(date_str, service_code):
+            _, short_date, day_name = format_date(date_str)
+            keyboard.append([
+                InlineKeyboardButton(f"{short_date} ({day_name[:3]})", callback_data=f"svc_{date_str}_{service_code}{suffix}")
+            ])
+    keyboard.append([InlineKeyboardButton("◀️ Мои записи", callback_data="my_bookings")])
+    
+    await edit_screen(
+        query,
+        f"🔁 *Перенос записи*\n\n"
+        f"{appointment.service.name}, сейчас: {old_short_date} в {appointment.time}\n\n"
+        f"*Выбери новую дату:* ⤵️\n"
+        f"_Старое время освободится, только когда новое будет за тобой_",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode='Markdown'
+    )
+
 async def show_services(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Услуги и цены"""
     query = update.callback_query
     await query.answer()
     
-    services_text = """
-💎 *УСЛУГИ И ЦЕНЫ В ROBLOX 🪙*
-
-*1. 🧹 БАЗОВАЯ ЧИСТКА ЧАТА (500 🪙)*
-• Удаление спама и флуда
-• Чистка друзей-токсиков  
-• Настройка приватности
-• Базовая защита
-
-*2. 🌀 ОЧИСТКА ОТ НООБОВ (1200 🪙)*
-• Полное удаление нообского мышления
-• Установка про-логики
-• Апгрейд скиллов принятия решений
-• Защита от кринжа
-
-*3. ⚡ ЭКСПРЕСС-ФИКС БАГОВ (300 🪙)*
-• Срочное исправление логических ошибок
-• Починка когнитивных функций
-• Быстрая помощь при лагах
-• Экстренная перезагрузка
-
-*4. 👑 VIP РАЗБЛОКИРОВКА (2500 🪙)*
-• Доступ к скрытым возможностям
-• Премиум настройки мозга
-• Эксклюзивные анимации
-• Личный помощник-бот
-
-*5. 🎮 ПРОКАЧКА СКИЛЛОВ (1800 🪙)*
-• Повышение уровня реакции
-• Изучение продвинутых механик
-• Тренировка стратегического мышления
-• Гайды от топ-геймеров
-
-*6. 🔧 РЕМОНТ АВАТАРА (800 🪙)*
-• Починка сломанных эмоций
-• Настройка анимаций личности
-• Новые аксессуары для ума
-• Кастомизация поведения
-
-*🎯 БОНУС: При записи на 2+ услуги - скидка 15%!*
-    """
-    
-    await query.edit_message_text(
-        services_text,
-        reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("🎮 Записаться", callback_data="book")],
-            [InlineKeyboardButton("📅 Слоты", callback_data="view_slots")],
-            [InlineKeyboardButton("🏠 В меню", callback_data="back_main")]
-        ]),
+    await edit_screen(
+        query,
+        SERVICES_TEXT,
+        reply_markup=SERVICES_KEYBOARD,
         parse_mode='Markdown'
     )
 
@@ -722,45 +2475,10 @@ async def about_service(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    about_text = """
-🏢 *ROBLOX BRAIN WASH SERVICE*
-
-*Наша миссия:* 
-Делаем геймеров лучше, чище и умнее! 🧠✨
-
-*Основатели:*
-• **Доктор Нейрочист** - главный специалист по чистке
-• **Профессор Логикон** - эксперт по исправлению багов  
-• **Мастер Скиллз** - тренер по прокачке
-• **Аватар-Док** - специалист по ремонту аватаров
-
-*Наши достижения:*
-✅ 10,000+ довольных геймеров
-✅ 99.7% успешных чисток
-✅ Средний рост скиллов: +47%
-✅ Лучший сервис 2024 по версии Roblox Times
-
-*Принципы работы:*
-1. 🤖 Только AI-технологии
-2. 🔒 Полная конфиденциальность  
-3. ⚡ Мгновенные результаты
-4. 🎮 Интеграция с Roblox API
-
-*Отзывы геймеров:*
-"После чистки стал топом в BedWars!" - NoobMaster69
-"Наконец-то понимаю шутки в чате!" - ProGamer228
-"Мой аватар теперь не кринжовый!" - CoolAvatarGirl
-
-*Присоединяйся к комьюнити!* 🚀
-    """
-    
-    await query.edit_message_text(
-        about_text,
-        reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("💎 Услуги", callback_data="services")],
-            [InlineKeyboardButton("🎮 Записаться", callback_data="book")],
-            [InlineKeyboardButton("🏠 В меню", callback_data="back_main")]
-        ]),
+    await edit_screen(
+        query,
+        ABOUT_TEXT,
+        reply_markup=ABOUT_KEYBOARD,
         parse_mode='Markdown'
     )
 
@@ -769,44 +2487,10 @@ async def show_contacts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    contacts_text = """
-📞 *КОНТАКТЫ И ПОДДЕРЖКА*
-
-*🎮 Основной сервер:*
-Roblox → Поиск → «Brain Clean HQ»
-Или прямая ссылка: roblox.com/games/brain-clean
-
-*💬 Техподдержка:*
-• Telegram: @RobloxProCleaner
-• Discord: discord.gg/robloxclean
-• VK: vk.com/robloxbrainwash
-• Instagram: @roblox.clean.service
-
-*📧 Почта:*
-• Для записи: booking@robloxclean.com
-• Для жалоб: abuse@robloxclean.com  
-• Для сотрудничества: partners@robloxclean.com
-
-*⏰ Часы работы сервиса:*
-Круглосуточно 24/7 🕛
-(Но записи только в рабочее время)
-
-*🚨 Экстренная помощь:*
-Если случился когнитивный краш или
-ментальный лаг - пиши @RobloxEmergency
-
-*💰 Партнерская программа:*
-Приведи друга - получи 200 🪙 на счет!
-Подробности: @RobloxPartnersBot
-    """
-    
-    await query.edit_message_text(
-        contacts_text,
-        reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("🎮 Записаться", callback_data="book")],
-            [InlineKeyboardButton("💎 Услуги", callback_data="services")],
-            [InlineKeyboardButton("🏠 В меню", callback_data="back_main")]
-        ]),
+    await edit_screen(
+        query,
+        CONTACTS_TEXT,
+        reply_markup=CONTACTS_KEYBOARD,
         parse_mode='Markdown'
     )
 
@@ -818,10 +2502,11 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user = query.from_user
     if user.id not in ADMIN_IDS:
-        await query.edit_message_text("🚫 Ты не админ!")
+        await edit_screen(query, "🚫 Ты не админ!")
         return
     
-    await query.edit_message_text(
+    await edit_screen(
+        query,
         "👑 *ПАНЕЛЬ АДМИНИСТРАТОРА ROBLOX BRAIN WASH*\n\n"
         "*Доступные команды:*",
         reply_markup=get_admin_menu(),
@@ -835,158 +2520,266 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user = query.from_user
     if user.id not in ADMIN_IDS:
-        await query.edit_message_text("🚫 Нет доступа!")
+        await edit_screen(query, "🚫 Нет доступа!")
         return
     
-    stats = get_stats()
+    busy_minutes, work_minutes = availability.utilization(upcoming_dates())
+    
+    # Последние 4 недели и следующая
+    today = datetime.now()
+    weeks = list(dict.fromkeys(
+        week_of((today + timedelta(weeks=offset)).strftime("%Y-%m-%d")) for offset in range(-3, 2)
+    ))
+    total, services, days, weeks = booking_stats.snapshot(upcoming_dates(), weeks)
     
     # Статистика по услугам
     services_text = ""
-    for service_code, count in stats['services']:
-        service_name, price, _ = get_service_info(service_code)
-        short_name = service_name.split()[1]
-        services_text += f"• {short_name}: {count} записей\n"
+    revenue_text = ""
+    for service_code, count, revenue in services:
+        service = get_service_info(service_code)
+        services_text += f"• {service.short_name}: {count} записей\n"
+        revenue_text += f"• {service.short_name}: {service.price} 🪙 × {count} = {revenue} 🪙\n"
+    
+    days_text = ""
+    for date_str, count in days:
+        _, short_date, day_name = format_date(date_str)
+        days_text += f"• {short_date} ({day_name[:3]}): {count}\n"
+    
+    weeks_text = "".join(f"• {week}: {count}\n" for week, count in weeks)
     
     stats_text = f"""
 📊 *СТАТИСТИКА СЕРВИСА:*
 
 *Общая статистика:*
-• Всего слотов: {stats['total']}
-• Свободно: {stats['free']}
-• Забронировано: {stats['booked']}
-• Заполненность: {(stats['booked']/stats['total']*100):.1f}%
+• Рабочих часов на {DAYS_AHEAD} дн.: {work_minutes // 60}
+• Занято часов: {busy_minutes / 60:.1f}
+• Забронировано: {total}
+• Заполненность: {(busy_minutes / max(work_minutes, 1) * 100):.1f}%
 
 *Популярность услуг:*
-{services_text}
+{services_text or "• Пока нет записей"}
 
-*💰 Оборот (если все оплачено):*
-• Базовая: 500 🪙 × {next((c for s,c in stats['services'] if s=='basic'), 0)} = {500 * next((c for s,c in stats['services'] if s=='basic'), 0)} 🪙
-• Глубокая: 1200 🪙 × {next((c for s,c in stats['services'] if s=='deep'), 0)} = {1200 * next((c for s,c in stats['services'] if s=='deep'), 0)} 🪙
-• VIP: 2500 🪙 × {next((c for s,c in stats['services'] if s=='vip'), 0)} = {2500 * next((c for s,c in stats['services'] if s=='vip'), 0)} 🪙
+*📅 По дням:*
+{days_text}
+*🗓 По неделям:*
+{weeks_text}
+*⚡ Занятых интервалов в памяти:* {len(availability)}
 
-*📈 ИТОГО: {sum(price * next((c for s,c in stats['services'] if s==code), 0) for code, (_, price, _) in get_service_info.__closure__[0].cell_contents.items() if any(s==code for s,_ in stats['services']))} 🪙*
+*💰 Оборот (если все оплачено):*
+{revenue_text}
+*📈 ИТОГО: {sum(revenue for _, _, revenue in services)} 🪙*
     """
     
-    await query.edit_message_text(
+    await edit_screen(
+        query,
         stats_text,
         reply_markup=get_admin_menu(),
         parse_mode='Markdown'
     )
 
 async def admin_all_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Все записи для админа"""
+    """Все записи для админа: первая страница с текущими фильтрами"""
     query = update.callback_query
     await query.answer()
     
     user = query.from_user
     if user.id not in ADMIN_IDS:
-        await query.edit_message_text("🚫 Нет доступа!")
+        await edit_screen(query, "🚫 Нет доступа!")
         return
     
-    bookings = get_all_bookings()
+    text, reply_markup = await render_bookings_page(context.user_data.setdefault('bookings_filter', {}))
+    await edit_screen(query, text, reply_markup=reply_markup, parse_mode='Markdown')
+
+async def admin_bookings_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Листание записей: abk_n_<ключ> - вперед, abk_p_<ключ> - назад"""
+    query = update.callback_query
+    await query.answer()
     
-    if not bookings:
-        await query.edit_message_text(
-            "📭 *Нет активных записей*",
-            reply_markup=get_admin_menu()
-        )
+    user = query.from_user
+    if user.id not in ADMIN_IDS:
+        await edit_screen(query, "🚫 Нет доступа!")
+        return
+    
+    _, direction, date_str, time_str, appointment_id = query.data.split("_")
+    text, reply_markup = await render_bookings_page(
+        context.user_data.setdefault('bookings_filter', {}),
+        cursor=(date_str, time_str, int(appointment_id)),
+        backward=direction == "p"
+    )
+    await edit_screen(query, text, reply_markup=reply_markup, parse_mode='Markdown')
+
+async def admin_bookings_filter(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Фильтры: abf_date_<период>, abf_svc_<услуга|all>, abf_reset"""
+    query = update.callback_query
+    await query.answer()
+    
+    user = query.from_user
+    if user.id not in ADMIN_IDS:
+        await edit_screen(query, "🚫 Нет доступа!")
+        return
+    
+    bookings_filter = context.user_data.setdefault('bookings_filter', {})
+    _, kind, *value = query.data.split("_", 2)
+    if kind == "date":
+        bookings_filter['dates'] = value[0]
+    elif kind == "svc":
+        bookings_filter['service'] = None if value[0] == "all" else value[0]
+    else:
+        bookings_filter.clear()
+    
+    text, reply_markup = await render_bookings_page(bookings_filter)
+    await edit_screen(query, text, reply_markup=reply_markup, parse_mode='Markdown')
+
+async def bookings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/bookings [user_id] - записи (одного пользователя) для админа"""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("🚫 Нет доступа!")
         return
     
-    bookings_text = "📋 *ВСЕ АКТИВНЫЕ ЗАПИСИ:*\n\n"
+    bookings_filter = context.user_data.setdefault('bookings_filter', {})
+    if context.args and context.args[0].isdigit():
+        bookings_filter['user_id'] = int(context.args[0])
+    else:
+        bookings_filter.pop('user_id', None)
+    
+    text, reply_markup = await render_bookings_page(bookings_filter)
+    await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+
+async def render_bookings_page(bookings_filter, cursor=None, backward=False):
+    """Текст и клавиатура страницы записей"""
+    bookings, more = await run_db_read(get_bookings_page, bookings_filter, cursor, backward)
+    has_next = more if not backward else True
+    has_prev = more if backward else cursor is not None
+    
+    dates = bookings_filter.get('dates', 'all')
+    service = bookings_filter.get('service')
+    active = [BOOKINGS_DATE_FILTERS[dates][0]]
+    if service:
+        active.append(get_service_info(service).name)
+    if bookings_filter.get('user_id'):
+        active.append(f"👤 {bookings_filter['user_id']}")
+    
+    bookings_text = "📋 *ЗАПИСИ:* " + " · ".join(active) + "\n\n"
+    if not bookings:
+        bookings_text += "📭 *Нет записей*"
     
-    for i, (date_str, time_str, service_code, user_name, phone, created_at) in enumerate(bookings[:15], 1):
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        service_name, price, _ = get_service_info(service_code)
-        short_name = service_name.split()[1]
+    for booking in bookings:
+        _, short_date, _ = format_date(booking.date)
         
-        bookings_text += f"*{i}. {user_name or 'Аноним'}*\n"
-        bookings_text += f"   📅 {date_obj.strftime('%d.%m')} в {time_str}\n"
-        bookings_text += f"   🎮 {short_name} ({price} 🪙)\n"
-        if phone:
-            bookings_text += f"   📱 {phone}\n"
-        bookings_text += f"   🕐 Запись: {created_at[:16]}\n\n"
+        bookings_text += f"*{booking.user_name or 'Аноним'}* (`{booking.user_id}`)\n"
+        bookings_text += f"   📅 {short_date} в {booking.time}\n"
+        bookings_text += f"   🎮 {booking.service.short_name} ({booking.service.price} 🪙)\n"
+        if booking.user_phone:
+            bookings_text += f"   📱 {booking.user_phone}\n"
+        bookings_text += f"   🕐 Запись: {booking.created_at[:16]}\n\n"
     
-    if len(bookings) > 15:
-        bookings_text += f"\n*... и еще {len(bookings) - 15} записей*"
+    keyboard = []
+    navigation = []
+    if bookings and has_prev:
+        navigation.append(InlineKeyboardButton("◀️ Назад", callback_data="abk_p_{}_{}_{}".format(*bookings[0].key)))
+    if bookings and has_next:
+        navigation.append(InlineKeyboardButton("Вперед ▶️", callback_data="abk_n_{}_{}_{}".format(*bookings[-1].key)))
+    if navigation:
+        keyboard.append(navigation)
     
-    await query.edit_message_text(
-        bookings_text,
-        reply_markup=get_admin_menu(),
-        parse_mode='Markdown'
-    )
+    keyboard.append([
+        InlineKeyboardButton(("✅ " if preset == dates else "") + label, callback_data=f"abf_date_{preset}")
+        for preset, (label, _, _) in BOOKINGS_DATE_FILTERS.items()
+    ])
+    services = [("all", "Все")] + [(service.code, service.short_name) for service in SERVICES.values()]
+    for row_start in range(0, len(services), 4):
+        keyboard.append([
+            InlineKeyboardButton(("✅ " if code == (service or "all") else "") + label, callback_data=f"abf_svc_{code}")
+            for code, label in services[row_start:row_start + 4]
+        ])
+    keyboard.append([
+        InlineKeyboardButton("♻️ Сбросить фильтры", callback_data="abf_reset"),
+        InlineKeyboardButton("👑 Админ-меню", callback_data="admin_panel")
+    ])
+    
+    return bookings_text, InlineKeyboardMarkup(keyboard)
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/export [csv|jsonl] [gz] - выгрузка всех записей файлом"""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("🚫 Нет доступа!")
+        return
+    
+    args = [arg.lower() for arg in context.args]
+    fmt = "jsonl" if "jsonl" in args else "csv"
+    await send_export(context, update.effective_chat.id, fmt, compress="gz" in args)
+
+async def admin_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка выгрузки в админке: CSV в gzip"""
+    query = update.callback_query
+    
+    user = query.from_user
+    if user.id not in ADMIN_IDS:
+        await query.answer()
+        await edit_screen(query, "🚫 Нет доступа!")
+        return
+    
+    await query.answer("📤 Готовлю файл...")
+    await send_export(context, query.message.chat_id, "csv", compress=True)
+
+async def send_export(context, chat_id, fmt, compress):
+    """Собрать выгрузку в потоке читателя и отправить документом"""
+    started = time.perf_counter()
+    path, count = await run_db_read(export_bookings, fmt, compress)
+    try:
+        size = os.path.getsize(path)
+        logger.info(f"📤 Выгрузка {fmt}{'.gz' if compress else ''}: {count} записей, {size} байт за {time.perf_counter() - started:.1f} с")
+        
+        if size > EXPORT_MAX_BYTES:
+            await context.bot.send_message(
+                chat_id,
+                f"❌ Файл слишком большой для Telegram ({size // (1024 * 1024)} МБ).\n"
+                "Попробуй `/export csv gz`.",
+                parse_mode='Markdown'
+            )
+            return
+        
+        with open(path, 'rb') as file:
+            await context.bot.send_document(
+                chat_id,
+                document=file,
+                filename=f"bookings_{datetime.now():%Y%m%d_%H%M}.{fmt}" + (".gz" if compress else ""),
+                caption=f"📤 Записей: {count}",
+                write_timeout=120
+            )
+    finally:
+        os.remove(path)
 
 async def admin_refresh(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обновить расписание (быстрая версия)"""
+    """Перечитать специалистов и брони из базы (после ручной правки)"""
     query = update.callback_query
     await query.answer()
     
     user = query.from_user
     if user.id not in ADMIN_IDS:
-        await query.edit_message_text("🚫 Нет доступа!")
+        await edit_screen(query, "🚫 Нет доступа!")
         return
     
     # Быстрое сообщение
-    await query.edit_message_text(
+    await edit_screen(
+        query,
         "⏳ *Обновляю расписание...*",
         parse_mode='Markdown'
     )
     
     try:
-        # БЫСТРЫЙ метод
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        
-        # Удаляем только будущие записи
-        cursor.execute("DELETE FROM appointments WHERE date >= date('now')")
-        
-        # Быстро генерируем новые
-        today = datetime.now()
-        services = [
-            ("🧹 Базовая чистка чата", "basic", 500),
-            ("🌀 Очистка от нообов", "deep", 1200),
-            ("⚡ Экспресс-фикс багов", "express", 300),
-            ("👑 VIP разблокировка", "vip", 2500),
-            ("🎮 Прокачка скиллов", "pro", 1800),
-            ("🔧 Ремонт аватара", "avatar", 800)
-        ]
-        
-        WORKING_HOURS = [10, 12, 14, 16, 18, 20]
-        appointments = []
-        
-        for day in range(7):
-            appointment_date = today + timedelta(days=day + 1)
-            date_str = appointment_date.strftime("%Y-%m-%d")
-            
-            for hour in WORKING_HOURS:
-                time_str = f"{hour:02d}:00"
-                service = random.choice(services)
-                
-                appointments.append((
-                    date_str,
-                    time_str,
-                    service[1],
-                    None,
-                    None,
-                    None,
-                    'free'
-                ))
-        
-        # Массовая вставка - БЫСТРО!
-        cursor.executemany('''
-            INSERT INTO appointments (date, time, service_type, user_id, user_name, user_phone, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', appointments)
-        
-        conn.commit()
-        conn.close()
+        bookings = await run_db_write(load_availability)
+        await run_db_write(load_booking_stats)
+        notify_waitlist(context.job_queue)
         
         # Сообщение об успехе
-        await query.edit_message_text(
+        await edit_screen(
+            query,
             "✅ *Готово! Расписание обновлено!*\n\n"
-            f"📅 Создано: {len(appointments)} слотов\n"
-            f"🎮 Услуг: {len(services)} видов\n"
-            f"⏰ Часов в день: {len(WORKING_HOURS)}\n\n"
-            "Теперь пользователи могут записываться на новую неделю! 🎮",
+            f"📅 Броней впереди: {bookings}\n"
+            f"🎮 Услуг: {len(SERVICES)} видов\n"
+            f"⏰ Шаг записи: {SLOT_STEP_MINUTES} минут\n\n"
+            "Свободное время считается по рабочим часам специалистов! 🎮",
             reply_markup=get_admin_menu(),
             parse_mode='Markdown'
         )
@@ -994,7 +2787,8 @@ async def admin_refresh(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         logger.error(f"Ошибка при обновлении расписания: {e}")
         
-        await query.edit_message_text(
+        await edit_screen(
+            query,
             f"❌ *Ошибка при обновлении!*\n\n"
             f"*Причина:* {str(e)[:100]}\n\n"
             "Попробуйте позже или проверьте базу данных.",
@@ -1008,33 +2802,454 @@ async def back_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user = query.from_user
-    await query.edit_message_text(
+    await edit_screen(
+        query,
         "🎮 *Главное меню Roblox Brain Wash*\n\n"
         "*Выбери действие:* ⤵️",
         reply_markup=get_main_menu(user.id),
         parse_mode='Markdown'
     )
 
-# ==================== ОСНОВНАЯ ФУНКЦИЯ ====================
-def main():
-    """Запуск бота"""
-    logger.info("🚀 Запускаю Roblox Brain Wash Bot...")
+# ==================== ЛИМИТЫ TELEGRAM ====================
+# Рассылки (уведомления, напоминания) передают rate_limit_args=BULK и
+# пропускают вперед ответы на нажатия кнопок
+BULK = "bulk"
+
+class TokenBucket:
+    """Ведро токенов: rate в секунду, не больше capacity про запас"""
     
-    # Инициализация БД
-    init_database()
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def delay(self, reserve=0):
+        """Сколько ждать, пока появится токен сверх reserve (0 - можно сейчас)"""
+        self.refill()
+        return max(0.0, (reserve + 1 - self.tokens) / self.rate)
+    
+    def take(self):
+        self.tokens -= 1
+    
+    @property
+    def full(self):
+        self.refill()
+        return self.tokens >= self.capacity
+
+class PriorityRateLimiter(BaseRateLimiter):
+    """Общий и по-чатовый лимит исходящих сообщений с двумя полосами приоритета
+    
+    Запросы без chat_id (answerCallbackQuery, getMe...) идут без ожидания.
+    На RetryAfter все запросы ставятся на паузу и запрос повторяется.
+    """
+    
+    def __init__(self, max_retries=3):
+        self.max_retries = max_retries
+        self._global = TokenBucket(TELEGRAM_GLOBAL_RATE, TELEGRAM_BULK_RESERVE * 2)
+        self._chats = {}
+        self._interactive_waiting = 0
+        self._paused_until = 0.0
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        self._chats.clear()
+    
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10000:
+                # Чистим чаты, которые давно ничего не получали
+                self._chats = {key: value for key, value in self._chats.items() if not value.full}
+            rate = TELEGRAM_GROUP_RATE if str(chat_id).startswith('-') else TELEGRAM_CHAT_RATE
+            bucket = self._chats[chat_id] = TokenBucket(rate, 3)
+        return bucket
+    
+    async def _acquire(self, chat_id, bulk):
+        """Дождаться токена чата, потом токена в общем ведре"""
+        reserve = TELEGRAM_BULK_RESERVE if bulk else 0
+        chat_bucket = self._chat_bucket(chat_id)
+        competing = False       # Интерактивный запрос уже ждет общее ведро
+        try:
+            while True:
+                # Лимит своего чата другим не мешает - ждем его отдельно
+                wait = chat_bucket.delay()
+                if wait <= 0:
+                    if bulk and self._interactive_waiting:
+                        wait = 0.05
+                    else:
+                        if not bulk and not competing:
+                            competing = True
+                            self._interactive_waiting += 1
+                        wait = max(self._paused_until - time.monotonic(), self._global.delay(reserve))
+                        if wait <= 0:
+                            self._global.take()
+                            chat_bucket.take()
+                            return
+                await asyncio.sleep(wait)
+        finally:
+            if competing:
+                self._interactive_waiting -= 1
+    
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        bulk = rate_limit_args == BULK
+        lane = "bulk" if bulk else "interactive"
+        
+        for attempt in range(self.max_retries + 1):
+            if chat_id is not None:
+                started = time.perf_counter()
+                await self._acquire(chat_id, bulk)
+                RATE_LIMIT_WAIT.observe(lane, time.perf_counter() - started)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"⏳ Telegram просит подождать {e.retry_after} с ({endpoint})")
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                await asyncio.sleep(e.retry_after)
+
+# ==================== ХРАНЕНИЕ USER_DATA ====================
+class SQLitePersistence(BasePersistence):
+    """user_data, chat_data и bot_data в той же базе, что и записи
+    
+    PTB раз в update_interval отдает данные тех, кого коснулись обновления.
+    Здесь они только помечаются грязными, а в базу уходят одной транзакцией
+    писателя - и только те, что действительно поменялись с прошлой записи.
+    """
+    
+    def __init__(self, update_interval=PERSISTENCE_INTERVAL):
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=update_interval)
+        self._dirty = {}            # (вид, ключ) -> данные или None (удалить)
+        self._stored = {}           # (вид, ключ) -> хэш последней записанной версии
+        self._flush_task = None
+    
+    async def _load(self, kind):
+        data = {}
+        for key, blob in await run_db_read(load_persistence, kind):
+            self._stored[(kind, key)] = hash(blob)
+            data[key] = pickle.loads(blob)
+        return data
+    
+    def _mark(self, kind, key, data):
+        """Пометить грязным; запись - после того, как PTB отдаст все изменения раунда"""
+        self._dirty[(kind, str(key))] = data
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._write_behind())
+    
+    async def _write_behind(self):
+        # Пока шла запись, могли пометить новое - _mark задачу не запустит, она еще жива,
+        # поэтому пишем, пока грязное не кончится. При ошибке ждем следующей пометки
+        try:
+            while self._dirty:
+                await asyncio.sleep(0)
+                await self.flush()
+        except Exception as e:
+            logger.error(f"❌ Не удалось сохранить user_data: {e}")
+        finally:
+            self._flush_task = None
+    
+    async def get_user_data(self):
+        return {int(key): data for key, data in (await self._load('user')).items()}
+    
+    async def get_chat_data(self):
+        return {int(key): data for key, data in (await self._load('chat')).items()}
+    
+    async def get_bot_data(self):
+        return (await self._load('bot')).get('', {})
+    
+    async def get_callback_data(self):
+        return None
+    
+    async def get_conversations(self, name):
+        return {tuple(json.loads(key)): state for key, state in (await self._load(f'conversation:{name}')).items()}
+    
+    async def update_user_data(self, user_id, data):
+        self._mark('user', user_id, data)
+    
+    async def update_chat_data(self, chat_id, data):
+        self._mark('chat', chat_id, data)
+    
+    async def update_bot_data(self, data):
+        self._mark('bot', '', data)
+    
+    async def update_callback_data(self, data):
+        pass
+    
+    async def update_conversation(self, name, key, new_state):
+        self._mark(f'conversation:{name}', json.dumps(key), new_state)
+    
+    async def drop_user_data(self, user_id):
+        self._mark('user', user_id, None)
+    
+    async def drop_chat_data(self, chat_id):
+        self._mark('chat', chat_id, None)
+    
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+    
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+    
+    async def refresh_bot_data(self, bot_data):
+        pass
     
-    # Создание приложения
-    app = Application.builder().token(TOKEN).build()
+    async def flush(self):
+        """Записать все грязное (зовет и PTB при остановке)"""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        
+        rows, deleted = [], []
+        for slot, data in dirty.items():
+            if data is None:
+                deleted.append(slot)
+                self._stored.pop(slot, None)
+                continue
+            blob = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+            digest = hash(blob)
+            if self._stored.get(slot) == digest:
+                continue
+            self._stored[slot] = digest
+            rows.append((*slot, blob))
+        
+        if not rows and not deleted:
+            return
+        try:
+            await run_db_write(save_persistence, rows, deleted)
+        except Exception:
+            # Не записалось - вернем в грязные, более свежие правки не трогаем
+            for kind, key, _ in rows:
+                self._stored.pop((kind, key), None)
+            for slot, data in dirty.items():
+                self._dirty.setdefault(slot, data)
+            raise
+
+# ==================== ПАРАЛЛЕЛЬНАЯ ОБРАБОТКА ====================
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Обновления разных чатов обрабатываются параллельно, одного чата - строго по очереди
+    
+    Так медленный admin_refresh не держит остальных пользователей, а два нажатия
+    одного пользователя не перезаписывают друг другу context.user_data.
+    """
+    
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._chat_locks = {}       # чат -> [lock, сколько обновлений его ждут]
+        self._accepted = 0          # Получены и еще не обработаны
+        self._running = 0           # Из них уже выполняются
+    
+    @property
+    def backlog(self):
+        """Сколько обновлений ждут: своей очереди в чате или свободного слота"""
+        return self._accepted - self._running
+    
+    @staticmethod
+    def _ordering_key(update):
+        """Чат (или пользователь), внутри которого важен порядок"""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+        return None
+    
+    async def process_update(self, update, coroutine):
+        """Сначала очередь своего чата, потом общий слот
+        
+        Базовый класс берет слот семафора до do_process_update: обновления,
+        ждущие свой чат, занимали бы места, и один чат с очередью тормозил бы всех.
+        """
+        self._accepted += 1
+        try:
+            key = self._ordering_key(update)
+            if key is None:
+                await super().process_update(update, coroutine)
+                return
+            
+            # asyncio.Lock отдает захват в порядке очереди - порядок обновлений сохраняется
+            entry = self._chat_locks.get(key)
+            if entry is None:
+                entry = self._chat_locks[key] = [asyncio.Lock(), 0]
+            entry[1] += 1
+            try:
+                async with entry[0]:
+                    await super().process_update(update, coroutine)
+            finally:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._chat_locks[key]
+        finally:
+            self._accepted -= 1
+    
+    async def do_process_update(self, update, coroutine):
+        self._running += 1
+        try:
+            await coroutine
+        finally:
+            self._running -= 1
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        self._chat_locks.clear()
+
+# ==================== ЖИЗНЕННЫЙ ЦИКЛ ====================
+async def post_init(application):
+    """Подготовка перед приемом обновлений (база уже открыта в run_bot)"""
+    application.bot_data['db_initialized'] = True
+    
+    # Горизонт записи сдвигается сам, раз в сутки только выбрасываем прошедшие дни
+    application.job_queue.run_daily(reload_availability_job, time=dtime(hour=0, minute=5), name="reload_availability")
+    application.job_queue.run_daily(retention_job, time=dtime(hour=3, minute=30), name="retention")
+    
+    # Напоминания о записях: куча собирается одним запросом, дальше один таймер на всех
+    reminders.load(await run_db_read(get_pending_reminders))
+    application.job_queue.run_repeating(reminder_job, interval=REMINDER_TICK, first=5, name="reminders")
+    logger.info(f"⏰ Напоминаний в очереди: {len(reminders)}")
+    
+    # Плановая проверка листа ожидания: ловит все освобождения, в том числе до перезапуска
+    application.job_queue.run_repeating(waitlist_job, interval=WAITLIST_INTERVAL, first=10, name="waitlist")
+    
+    # Брони, истекшие пока бот был выключен, сразу возвращаем в свободные
+    released = await run_db_write(release_expired_holds)
+    if released:
+        logger.info(f"⌛ Снято истекших броней: {released}")
+    
+    startup_timings['ready'] = time.perf_counter() - STARTED_AT
+    logger.info(f"⏱ Импорт → готов к работе: {startup_timings['ready']:.3f} с")
+
+async def track_first_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Замер холодного старта: от импорта до первого обновления"""
+    if 'first_update' not in startup_timings:
+        startup_timings['first_update'] = time.perf_counter() - STARTED_AT
+        logger.info(f"⏱ Импорт → первое обновление: {startup_timings['first_update']:.3f} с")
+
+# ==================== ВЕБ-СЕРВЕР ====================
+def build_web_app(application):
+    """aiohttp-приложение: health-check и прием обновлений от Telegram"""
+    
+    async def home(request):
+        return web.Response(text="✅ Roblox Brain Wash Bot is running! 🎮")
+    
+    async def health(request):
+        return web.Response(text="OK")
+    
+    async def metrics(request):
+        return web.Response(
+            text=render_metrics(application),
+            content_type="text/plain",
+            headers={"X-Content-Type-Options": "nosniff"}
+        )
+    
+    async def telegram_webhook(request):
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not secrets.compare_digest(token, WEBHOOK_SECRET):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        
+        await application.update_queue.put(Update.de_json(data, application.bot))
+        return web.Response()
+    
+    web_app = web.Application()
+    web_app.router.add_get('/', home)
+    web_app.router.add_get('/health', health)
+    web_app.router.add_get('/metrics', metrics)
+    # В режиме polling обновления приходят только от Telegram - маршрута нет
+    if WEBHOOK_URL:
+        web_app.router.add_post(WEBHOOK_PATH, telegram_webhook)
+    return web_app
+
+async def run_bot(application):
+    """Запуск бота и веб-сервера в одном event loop"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    
+    web_runner = web.AppRunner(build_web_app(application))
+    await web_runner.setup()
+    await web.TCPSite(web_runner, '0.0.0.0', PORT).start()
+    logger.info(f"🚀 Веб-сервер слушает порт {PORT}")
+    
+    # Схема нужна раньше initialize: оттуда persistence читает сохраненные данные
+    await run_db_write(init_database)
+    
+    try:
+        async with application:
+            # Как в run_polling: post_init после initialize, до start
+            if application.post_init:
+                await application.post_init(application)
+            await application.start()
+            
+            if WEBHOOK_URL:
+                await application.bot.set_webhook(
+                    url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                    secret_token=WEBHOOK_SECRET,
+                    allowed_updates=Update.ALL_TYPES
+                )
+                logger.info("🔗 Режим webhook")
+            else:
+                await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+                logger.info("🔁 Режим polling")
+            
+            await stop_event.wait()
+            
+            if application.updater.running:
+                await application.updater.stop()
+            await application.stop()
+    finally:
+        await web_runner.cleanup()
+
+# ==================== СБОРКА ПРИЛОЖЕНИЯ ====================
+def build_application(builder):
+    """Приложение со всеми обработчиками
+    
+    builder - Application.builder() с токеном (и адресом Bot API, если не настоящий).
+    База здесь не открывается: она инициализируется в run_bot.
+    """
+    app = (
+        builder
+        .request(InstrumentedRequest(connection_pool_size=TELEGRAM_POOL_SIZE, pool_timeout=5.0))
+        .rate_limiter(PriorityRateLimiter())
+        .concurrent_updates(ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .persistence(SQLitePersistence())
+        .post_init(post_init)
+        .build()
+    )
+    
+    # Замер старта - раньше всех остальных обработчиков
+    app.add_handler(TypeHandler(Update, track_first_update), group=-1)
     
     # Регистрация команд
     app.add_handler(CommandHandler("start", start_command))
+    app.add_handler(CommandHandler("bookings", bookings_command))
+    app.add_handler(CommandHandler("export", export_command))
     
     # Обработчики для пользователей
     app.add_handler(CallbackQueryHandler(view_slots, pattern="^view_slots$"))
     app.add_handler(CallbackQueryHandler(select_date, pattern="^date_"))
+    app.add_handler(CallbackQueryHandler(select_service, pattern="^svc_"))
     app.add_handler(CallbackQueryHandler(select_time, pattern="^time_"))
     app.add_handler(CallbackQueryHandler(confirm_booking, pattern="^confirm_"))
+    app.add_handler(CallbackQueryHandler(release_slot, pattern="^release_"))
+    app.add_handler(CallbackQueryHandler(join_waitlist, pattern="^wait_"))
     app.add_handler(CallbackQueryHandler(my_bookings, pattern="^my_bookings$"))
+    app.add_handler(CallbackQueryHandler(cancel_booking, pattern="^cancel_"))
+    app.add_handler(CallbackQueryHandler(reschedule_booking, pattern="^resched_"))
     app.add_handler(CallbackQueryHandler(show_services, pattern="^services$"))
     app.add_handler(CallbackQueryHandler(about_service, pattern="^about$"))
     app.add_handler(CallbackQueryHandler(show_contacts, pattern="^contacts$"))
@@ -1046,7 +3261,10 @@ def main():
     app.add_handler(CallbackQueryHandler(admin_panel, pattern="^admin_panel$"))
     app.add_handler(CallbackQueryHandler(admin_stats, pattern="^admin_stats$"))
     app.add_handler(CallbackQueryHandler(admin_all_bookings, pattern="^admin_all$"))
+    app.add_handler(CallbackQueryHandler(admin_bookings_page, pattern="^abk_"))
+    app.add_handler(CallbackQueryHandler(admin_bookings_filter, pattern="^abf_"))
     app.add_handler(CallbackQueryHandler(admin_refresh, pattern="^admin_refresh$"))
+    app.add_handler(CallbackQueryHandler(admin_export, pattern="^admin_export$"))
     
     # Навигация
     app.add_handler(CallbackQueryHandler(back_to_main, pattern="^back_main$"))
@@ -1054,11 +3272,34 @@ def main():
     # Обработчик текстовых сообщений
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, back_to_main))
     
+    # Метрики: время каждого обработчика
+    instrument_handlers(app)
+    
+    return app
+
+# ==================== ОСНОВНАЯ ФУНКЦИЯ ====================
+def main():
+    """Запуск бота"""
+    log_listener = setup_logging()
+    logger.info("🚀 Запускаю Roblox Brain Wash Bot...")
+    
+    if not TOKEN:
+        logger.error("⚠️ Ошибка: Нет токена!")
+        log_listener.stop()
+        sys.exit(1)
+    
+    # Создание приложения (база инициализируется в run_bot)
+    app = build_application(Application.builder().token(TOKEN))
+    
     logger.info("✅ Roblox бот запущен и готов!")
     logger.info("🎮 Напиши /start в Telegram!")
     
     # Запуск бота
-    app.run_polling()
+    try:
+        asyncio.run(run_bot(app))
+    finally:
+        close_connections()
+        log_listener.stop()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,30 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Чистая база в tmp_path: свои потоки БД, движок, счетчики и очередь напоминаний"""
+    monkeypatch.setattr(bot, "DB_NAME", str(tmp_path / "roblox_wash.db"))
+    monkeypatch.setattr(bot, "_db_local", threading.local())
+    monkeypatch.setattr(bot, "db_read_executor", ThreadPoolExecutor(bot.DB_READERS, "sqlite-read"))
+    monkeypatch.setattr(bot, "db_write_executor", ThreadPoolExecutor(1, "sqlite-write"))
+    monkeypatch.setattr(bot, "availability", bot.AvailabilityEngine())
+    monkeypatch.setattr(bot, "booking_stats", bot.BookingStats())
+    monkeypatch.setattr(bot, "reminders", bot.ReminderQueue())
+    monkeypatch.setattr(bot, "_screen_fingerprints", type(bot._screen_fingerprints)())
+
+    bot.db_write_executor.submit(bot.init_database).result()
+    version = bot.get_read_connection().execute("PRAGMA user_version").fetchone()[0]
+    assert version == len(bot.MIGRATIONS)
+
+    yield bot
+    bot.close_connections()
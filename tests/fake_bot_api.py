@@ -0,0 +1,121 @@
+"""Локальный Bot API для тестов и бенчмарков рассылок
+
+Принимает sendMessage/editMessageText и, как настоящий Telegram, отвечает 429,
+если бот превысил общий или по-чатовый лимит. Лимиты - ведра токенов
+с тем же запасом, что у PriorityRateLimiter, плюс JITTER секунд на дрожание
+таймеров и сети: запросы, отпущенные лимитером ровно по графику, приходят пачками.
+"""
+import random
+import time
+
+from aiohttp import web
+from telegram.ext import ExtBot
+
+import bot
+
+TOKEN = "1:fake"
+SEND_METHODS = ("sendMessage", "editMessageText")
+JITTER = 0.1
+
+
+class FakeBotAPI:
+    def __init__(self, global_rate=None, chat_rate=bot.TELEGRAM_CHAT_RATE, failure_rate=0.0, blocked=()):
+        self.global_rate = global_rate or bot.TELEGRAM_GLOBAL_RATE
+        self.chat_rate = chat_rate
+        self.failure_rate = failure_rate    # Доля ответов 502 - сеть/Telegram сбоит
+        self.sent = []                      # [(monotonic, метод, chat_id)]
+        self.rejected = 0                   # Ответов 429
+        self.throttle_next = 0              # Столько следующих запросов получат 429 без причины
+        self.blocked = set(blocked)         # Чаты, где бота заблокировали (403)
+        self._global = self._bucket(self.global_rate, bot.TELEGRAM_BULK_RESERVE * 2)
+        self._chats = {}
+        self._runner = None
+        self.base_url = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post(f"/bot{TOKEN}/{{method}}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.base_url = f"http://127.0.0.1:{port}/bot"
+        return self
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    def make_bot(self, limited=True):
+        """Бот с тем же HTTP-клиентом и лимитером, что в main()"""
+        return ExtBot(
+            TOKEN,
+            base_url=self.base_url,
+            request=bot.InstrumentedRequest(connection_pool_size=bot.TELEGRAM_POOL_SIZE, pool_timeout=5.0),
+            rate_limiter=bot.PriorityRateLimiter() if limited else None,
+        )
+
+    def delivered(self, chat_id=None):
+        return [stamp for stamp, _, chat in self.sent if chat_id is None or chat == chat_id]
+
+    @staticmethod
+    def _bucket(rate, capacity):
+        return bot.TokenBucket(rate, capacity + rate * JITTER)
+
+    def _chat_bucket(self, chat_id):
+        if chat_id not in self._chats:
+            self._chats[chat_id] = self._bucket(self.chat_rate, 3)
+        return self._chats[chat_id]
+
+    async def _handle(self, request):
+        method = request.match_info["method"]
+        if method == "getMe":
+            return self._ok({"id": 1, "is_bot": True, "first_name": "fake", "username": "fake_bot"})
+        if method not in SEND_METHODS:
+            return self._ok(True)
+
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+        chat_id = int(data["chat_id"])
+
+        if self.failure_rate and random.random() < self.failure_rate:
+            return web.json_response({"ok": False, "error_code": 502, "description": "Bad Gateway"}, status=502)
+        if chat_id in self.blocked:
+            return web.json_response({
+                "ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"
+            }, status=403)
+
+        chat_bucket = self._chat_bucket(chat_id)
+        if self.throttle_next or self._global.delay() > 0 or chat_bucket.delay() > 0:
+            self.throttle_next = max(0, self.throttle_next - 1)
+            self.rejected += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1},
+            }, status=429)
+
+        self._global.take()
+        chat_bucket.take()
+        self.sent.append((time.monotonic(), method, chat_id))
+        return self._ok({
+            "message_id": len(self.sent),
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "text": data.get("text", ""),
+        })
+
+    @staticmethod
+    def _ok(result):
+        return web.json_response({"ok": True, "result": result})
+
+
+async def running_api(limited=True, **kwargs):
+    """(FakeBotAPI, инициализированный бот) - не забыть shutdown и stop"""
+    api = await FakeBotAPI(**kwargs).start()
+    client = api.make_bot(limited)
+    await client.initialize()
+    return api, client
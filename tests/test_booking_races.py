@@ -0,0 +1,127 @@
+import asyncio
+import random
+
+
+def count_booked(bot, date, time):
+    return bot.get_read_connection().execute(
+        "SELECT COUNT(*) FROM appointments WHERE date = ? AND time = ? AND status = 'booked'", (date, time)
+    ).fetchone()[0]
+
+
+def test_cancel_and_book_interleave_on_one_slot(db):
+    """Отмена и новые записи на то же время в случайном порядке: запись одна, движок совпадает с базой"""
+    date, time, service = db.upcoming_dates()[1], "10:00", "deep"
+    assert db.availability.times(date, service)[0] == (time, 1)
+
+    async def rounds():
+        for number in range(50):
+            users = range(number * 10, number * 10 + 5)
+            assert await db.run_db_write(db.book_appointment, date, time, service, users[0], "x")
+            [row] = await db.run_db_read(db.get_user_appointments, users[0])
+
+            ops = [db.run_db_write(db.cancel_appointment, row.id, users[0])]
+            ops += [db.run_db_write(db.book_appointment, date, time, service, user, "y") for user in users[1:]]
+            random.shuffle(ops)
+            await asyncio.gather(*ops)
+
+            booked = await db.run_db_read(count_booked, db, date, time)
+            assert booked <= 1
+            assert (db.availability.times(date, service)[:1] == [(time, 1)]) == (booked == 0)
+            assert db.booking_stats.total == booked
+
+            for user in users:
+                for row in await db.run_db_read(db.get_user_appointments, user):
+                    assert await db.run_db_write(db.cancel_appointment, row.id, user)
+            assert db.availability.times(date, service)[0] == (time, 1)
+
+    asyncio.run(rounds())
+
+    # Движок в памяти совпадает с тем, что построится из базы заново
+    times = db.availability.times(date, service)
+    db.db_write_executor.submit(db.load_availability).result()
+    assert db.availability.times(date, service) == times
+
+
+def test_reschedule_to_taken_time_keeps_the_old_booking(db):
+    date, service = db.upcoming_dates()[1], "deep"
+
+    async def flow():
+        await db.run_db_write(db.book_appointment, date, "10:00", service, 1, "a")
+        await db.run_db_write(db.book_appointment, date, "14:00", service, 2, "b")
+        [old] = await db.run_db_read(db.get_user_appointments, 1)
+
+        assert await db.run_db_write(db.reschedule_appointment, old.id, date, "14:00", service, 1) is None
+        assert [a.time for a in await db.run_db_read(db.get_user_appointments, 1)] == ["10:00"]
+
+        assert await db.run_db_write(db.reschedule_appointment, old.id, date, "18:00", service, 1)
+        assert [a.time for a in await db.run_db_read(db.get_user_appointments, 1)] == ["18:00"]
+
+    asyncio.run(flow())
+    assert db.availability.times(date, service)[0] == ("10:00", 1)
+    assert db.booking_stats.total == 2
+
+
+def test_many_users_race_for_one_slot(db):
+    """100 пользователей жмут одно время: бронь получает один, записывается ровно один"""
+    date, time, service = db.upcoming_dates()[1], "10:00", "deep"
+    users = range(100, 200)
+
+    async def race():
+        held = await asyncio.gather(*[
+            db.run_db_write(db.hold_slot, date, time, service, user) for user in users
+        ])
+        booked = await asyncio.gather(*[
+            db.run_db_write(db.book_appointment, date, time, service, user, "n") for user in users
+        ])
+        return held, booked
+
+    held, booked = asyncio.run(race())
+
+    assert held.count(True) == 1
+    winners = [user for user, result in zip(users, booked) if result]
+    assert winners == [users[held.index(True)]]
+    assert count_booked(db, date, time) == 1
+    assert db.booking_stats.total == 1
+    assert time not in [t for t, _ in db.availability.times(date, service)]
+    # Проигравшим не осталось висящих броней
+    assert db.get_read_connection().execute(
+        "SELECT COUNT(*) FROM appointments WHERE status = 'held'"
+    ).fetchone()[0] == 0
+
+
+def test_expired_hold_goes_to_the_next_user(db):
+    date, time, service = db.upcoming_dates()[1], "10:00", "deep"
+    assert db.db_write_executor.submit(db.hold_slot, date, time, service, 1).result()
+    assert not db.db_write_executor.submit(db.hold_slot, date, time, service, 2).result()
+
+    conn = db.get_write_connection()
+    with conn:
+        conn.execute("UPDATE appointments SET hold_until = datetime('now', '-1 minute') WHERE status = 'held'")
+
+    async def race():
+        return await asyncio.gather(*[
+            db.run_db_write(db.book_appointment, date, time, service, user, "n") for user in (2, 3, 1)
+        ])
+
+    booked = asyncio.run(race())
+    assert [bool(result) for result in booked] == [True, False, False]
+    assert count_booked(db, date, time) == 1
+
+
+def test_double_confirm_books_once(db):
+    """Повторное «Да, записать!» не берет второе место на то же время"""
+    date, time, service = db.upcoming_dates()[1], "14:00", "basic"
+    seats = dict(db.availability.times(date, service))[time]
+    assert seats > 1
+
+    async def taps():
+        assert await db.run_db_write(db.hold_slot, date, time, service, 1)
+        return await asyncio.gather(*[
+            db.run_db_write(db.book_appointment, date, time, service, 1, "n") for _ in range(3)
+        ])
+
+    first, *again = asyncio.run(taps())
+    assert first and again == [None, None]
+    assert count_booked(db, date, time) == 1
+    assert db.booking_stats.total == 1
+    assert dict(db.availability.times(date, service))[time] == seats - 1
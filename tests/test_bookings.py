@@ -0,0 +1,161 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import bot
+
+
+def book(date, time, user_id, service="basic"):
+    assert bot.hold_slot(date, time, service, user_id)
+    return bot.book_appointment(date, time, service, user_id, f"user{user_id}")
+
+
+def write(db, func, *args):
+    return asyncio.run(db.run_db_write(func, *args))
+
+
+def test_past_booking_is_history(db):
+    past = (datetime.now() - timedelta(days=3)).strftime("%Y-%m-%d")
+    conn = db.get_write_connection()
+    with conn:
+        past_id = conn.execute('''
+            INSERT INTO appointments (date, time, service_type, user_id, user_name, status, resource_id, duration)
+            VALUES (?, '10:00', 'basic', 7, 'user7', 'booked', 1, ?)
+        ''', (past, db.SERVICES["basic"].minutes)).lastrowid
+    db.load_booking_stats()
+    total = db.booking_stats.total
+
+    future = db.upcoming_dates()[1]
+    future_id, _ = write(db, book, future, "12:00", 7)
+
+    assert [a.id for a in db.get_user_appointments(7)] == [future_id]
+    assert write(db, db.cancel_appointment, past_id, 7) is None
+    assert write(db, db.reschedule_appointment, past_id, future, "14:00", "basic", 7) is None
+    assert conn.execute("SELECT status FROM appointments WHERE id = ?", (past_id,)).fetchone()[0] == "booked"
+    assert db.booking_stats.total == total + 1
+
+
+def test_cancel_keeps_the_row_and_frees_the_slot(db):
+    date = db.upcoming_dates()[1]
+    first_id, _ = write(db, book, date, "10:00", 1)
+
+    assert write(db, db.cancel_appointment, first_id, 1) == (date, "10:00")
+    assert write(db, db.cancel_appointment, first_id, 1) is None
+    assert db.get_user_appointments(1) == []
+
+    status, cancelled_at = db.get_read_connection().execute(
+        "SELECT status, cancelled_at FROM appointments WHERE id = ?", (first_id,)
+    ).fetchone()
+    assert status == "cancelled" and cancelled_at is not None
+
+    # То же время на том же специалисте можно снова занять
+    second_id, _ = write(db, book, date, "10:00", 2)
+    assert second_id != first_id
+    assert db.booking_stats.total == 1
+    db.load_booking_stats()
+    assert db.booking_stats.total == 1
+
+
+def test_reschedule_cancels_the_old_row(db):
+    date = db.upcoming_dates()[1]
+    old_id, _ = write(db, book, date, "10:00", 1)
+    assert write(db, db.hold_slot, date, "16:00", "basic", 1)
+    new_id, _ = write(db, db.reschedule_appointment, old_id, date, "16:00", "basic", 1)
+
+    assert [(a.id, a.time) for a in db.get_user_appointments(1)] == [(new_id, "16:00")]
+    assert db.get_read_connection().execute(
+        "SELECT status FROM appointments WHERE id = ?", (old_id,)
+    ).fetchone()[0] == "cancelled"
+    assert db.booking_stats.total == 1
+
+
+class FakeQuery:
+    """CallbackQuery без сети: запоминает последний экран"""
+
+    def __init__(self, user_id):
+        self.from_user = SimpleNamespace(id=user_id, full_name=f"user{user_id}", first_name="x")
+        self.message = SimpleNamespace(chat_id=user_id, message_id=1)
+        self.inline_message_id = None
+        self.data = None
+        self.text = self.markup = None
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, text, reply_markup=None, parse_mode=None):
+        self.text, self.markup = text, reply_markup
+
+    def buttons(self, prefix):
+        return [
+            button.callback_data
+            for row in self.markup.inline_keyboard for button in row
+            if button.callback_data.startswith(prefix)
+        ]
+
+
+async def press(handler, query, data):
+    query.data = data
+    context = SimpleNamespace(
+        user_data={},
+        job_queue=SimpleNamespace(run_once=lambda *args, **kwargs: None),
+    )
+    await handler(SimpleNamespace(callback_query=query), context)
+
+
+def test_reschedule_id_travels_in_callback_data(db):
+    date = db.upcoming_dates()[1]
+    old_id, _ = write(db, book, date, "10:00", 1)
+    query = FakeQuery(1)
+
+    async def flow():
+        await press(db.reschedule_booking, query, f"resched_{old_id}")
+        await press(db.select_service, query, query.buttons(f"svc_{date}_")[0])
+        await press(db.select_time, query, query.buttons(f"time_{date}_16:00_")[0])
+        assert "старая запись освободится" in query.text
+        [confirm] = query.buttons("confirm_")
+        assert confirm == f"confirm_{date}_16:00_basic_r{old_id}"
+        await press(db.confirm_booking, query, confirm)
+
+        # Обычная запись после переноса остается обычной: флага, который мог устареть, нет
+        await press(db.select_service, query, f"svc_{date}_basic")
+        await press(db.select_time, query, f"time_{date}_12:00_basic")
+        assert "старая запись освободится" not in query.text
+        await press(db.confirm_booking, query, query.buttons("confirm_")[0])
+
+    asyncio.run(flow())
+
+    assert [a.time for a in db.get_user_appointments(1)] == ["12:00", "16:00"]
+    assert db.get_read_connection().execute(
+        "SELECT status FROM appointments WHERE id = ?", (old_id,)
+    ).fetchone()[0] == "cancelled"
+
+
+def test_split_reschedule():
+    assert bot.split_reschedule("2026-10-19_10:00_basic_r42") == ("2026-10-19_10:00_basic", 42)
+    assert bot.split_reschedule("2026-10-19_10:00_basic") == ("2026-10-19_10:00_basic", None)
+
+
+def test_booking_outside_the_schedule_is_rejected(db):
+    today = datetime.now()
+    open_date = db.upcoming_dates()[1]
+    for date, time in [
+        ((today - timedelta(days=2)).strftime("%Y-%m-%d"), "14:00"),
+        ((today + timedelta(days=400)).strftime("%Y-%m-%d"), "14:00"),
+        (open_date, "14:07"),
+    ]:
+        assert not write(db, db.hold_slot, date, time, "basic", 1)
+        assert write(db, db.book_appointment, date, time, "basic", 1, "user1") is None
+    assert db.booking_stats.total == 0
+    assert db.get_read_connection().execute("SELECT COUNT(*) FROM appointments").fetchone()[0] == 0
+
+
+def test_old_waitlist_button_for_a_past_date(db):
+    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+    assert db.availability.times(yesterday, "basic") == []
+    query = FakeQuery(1)
+
+    asyncio.run(press(db.select_service, query, f"svc_{yesterday}_basic"))
+
+    assert "закрыта" in query.text
+    assert query.buttons("time_") == [] and query.buttons("wait_") == []
+    assert query.buttons("date_")
@@ -0,0 +1,44 @@
+import csv
+import os
+
+import pytest
+
+import bot
+
+
+def book(date, time, user_id, service="basic"):
+    assert bot.hold_slot(date, time, service, user_id)
+    return bot.book_appointment(date, time, service, user_id, f"user{user_id}")
+
+
+def test_export_writes_every_booking(db):
+    date = db.upcoming_dates()[1]
+    for user_id, time in enumerate(("10:00", "12:00", "14:00"), 1):
+        db.db_write_executor.submit(book, date, time, user_id).result()
+
+    path, count = db.export_bookings("csv")
+    try:
+        with open(path, encoding="utf-8") as file:
+            header, *rows = list(csv.reader(file))
+    finally:
+        os.remove(path)
+
+    assert count == 3
+    assert header == list(db.EXPORT_COLUMNS)
+    assert [row[2] for row in rows] == ["10:00", "12:00", "14:00"]
+
+
+def test_failed_export_releases_the_read_snapshot(db, monkeypatch):
+    date = db.upcoming_dates()[1]
+    db.db_write_executor.submit(book, date, "10:00", 1).result()
+
+    def broken(code):
+        raise OSError("диск кончился")
+
+    monkeypatch.setattr(db, "get_service_info", broken)
+    with pytest.raises(OSError) as failure:
+        db.export_bookings("csv")
+
+    # traceback еще держит кадры выгрузки, а читатель уже вне транзакции
+    assert failure.traceback
+    assert not db.get_read_connection().in_transaction
@@ -0,0 +1,28 @@
+import asyncio
+import logging
+
+import bot
+
+
+def test_db_helpers_log_with_the_update_context(db):
+    records = []
+
+    def helper():
+        record = logging.LogRecord("bot", logging.ERROR, __file__, 0, "Ошибка", None, None)
+        bot.LogContextFilter().filter(record)
+        records.append(record)
+
+    async def handle():
+        token = bot.log_context.set((42, 7, "^confirm_"))
+        try:
+            await db.run_db_write(helper)
+            await db.run_db_read(helper)
+        finally:
+            bot.log_context.reset(token)
+        await db.run_db_read(helper)
+
+    asyncio.run(handle())
+
+    assert [(r.update_id, r.user_id, r.handler) for r in records] == [
+        (42, 7, "^confirm_"), (42, 7, "^confirm_"), (None, None, None),
+    ]
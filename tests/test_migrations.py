@@ -0,0 +1,93 @@
+import sqlite3
+
+import bot
+
+# Схема и расписание до миграций: одно место на время, слоты каждые два часа
+LEGACY_SCHEMA = '''
+    CREATE TABLE appointments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL,
+        time TEXT NOT NULL,
+        service_type TEXT NOT NULL,
+        user_id INTEGER,
+        user_name TEXT,
+        user_phone TEXT,
+        status TEXT DEFAULT 'free',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(date, time)
+    )
+'''
+LEGACY_ROWS = [
+    ("10:00", "basic", "booked"),
+    ("12:00", "express", "booked"),
+    ("14:00", "vip", "booked"),
+    ("16:00", "avatar", "booked"),
+    ("18:00", "pro", "booked"),
+    ("20:00", "vip", "booked"),
+]
+
+
+def legacy_database(path):
+    conn = sqlite3.connect(path)
+    conn.execute(LEGACY_SCHEMA)
+    conn.executemany(
+        "INSERT INTO appointments (date, time, service_type, user_id, status) VALUES (?, ?, ?, ?, ?)",
+        [("2030-01-01", time, service, 7, status) for time, service, status in LEGACY_ROWS]
+        + [("2030-01-02", "10:00", "deep", None, "free")]
+    )
+    conn.commit()
+    return conn
+
+
+def bookings(conn):
+    return conn.execute('''
+        SELECT time, service_type, resource_id, duration FROM appointments
+        WHERE date = '2030-01-01' ORDER BY time
+    ''').fetchall()
+
+
+def assert_matches_catalog(conn):
+    resources = {
+        resource_id: services.split(",")
+        for resource_id, services in conn.execute("SELECT id, services FROM resources")
+    }
+    rows = bookings(conn)
+    assert len(rows) == 6
+    for time, service, resource_id, duration in rows:
+        assert service in resources[resource_id], (time, service, resource_id)
+        assert duration == bot.SERVICES[service].minutes, (time, service, duration)
+
+
+def test_legacy_bookings_get_matching_specialist_and_duration(tmp_path):
+    conn = legacy_database(tmp_path / "legacy.db")
+    bot.migrate_database(conn)
+
+    assert_matches_catalog(conn)
+    # vip в 14:00 - у Мастера Скиллз, в 20:00 он уже не принимает - у Аватар-Дока
+    assert dict(((time, service), resource) for time, service, resource, _ in bookings(conn)) == {
+        ("10:00", "basic"): 1, ("12:00", "express"): 2, ("14:00", "vip"): 3,
+        ("16:00", "avatar"): 4, ("18:00", "pro"): 3, ("20:00", "vip"): 4,
+    }
+    assert conn.execute("SELECT COUNT(*) FROM appointments WHERE status = 'free'").fetchone()[0] == 0
+
+
+def test_repairs_database_migrated_before_the_fix(tmp_path, monkeypatch):
+    conn = legacy_database(tmp_path / "legacy.db")
+    monkeypatch.setattr(bot, "MIGRATIONS", bot.MIGRATIONS[:10])
+    bot.migrate_database(conn)
+    # Так их оставляли миграции 3 и 4 до исправления
+    conn.execute("UPDATE appointments SET resource_id = 1, duration = 120")
+    conn.execute('''
+        INSERT INTO appointments_archive (id, date, time, service_type, user_id, resource_id, duration)
+        SELECT id, '2029-12-31', time, service_type, user_id, 1, 120 FROM appointments
+    ''')
+    conn.commit()
+    monkeypatch.undo()
+
+    bot.migrate_database(conn)
+
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(bot.MIGRATIONS)
+    assert_matches_catalog(conn)
+    assert conn.execute('''
+        SELECT COUNT(*) FROM appointments_archive WHERE resource_id = 1 AND service_type NOT IN ('basic', 'deep')
+    ''').fetchone()[0] == 0
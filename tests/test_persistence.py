@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+
+def test_changes_marked_during_a_flush_are_written(db, monkeypatch):
+    save = db.save_persistence
+
+    def slow_save(rows, deleted):
+        time.sleep(0.1)
+        save(rows, deleted)
+
+    monkeypatch.setattr(db, "save_persistence", slow_save)
+
+    async def run():
+        persistence = db.SQLitePersistence()
+        await persistence.update_user_data(1, {"step": 1})
+        await asyncio.sleep(0.05)           # Первая запись еще идет
+        await persistence.update_user_data(2, {"step": 2})
+        await persistence.update_user_data(1, {"step": 3})
+        for _ in range(100):
+            if persistence._flush_task is None:
+                break
+            await asyncio.sleep(0.02)
+        return await db.SQLitePersistence().get_user_data()
+
+    assert asyncio.run(run()) == {1: {"step": 3}, 2: {"step": 2}}
+
+
+def test_unchanged_data_is_not_rewritten(db, monkeypatch):
+    saved = []
+    save = db.save_persistence
+
+    def counting_save(rows, deleted):
+        saved.append(len(rows))
+        save(rows, deleted)
+
+    monkeypatch.setattr(db, "save_persistence", counting_save)
+
+    async def run():
+        persistence = db.SQLitePersistence()
+        for step in (1, 1, 2):
+            await persistence.update_user_data(1, {"step": step})
+            await persistence.flush()
+
+    asyncio.run(run())
+    assert saved == [1, 1]
@@ -0,0 +1,173 @@
+import re
+
+import pytest
+
+
+def captured_plans(bot, func, *args, **kwargs):
+    """Выполнить функцию базы и вернуть {SQL: план} для всех ее SELECT
+
+    Запросы ловятся trace-колбэком с уже подставленными параметрами,
+    так что проверяется ровно то, что выполняет бот.
+    """
+    statements = []
+    connections = (bot.get_read_connection(), bot.get_write_connection())
+    for conn in connections:
+        conn.set_trace_callback(statements.append)
+    try:
+        func(*args, **kwargs)
+    finally:
+        for conn in connections:
+            conn.set_trace_callback(None)
+
+    conn = bot.get_read_connection()
+    plans = {}
+    for sql in statements:
+        if sql.lstrip().upper().startswith("SELECT"):
+            rows = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+            plans[sql] = [row[-1] for row in rows]
+    assert plans, "функция не выполнила ни одного SELECT"
+    return plans
+
+
+def seed(bot, rows=3000):
+    """Прошлые и будущие записи нескольких пользователей и услуг + ANALYZE"""
+    services = list(bot.SERVICES)
+    today = bot.datetime.now()
+    data = []
+    for i in range(rows):
+        day = (today + bot.timedelta(days=i // 40 - 50)).strftime("%Y-%m-%d")
+        time_str = bot.format_minutes(600 + (i % 10) * 60)
+        data.append((day, time_str, services[i % len(services)], i % 300, 'booked', 1 + (i // 10) % 4))
+    conn = bot.get_write_connection()
+    with conn:
+        conn.executemany('''
+            INSERT INTO appointments (date, time, service_type, user_id, status, resource_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', data)
+    conn.execute("ANALYZE")
+
+
+@pytest.fixture(params=["empty", "analyzed"])
+def planned_db(request, db):
+    """Планы проверяются и без статистики, и после ANALYZE (как после ночного PRAGMA optimize)"""
+    if request.param == "analyzed":
+        seed(db)
+    return db
+
+
+def single_plan(plans, table="appointments"):
+    """План единственного запроса к таблице"""
+    matching = [plan for sql, plan in plans.items() if f"FROM {table} " in " ".join(sql.split())]
+    assert len(matching) == 1, plans
+    return matching[0]
+
+
+def assert_index(plan, index):
+    assert any(re.search(rf"INDEX {re.escape(index)}\b", line) for line in plan), plan
+
+
+def assert_no_sort(plan):
+    assert not any("TEMP B-TREE" in line for line in plan), plan
+
+
+def test_user_appointments_use_user_index(planned_db):
+    plan = single_plan(captured_plans(planned_db, planned_db.get_user_appointments, 42))
+    assert_index(plan, "idx_appointments_user")
+    assert_no_sort(plan)
+
+
+def test_booking_stats_read_only_the_status_index(planned_db):
+    plan = single_plan(captured_plans(planned_db, planned_db.load_booking_stats))
+    # Агрегат по индексу без чтения таблицы; сортируются только группы (дата, услуга)
+    assert any("COVERING INDEX idx_appointments_status_date" in line for line in plan), plan
+    assert not any(line.startswith("SCAN appointments") for line in plan), plan
+
+
+def test_hold_lookups_search_by_status(planned_db):
+    """Бронь и ее снятие не проходят всю таблицу, даже когда в ней одни 'booked'"""
+    planned_db.load_availability()
+    date = planned_db.upcoming_dates()[1]
+    time_str = planned_db.availability.times(date, "basic")[0][0]
+    plans = captured_plans(planned_db, planned_db.hold_slot, date, time_str, "basic", 7)
+    plans.update(captured_plans(planned_db, planned_db.release_hold, date, time_str, 7))
+    held = [plan for sql, plan in plans.items() if "status = 'held'" in sql]
+    assert len(held) == 2, plans
+    for plan in held:
+        assert_index(plan, "idx_appointments_status_date")
+        assert not any(line.startswith("SCAN") for line in plan), plan
+
+
+def test_pending_reminders_search_by_status_and_date(planned_db):
+    plan = single_plan(captured_plans(planned_db, planned_db.get_pending_reminders))
+    assert_index(plan, "idx_appointments_status_date")
+    assert "(status=? AND date>?)" in plan[0], plan
+
+
+def test_availability_loads_only_upcoming_rows(planned_db):
+    plan = single_plan(captured_plans(planned_db, planned_db.load_availability))
+    assert_index(plan, "idx_appointments_status_date")
+    assert "(status=? AND date>?)" in plan[0], plan
+
+
+@pytest.mark.parametrize("bookings_filter, index, constraint", [
+    ({}, "idx_appointments_booked", None),
+    ({'dates': 'upcoming'}, "idx_appointments_booked", "date>?"),
+    ({'dates': 'past'}, "idx_appointments_booked", "date<?"),
+    ({'service': 'vip'}, "idx_appointments_booked_service", "service_type=?"),
+    ({'service': 'vip', 'dates': 'week'}, "idx_appointments_booked_service", "service_type=?"),
+    ({'user_id': 7}, "idx_appointments_user", "user_id=?"),
+])
+@pytest.mark.parametrize("backward", [False, True])
+def test_bookings_page_walks_an_index_without_sorting(planned_db, bookings_filter, index, constraint, backward):
+    for cursor in (None, ("2030-01-01", "10:00", 5)):
+        plan = single_plan(captured_plans(planned_db, planned_db.get_bookings_page, bookings_filter, cursor, backward))
+        assert_index(plan, index)
+        if constraint:
+            assert constraint in plan[0], plan
+        assert_no_sort(plan)
+
+
+def vm_steps(bot, func, *args, **kwargs):
+    """Сколько инструкций SQLite выполнил читатель за вызов - мера прочитанных строк"""
+    steps = 0
+
+    def count():
+        nonlocal steps
+        steps += 1
+        return 0
+
+    conn = bot.get_read_connection()
+    conn.set_progress_handler(count, 1)
+    try:
+        func(*args, **kwargs)
+    finally:
+        conn.set_progress_handler(None, 1)
+    return steps
+
+
+@pytest.mark.parametrize("bookings_filter, backward", [
+    ({'dates': 'past'}, True),
+    ({'dates': 'upcoming'}, False),
+])
+def test_bookings_page_from_a_cursor_far_from_the_date_bound(db, bookings_filter, backward):
+    """Страница вдали от границы фильтра по дате стоит как у самой границы"""
+    seed(db)
+    rows, _ = db.get_bookings_page(bookings_filter, limit=10000)
+    keys = [(row.date, row.time, row.id) for row in rows]
+    near, far = (keys[-1], keys[20]) if backward else (keys[0], keys[-20])
+
+    page = db.get_bookings_page(bookings_filter, far, backward)[0]
+    expected = keys[:20][-db.BOOKINGS_PAGE_SIZE:] if backward else keys[-19:][:db.BOOKINGS_PAGE_SIZE]
+    assert [(row.date, row.time, row.id) for row in page] == expected
+
+    near_steps = vm_steps(db, db.get_bookings_page, bookings_filter, near, backward)
+    far_steps = vm_steps(db, db.get_bookings_page, bookings_filter, far, backward)
+    assert far_steps < near_steps * 2, (near_steps, far_steps)
+
+
+def test_export_scans_in_rowid_order_without_sorting(planned_db):
+    plans = captured_plans(planned_db, lambda: list(planned_db.iter_bookings()))
+    for table in ("appointments", "appointments_archive"):
+        plan = single_plan(plans, table)
+        assert "SCAN a" in plan, plan
+        assert_no_sort(plan)
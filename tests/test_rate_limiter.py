@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+import pytest
+from telegram.error import RetryAfter
+
+import bot
+from fake_bot_api import running_api
+
+GLOBAL_RATE = 100           # Поднят, чтобы тест шел секунды, а не десятки секунд
+
+
+@pytest.fixture(autouse=True)
+def fast_limits(monkeypatch):
+    monkeypatch.setattr(bot, "TELEGRAM_GLOBAL_RATE", GLOBAL_RATE)
+
+
+def test_fake_api_enforces_limits():
+    """Без лимитера быстрые сообщения в один чат получают 429"""
+    async def run():
+        api, client = await running_api(limited=False)
+        try:
+            with pytest.raises(RetryAfter):
+                for _ in range(10):
+                    await client.send_message(7, "spam")
+        finally:
+            await client.shutdown()
+            await api.stop()
+        return api
+
+    api = asyncio.run(run())
+    assert api.rejected == 1
+
+
+def test_bulk_and_interactive_lanes_stay_within_limits():
+    bulk_chats = range(1000, 1000 + 2 * GLOBAL_RATE)
+    interactive_chats = range(10, 50)
+
+    async def run():
+        api, client = await running_api()
+        try:
+            started = time.monotonic()
+            bulk = [
+                asyncio.create_task(client.send_message(chat, "slot", rate_limit_args=bot.BULK))
+                for chat in bulk_chats
+            ]
+            same_chat = [asyncio.create_task(client.send_message(7, f"#{n}")) for n in range(5)]
+            await asyncio.sleep(0.3)
+
+            clicked = time.monotonic()
+            await asyncio.gather(*[
+                client.edit_message_text("screen", chat_id=chat, message_id=1) for chat in interactive_chats
+            ])
+            interactive = time.monotonic() - clicked
+
+            await asyncio.gather(*bulk, *same_chat)
+            return api, interactive, time.monotonic() - started
+        finally:
+            await client.shutdown()
+            await api.stop()
+
+    api, interactive, elapsed = asyncio.run(run())
+
+    assert api.rejected == 0
+    assert len(api.delivered()) == len(bulk_chats) + len(interactive_chats) + 5
+    # Нажатия обгоняют рассылку, которая еще идет: им достается весь общий лимит
+    assert interactive < len(interactive_chats) / GLOBAL_RATE + 0.15
+    assert elapsed < len(bulk_chats) / GLOBAL_RATE + 1
+    # Один чат: запас из трех сообщений, дальше одно в секунду
+    stamps = api.delivered(7)
+    assert [round(b - a) for a, b in zip(stamps[2:], stamps[3:])] == [1, 1]
+
+
+def test_retry_after_pauses_and_retries():
+    async def run():
+        api, client = await running_api()
+        api.throttle_next = 1
+        try:
+            started = time.monotonic()
+            await asyncio.gather(*[client.send_message(chat, "hi") for chat in range(30)])
+            return api, time.monotonic() - started
+        finally:
+            await client.shutdown()
+            await api.stop()
+
+    api, elapsed = asyncio.run(run())
+
+    assert api.rejected == 1
+    assert len(api.delivered()) == 30
+    assert 1 <= elapsed < 3
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import bot
+
+
+def stages(starts_in, sent=0):
+    """Этапы, которые встанут в очередь для записи, начинающейся через starts_in"""
+    start = datetime.now() + starts_in
+    entries = bot.ReminderQueue._entries(1, start.strftime("%Y-%m-%d"), start.strftime("%H:%M"), sent)
+    return [stage for _, _, stage in entries]
+
+
+@pytest.mark.parametrize("starts_in, expected", [
+    (timedelta(days=2), [0, 1]),
+    (timedelta(hours=23, minutes=55), [0, 1]),      # «Уже завтра» опоздало на минуты - еще уместно
+    (timedelta(hours=3), [1]),                      # Записались в тот же день: только «Через час»
+    (timedelta(minutes=50), [1]),
+    (timedelta(minutes=30), []),                    # «Через час» за полчаса до начала уже неправда
+    (-timedelta(hours=1), []),
+])
+def test_overdue_stages_are_dropped(starts_in, expected):
+    assert stages(starts_in) == expected
+
+
+def test_sent_stages_are_not_repeated():
+    assert stages(timedelta(days=2), sent=1) == [1]
+    assert stages(timedelta(days=2), sent=2) == []
+
+
+def test_queue_after_downtime_keeps_only_what_is_still_true():
+    queue = bot.ReminderQueue()
+    soon = datetime.now() + timedelta(hours=5)
+    later = datetime.now() + timedelta(days=3)
+    queue.load([
+        (1, soon.strftime("%Y-%m-%d"), soon.strftime("%H:%M"), 0),
+        (2, later.strftime("%Y-%m-%d"), later.strftime("%H:%M"), 0),
+    ])
+    assert sorted((appointment_id, stage) for _, appointment_id, stage in queue._heap) == [(1, 1), (2, 0), (2, 1)]
+    assert queue.pop_due(10) == []
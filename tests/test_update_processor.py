@@ -0,0 +1,113 @@
+import asyncio
+import collections
+import random
+import time
+import types
+
+from telegram import Update
+
+import bot
+
+
+def make_update(update_id, chat_id):
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "x"},
+            "text": "hi",
+        },
+    }, None)
+
+
+class Recorder:
+    """Обработчик-заглушка: порядок по чатам, одновременность и время завершения"""
+
+    def __init__(self):
+        self.order = collections.defaultdict(list)
+        self.finished = {}
+        self.running = 0
+        self.max_running = 0
+
+    async def handle(self, update, duration):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            self.running -= 1
+        self.order[update.effective_chat.id].append(update.update_id)
+        self.finished[update.update_id] = time.perf_counter()
+
+
+async def feed(processor, recorder, updates):
+    """Как Application: задача на каждое обновление в порядке поступления"""
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        asyncio.create_task(processor.process_update(update, recorder.handle(update, duration)))
+        for update, duration in updates
+    ))
+    return started
+
+
+def test_stress_keeps_per_chat_order_and_throughput():
+    """200 чатов по 25 обновлений: порядок в каждом чате, лимит и параллельность между чатами"""
+    random.seed(7)
+    chats, per_chat, limit = 200, 25, 64
+    updates = [
+        (make_update(seq * chats + chat, chat), random.uniform(0.001, 0.005))
+        for seq in range(per_chat)
+        for chat in range(chats)
+    ]
+    processor = bot.ChatOrderedUpdateProcessor(limit)
+    recorder = Recorder()
+
+    started = asyncio.run(feed(processor, recorder, updates))
+    elapsed = time.perf_counter() - started
+
+    for chat in range(chats):
+        assert recorder.order[chat] == [seq * chats + chat for seq in range(per_chat)]
+    assert recorder.max_running == limit
+    serial = sum(duration for _, duration in updates)
+    # По очереди это ~15 с; чаты идут параллельно, упор только в лимит
+    assert elapsed < serial / 10, (elapsed, serial)
+    assert not processor._chat_locks
+
+
+def test_busy_chat_does_not_block_other_chats():
+    """Очередь одного чата не занимает общие слоты: другой чат проходит сразу"""
+    limit = 8
+    busy = [(make_update(i, 1), 0.1) for i in range(20)]
+    other = make_update(100, 2)
+    processor = bot.ChatOrderedUpdateProcessor(limit)
+    recorder = Recorder()
+
+    started = asyncio.run(feed(processor, recorder, busy + [(other, 0.001)]))
+
+    assert recorder.order[1] == list(range(20))
+    assert recorder.max_running <= 2
+    assert recorder.finished[100] - started < 0.1
+
+
+def test_backlog_counts_updates_waiting_for_their_chat_or_a_slot():
+    limit = 2
+    processor = bot.ChatOrderedUpdateProcessor(limit)
+    application = types.SimpleNamespace(update_queue=asyncio.Queue(), update_processor=processor)
+    recorder = Recorder()
+    # Чат 1: пять подряд, чаты 2-4 по одному - работают двое, остальные ждут
+    updates = [(make_update(i, 1), 0.2) for i in range(5)] + [(make_update(10 + c, c), 0.2) for c in (2, 3, 4)]
+
+    async def run():
+        tasks = [asyncio.create_task(processor.process_update(u, recorder.handle(u, d))) for u, d in updates]
+        await asyncio.sleep(0.05)
+        during = bot.update_backlog(application), recorder.running
+        await asyncio.gather(*tasks)
+        return during, bot.update_backlog(application)
+
+    (backlog, running), after = asyncio.run(run())
+
+    assert running == limit
+    assert backlog == len(updates) - limit
+    assert after == 0
@@ -0,0 +1,96 @@
+import asyncio
+import collections
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+from fake_bot_api import running_api
+
+SUBSCRIBERS = 500
+GLOBAL_RATE = 300           # Настоящие 30/с растянули бы тест; 10k подписчиков - benchmarks/waitlist_fanout.py
+
+
+@pytest.fixture(autouse=True)
+def fast_limits(monkeypatch):
+    monkeypatch.setattr(bot, "TELEGRAM_GLOBAL_RATE", GLOBAL_RATE)
+
+
+def subscribe(db, count, date, service="basic"):
+    conn = db.get_write_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO waitlist (user_id, chat_id, date, service_type) VALUES (?, ?, ?, ?)",
+            [(chat_id, chat_id, date, service) for chat_id in range(10**6, 10**6 + count)]
+        )
+
+
+def pending(db):
+    return db.get_read_connection().execute(
+        "SELECT COUNT(*) FROM waitlist WHERE notified_at IS NULL"
+    ).fetchone()[0]
+
+
+def fan_out(db, kill_after=None, passes=5, **api_kwargs):
+    """Прогнать waitlist_job (при kill_after - оборвать первый проход): FakeBotAPI"""
+    async def run():
+        api, client = await running_api(**api_kwargs)
+        context = SimpleNamespace(bot=client)
+        try:
+            if kill_after is not None:
+                job = asyncio.create_task(db.waitlist_job(context))
+                await asyncio.sleep(kill_after)
+                job.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await job
+                api.killed_at = len(api.delivered())
+            for _ in range(passes):
+                await db.waitlist_job(context)
+                if not pending(db):
+                    break
+            return api
+        finally:
+            await client.shutdown()
+            await api.stop()
+    return asyncio.run(run())
+
+
+def test_fan_out_reaches_every_subscriber_once(db):
+    date = db.upcoming_dates()[1]
+    subscribe(db, SUBSCRIBERS, date)
+
+    api = fan_out(db, failure_rate=0.01, blocked={10**6 + 1, 10**6 + 2})
+
+    received = collections.Counter(chat_id for _, _, chat_id in api.sent)
+    assert len(received) == SUBSCRIBERS - 2
+    assert max(received.values()) == 1
+    assert api.rejected == 0
+    assert pending(db) == 0
+
+
+def test_restart_mid_fan_out_sends_no_duplicates(db):
+    date = db.upcoming_dates()[1]
+    subscribe(db, SUBSCRIBERS, date)
+
+    api = fan_out(db, kill_after=0.3)
+
+    received = collections.Counter(chat_id for _, _, chat_id in api.sent)
+    assert 0 < api.killed_at < SUBSCRIBERS
+    assert max(received.values()) == 1
+    # Обрывается только пачка в полете: уведомление уходит не больше одного раза
+    assert len(received) >= SUBSCRIBERS - db.WAITLIST_BATCH
+    assert pending(db) == 0
+
+
+def test_fan_out_stops_when_the_date_is_full(db):
+    date = db.upcoming_dates()[1]
+    subscribe(db, SUBSCRIBERS, date)
+    # Все специалисты заняты на весь день
+    for (resource_id,) in db.get_read_connection().execute("SELECT id FROM resources"):
+        db.availability.reserve(resource_id, date, 0, 24 * 60)
+    assert not db.availability.times(date, "basic")
+
+    api = fan_out(db, passes=1)
+
+    assert api.sent == []
+    assert pending(db) == SUBSCRIBERS
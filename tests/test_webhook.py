@@ -0,0 +1,49 @@
+import asyncio
+import types
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import bot
+
+FORGED_UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 555, "type": "private"},
+        "from": {"id": bot.ADMIN_IDS[0], "is_bot": False, "first_name": "x"},
+        "text": "/export csv",
+    },
+}
+
+
+def post_update(headers=None):
+    """POST обновления на WEBHOOK_PATH: (HTTP-статус, сколько обновлений попало в очередь)"""
+    async def run():
+        application = types.SimpleNamespace(update_queue=asyncio.Queue(), bot=None)
+        async with TestClient(TestServer(bot.build_web_app(application))) as client:
+            response = await client.post(bot.WEBHOOK_PATH, json=FORGED_UPDATE, headers=headers or {})
+            return response.status, application.update_queue.qsize()
+    return asyncio.run(run())
+
+
+def test_secret_is_generated_when_not_configured():
+    assert bot.WEBHOOK_SECRET
+
+
+def test_no_webhook_route_in_polling_mode(monkeypatch):
+    monkeypatch.setattr(bot, "WEBHOOK_URL", None)
+    status, queued = post_update({"X-Telegram-Bot-Api-Secret-Token": bot.WEBHOOK_SECRET})
+    assert status == 404
+    assert queued == 0
+
+
+def test_webhook_rejects_missing_or_wrong_secret(monkeypatch):
+    monkeypatch.setattr(bot, "WEBHOOK_URL", "https://example.com")
+    for headers in ({}, {"X-Telegram-Bot-Api-Secret-Token": "guess"}):
+        assert post_update(headers) == (403, 0)
+
+
+def test_webhook_accepts_telegram_secret(monkeypatch):
+    monkeypatch.setattr(bot, "WEBHOOK_URL", "https://example.com")
+    assert post_update({"X-Telegram-Bot-Api-Secret-Token": bot.WEBHOOK_SECRET}) == (200, 1)